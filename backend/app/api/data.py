@@ -1,49 +1,59 @@
-from fastapi import APIRouter, Query, HTTPException
-from typing import Optional, List
-from datetime import datetime
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import Response
+from typing import Any, Dict, Optional, List
 import pandas as pd
 from app.services.data_service import data_service
 from app.models.data_models import DataFilter, DataResponse, ErrorResponse
+from app.services.dataset_registry import DatasetNotFoundError
+from app.services.serializers import ARROW_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, to_arrow_ipc, to_columnar_json
+from app.services.metrics import StageTimer
+from app.api.dependencies import DateRange, date_range, resolve_dataset, run_in_pool
 
 router = APIRouter()
 
+def _response_format(format: Optional[str], accept: Optional[str]) -> str:
+    """Formato della risposta: parametro format oppure header Accept (default: record JSON)"""
+    if format:
+        return format
+    if accept and ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    return "json"
+
+def _encode_page(data_filter: DataFilter, file_id: Optional[str], response_format: str) -> bytes:
+    """Pagina serializzata in formato colonnare o Arrow, senza passare dai record"""
+    timer = StageTimer("data")
+    page_data, meta = data_service.get_data_page(data_filter, file_id, timer)
+    with timer.stage("serialize"):
+        if response_format == "arrow":
+            content = to_arrow_ipc(page_data, meta)
+        else:
+            content = to_columnar_json(page_data, meta)
+    timer.finish()
+    return content
+
 @router.get("/data", response_model=DataResponse)
 async def get_data(
+    request: Request,
     search: Optional[str] = Query(None, description="Ricerca globale su tutti i campi"),
-    date_from: Optional[str] = Query(None, description="Data inizio (YYYY-MM-DD)"),
-    date_to: Optional[str] = Query(None, description="Data fine (YYYY-MM-DD)"),
+    dates: DateRange = Depends(date_range),
+    date_column: Optional[str] = Query(None, description="Colonna data a cui applicare l'intervallo (default: la prima)"),
     columns: Optional[str] = Query(None, description="Colonne specifiche separate da virgola"),
+    search_columns_only: bool = Query(False, description="Cerca solo nelle colonne indicate in columns"),
+    running_balance: bool = Query(False, description="Aggiunge la colonna saldo_progressivo (in ordine di data)"),
+    balance_column: Optional[str] = Query(None, description="Colonna importo del saldo progressivo (default: la prima)"),
     page: int = Query(1, ge=1, description="Numero pagina"),
     page_size: int = Query(100, ge=1, le=1000, description="Dimensione pagina"),
     sort_by: Optional[str] = Query(None, description="Colonna per ordinamento"),
-    sort_order: str = Query("asc", regex="^(asc|desc)$", description="Ordine ordinamento")
+    sort_order: str = Query("asc", regex="^(asc|desc)$", description="Ordine ordinamento"),
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)"),
+    format: Optional[str] = Query(None, regex="^(json|columnar|arrow)$", description="Formato risposta: json (record), columnar, arrow (IPC stream)")
 ):
     """
-    Recupera i dati con filtri applicati e paginazione
+    Recupera i dati con filtri applicati e paginazione.
+    Il formato si sceglie con il parametro format o con l'header
+    Accept: application/vnd.apache.arrow.stream
     """
     try:
-        # Parsing date
-        parsed_date_from = None
-        parsed_date_to = None
-        
-        if date_from:
-            try:
-                parsed_date_from = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_from. Usa YYYY-MM-DD"
-                )
-        
-        if date_to:
-            try:
-                parsed_date_to = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_to. Usa YYYY-MM-DD"
-                )
-        
         # Parsing colonne
         parsed_columns = None
         if columns:
@@ -52,17 +62,38 @@ async def get_data(
         # Creazione filtro
         data_filter = DataFilter(
             search=search,
-            date_from=parsed_date_from,
-            date_to=parsed_date_to,
+            date_from=dates[0],
+            date_to=dates[1],
+            date_column=date_column,
             columns=parsed_columns,
+            search_columns_only=search_columns_only,
+            running_balance=running_balance,
+            balance_column=balance_column,
             page=page,
             page_size=page_size,
             sort_by=sort_by,
             sort_order=sort_order
         )
         
+        # Formati colonnare e Arrow: serializzazione diretta dal dataframe della pagina
+        response_format = _response_format(format, request.headers.get("accept"))
+        if response_format != "json":
+            try:
+                content = await run_in_pool("data", _encode_page, data_filter, file_id, response_format)
+            except DatasetNotFoundError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            except (ValueError, KeyError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            media_type = ARROW_MEDIA_TYPE if response_format == "arrow" else COLUMNAR_MEDIA_TYPE
+            return Response(content=content, media_type=media_type)
+        
         # Recupero dati
-        result = data_service.get_data(data_filter)
+        try:
+            result = await run_in_pool("data", data_service.get_data, data_filter, file_id)
+        except DatasetNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         if "error" in result:
             raise HTTPException(
@@ -80,56 +111,72 @@ async def get_data(
             detail=f"Errore interno del server: {str(e)}"
         )
 
+def _compute_stats(file_id: Optional[str]) -> Dict[str, Any]:
+    """Statistiche per colonna, lette dal profilo del dataset"""
+    return data_service.get_data_stats(resolve_dataset(file_id).file_id)
+
 @router.get("/data/stats")
-async def get_data_stats():
+async def get_data_stats(
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)")
+):
     """
     Recupera statistiche sui dati caricati
     """
     try:
-        if data_service.current_data is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Nessun file caricato"
-            )
-        
-        df = data_service.current_data
+        return await run_in_pool("stats", _compute_stats, file_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore interno del server: {str(e)}"
+        )
+
+@router.get("/data/aggregate")
+async def get_data_aggregate(
+    group_by: str = Query(..., description="Chiavi separate da virgola: colonna oppure periodo:colonna_data (day, week, month, year)"),
+    measures: Optional[str] = Query(None, description="Misure separate da virgola: count oppure sum|count|mean:colonna (default: count)"),
+    split_sign: bool = Query(False, description="Ripete le misure separando entrate (positivi) e uscite (negativi)"),
+    search: Optional[str] = Query(None, description="Ricerca globale su tutti i campi"),
+    dates: DateRange = Depends(date_range),
+    date_column: Optional[str] = Query(None, description="Colonna data a cui applicare l'intervallo (default: la prima)"),
+    columns: Optional[str] = Query(None, description="Colonne in cui cercare, con search_columns_only"),
+    search_columns_only: bool = Query(False, description="Cerca solo nelle colonne indicate in columns"),
+    sort_by: Optional[str] = Query(None, description="Chiave o misura per ordinare i gruppi"),
+    sort_order: str = Query("asc", regex="^(asc|desc)$", description="Ordine ordinamento"),
+    limit: Optional[int] = Query(None, ge=1, description="Numero massimo di gruppi restituiti"),
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)")
+):
+    """
+    Aggrega i dati filtrati per periodo e/o colonne di testo
+    (es. group_by=month:Data_Operazione,Descrizione&measures=sum:Importo)
+    """
+    try:
+        parsed_columns = None
+        if columns:
+            parsed_columns = [col.strip() for col in columns.split(',') if col.strip()]
         
-        # Statistiche base
-        stats = {
-            "total_rows": len(df),
-            "total_columns": len(df.columns),
-            "memory_usage_mb": round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2),
-            "columns_info": {}
-        }
+        data_filter = DataFilter(
+            search=search,
+            date_from=dates[0],
+            date_to=dates[1],
+            date_column=date_column,
+            columns=parsed_columns,
+            search_columns_only=search_columns_only
+        )
         
-        # Informazioni per colonna
-        for col in df.columns:
-            col_data = df[col]
-            col_stats = {
-                "type": str(col_data.dtype),
-                "null_count": int(col_data.isnull().sum()),
-                "null_percentage": round((col_data.isnull().sum() / len(df)) * 100, 2),
-                "unique_count": int(col_data.nunique()),
-                "unique_percentage": round((col_data.nunique() / len(df)) * 100, 2)
-            }
-            
-            # Statistiche specifiche per tipo
-            if pd.api.types.is_numeric_dtype(col_data):
-                col_stats.update({
-                    "min": float(col_data.min()) if not col_data.empty else None,
-                    "max": float(col_data.max()) if not col_data.empty else None,
-                    "mean": float(col_data.mean()) if not col_data.empty else None,
-                    "median": float(col_data.median()) if not col_data.empty else None
-                })
-            elif pd.api.types.is_datetime64_any_dtype(col_data):
-                col_stats.update({
-                    "min_date": col_data.min().isoformat() if not col_data.empty else None,
-                    "max_date": col_data.max().isoformat() if not col_data.empty else None
-                })
-            
-            stats["columns_info"][col] = col_stats
+        parsed_group_by = [key.strip() for key in group_by.split(',') if key.strip()]
+        parsed_measures = [m.strip() for m in measures.split(',') if m.strip()] if measures else []
         
-        return stats
+        try:
+            return await run_in_pool(
+                "aggregate", data_service.aggregate_data, data_filter, parsed_group_by, parsed_measures,
+                split_sign, sort_by, sort_order, limit, file_id
+            )
+        except DatasetNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
     except HTTPException:
         raise
@@ -138,3 +185,39 @@ async def get_data_stats():
             status_code=500,
             detail=f"Errore interno del server: {str(e)}"
         )
+
+@router.get("/data/balance")
+async def get_data_balance(
+    dates: DateRange = Depends(date_range),
+    date_column: Optional[str] = Query(None, description="Colonna data (default: la prima)"),
+    amount_column: Optional[str] = Query(None, description="Colonna importo (default: la prima)"),
+    opening_balance: float = Query(0.0, description="Saldo iniziale prima del primo movimento"),
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)")
+):
+    """
+    Saldo alla data e totali di entrate/uscite in un intervallo di date
+    (date_to è inclusa; da sola dà il saldo a quella data)
+    """
+    try:
+        return await run_in_pool(
+            "stats", data_service.get_balance, dates[0], dates[1],
+            date_column, amount_column, opening_balance, file_id
+        )
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore interno del server: {str(e)}"
+        )
+
+@router.get("/data/cache")
+async def get_cache_stats():
+    """
+    Recupera le statistiche della cache dei risultati filtrati
+    """
+    return data_service.result_cache.stats()
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException
+from app.services.data_service import data_service
+from app.services.dataset_registry import DatasetNotFoundError
+from app.api.dependencies import resolve_dataset, run_in_pool
+
+router = APIRouter()
+
+@router.get("/datasets")
+async def list_datasets():
+    """
+    Elenca i dataset caricati con la memoria occupata da ciascuno
+    """
+    try:
+        return await run_in_pool("datasets", data_service.get_datasets)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore interno del server: {str(e)}"
+        )
+
+@router.get("/datasets/{file_id}")
+async def get_dataset_info(file_id: str):
+    """
+    Recupera i metadati di un dataset, riaprendolo dallo snapshot se necessario
+    """
+    dataset = await run_in_pool("datasets", resolve_dataset, file_id)
+    return {
+        **dataset.info(),
+        "original_columns": dataset.original_columns,
+        "column_mapping": dataset.get_column_mapping()
+    }
+
+@router.delete("/datasets/{file_id}")
+async def delete_dataset(file_id: str):
+    """
+    Elimina definitivamente un dataset e il suo snapshot
+    """
+    try:
+        await run_in_pool("datasets", data_service.delete_dataset, file_id)
+        return {"success": True, "message": f"Dataset {file_id} eliminato"}
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore nell'eliminazione del dataset: {str(e)}"
+        )
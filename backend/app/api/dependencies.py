@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple, TypeVar
+from fastapi import HTTPException, Query
+from app.services.data_service import data_service
+from app.services.dataset_registry import Dataset, DatasetNotFoundError
+from app.services.executor import ExecutorSaturatedError, work_executor
+
+T = TypeVar("T")
+# Estremi date_from/date_to già convertiti (None se assenti)
+DateRange = Tuple[Optional[datetime], Optional[datetime]]
+
+
+def resolve_dataset(file_id: Optional[str] = None) -> Dataset:
+    """Recupera il dataset richiesto traducendo gli errori in risposte HTTP"""
+    try:
+        return data_service.get_dataset(file_id)
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def run_in_pool(endpoint: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """Esegue il lavoro sincrono sul pool limitato, con 429 se l'endpoint è saturo"""
+    try:
+        return await work_executor.run(endpoint, func, *args, **kwargs)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+
+async def iterate_in_pool(endpoint: str, iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Iteratore sincrono consumato sul pool (es. export in streaming), con 429 se l'endpoint è saturo"""
+    try:
+        return await work_executor.iterate(endpoint, iterator)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    """Data ISO (YYYY-MM-DD, anche con orario) oppure 400"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato data non valido per {name}. Usa YYYY-MM-DD"
+        )
+
+
+def date_range(
+    date_from: Optional[str] = Query(None, description="Data inizio (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Data fine (YYYY-MM-DD)")
+) -> DateRange:
+    """Intervallo di date dai parametri date_from/date_to, comune agli endpoint che filtrano per data"""
+    return _parse_date(date_from, "date_from"), _parse_date(date_to, "date_to")
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Query, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Optional
 from datetime import datetime
 import os
@@ -7,48 +8,26 @@ import pandas as pd
 from app.services.data_service import data_service
 from app.models.data_models import DataFilter
 from app.core.config import settings
+from app.api.dependencies import DateRange, date_range, iterate_in_pool, resolve_dataset, run_in_pool
 
 router = APIRouter()
 
 @router.get("/export")
 async def export_data(
     search: Optional[str] = Query(None, description="Ricerca globale su tutti i campi"),
-    date_from: Optional[str] = Query(None, description="Data inizio (YYYY-MM-DD)"),
-    date_to: Optional[str] = Query(None, description="Data fine (YYYY-MM-DD)"),
+    dates: DateRange = Depends(date_range),
+    date_column: Optional[str] = Query(None, description="Colonna data a cui applicare l'intervallo (default: la prima)"),
     columns: Optional[str] = Query(None, description="Colonne specifiche separate da virgola"),
-    format: str = Query("csv", regex="^(csv|xlsx)$", description="Formato export")
+    search_columns_only: bool = Query(False, description="Cerca solo nelle colonne indicate in columns"),
+    format: str = Query("csv", regex="^(csv|xlsx)$", description="Formato export"),
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)")
 ):
     """
     Esporta i dati filtrati in formato CSV o Excel
     """
     try:
-        if data_service.current_data is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Nessun file caricato"
-            )
-        
-        # Parsing date
-        parsed_date_from = None
-        parsed_date_to = None
-        
-        if date_from:
-            try:
-                parsed_date_from = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_from. Usa YYYY-MM-DD"
-                )
-        
-        if date_to:
-            try:
-                parsed_date_to = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_to. Usa YYYY-MM-DD"
-                )
+        # Risoluzione sul pool: può riaprire il dataset dallo snapshot
+        dataset = await run_in_pool("export", resolve_dataset, file_id)
         
         # Parsing colonne
         parsed_columns = None
@@ -58,19 +37,28 @@ async def export_data(
         # Creazione filtro
         data_filter = DataFilter(
             search=search,
-            date_from=parsed_date_from,
-            date_to=parsed_date_to,
+            date_from=dates[0],
+            date_to=dates[1],
+            date_column=date_column,
             columns=parsed_columns,
-            page=1,
-            page_size=1000000  # Export completo
+            search_columns_only=search_columns_only
         )
         
         # Esportazione
         try:
-            export_filepath = data_service.export_data(data_filter, format)
+            filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
             
-            # Generazione nome file per download
-            filename = os.path.basename(export_filepath)
+            if format == "csv":
+                # CSV in streaming a blocchi: il primo byte parte subito e nulla resta su disco;
+                # i blocchi si serializzano sul pool, occupando un posto dell'endpoint fino alla fine
+                csv_stream = await run_in_pool("export", data_service.export_csv_stream, data_filter, dataset.file_id)
+                return StreamingResponse(
+                    await iterate_in_pool("export", csv_stream),
+                    media_type="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+                )
+            
+            export_filepath = await run_in_pool("export", data_service.export_data, data_filter, format, dataset.file_id)
             
             # Verifica esistenza file
             if not os.path.exists(export_filepath):
@@ -79,13 +67,18 @@ async def export_data(
                     detail="Errore nella generazione del file di export"
                 )
             
-            # Response con file
+            # Response con file, eliminato dopo l'invio
             return FileResponse(
                 path=export_filepath,
                 filename=filename,
-                media_type=f"application/{format}" if format == "csv" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                background=BackgroundTask(os.unlink, export_filepath)
             )
             
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -103,41 +96,18 @@ async def export_data(
 @router.get("/export/preview")
 async def export_preview(
     search: Optional[str] = Query(None, description="Ricerca globale su tutti i campi"),
-    date_from: Optional[str] = Query(None, description="Data inizio (YYYY-MM-DD)"),
-    date_to: Optional[str] = Query(None, description="Data fine (YYYY-MM-DD)"),
-    columns: Optional[str] = Query(None, description="Colonne specifiche separate da virgola")
+    dates: DateRange = Depends(date_range),
+    date_column: Optional[str] = Query(None, description="Colonna data a cui applicare l'intervallo (default: la prima)"),
+    columns: Optional[str] = Query(None, description="Colonne specifiche separate da virgola"),
+    search_columns_only: bool = Query(False, description="Cerca solo nelle colonne indicate in columns"),
+    file_id: Optional[str] = Query(None, description="ID del dataset (default: ultimo caricato)")
 ):
     """
     Anteprima dei dati che verranno esportati
     """
     try:
-        if data_service.current_data is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Nessun file caricato"
-            )
-        
-        # Parsing date
-        parsed_date_from = None
-        parsed_date_to = None
-        
-        if date_from:
-            try:
-                parsed_date_from = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_from. Usa YYYY-MM-DD"
-                )
-        
-        if date_to:
-            try:
-                parsed_date_to = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-            except ValueError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Formato data non valido per date_to. Usa YYYY-MM-DD"
-                )
+        # Risoluzione sul pool: può riaprire il dataset dallo snapshot
+        dataset = await run_in_pool("export", resolve_dataset, file_id)
         
         # Parsing colonne
         parsed_columns = None
@@ -147,22 +117,18 @@ async def export_preview(
         # Creazione filtro
         data_filter = DataFilter(
             search=search,
-            date_from=parsed_date_from,
-            date_to=parsed_date_to,
+            date_from=dates[0],
+            date_to=dates[1],
+            date_column=date_column,
             columns=parsed_columns,
-            page=1,
-            page_size=1000000  # Export completo
+            search_columns_only=search_columns_only
         )
         
-        # Applicazione filtri per preview
-        filtered_df = data_service._apply_filters(data_service.current_data, data_filter)
-        
-        preview_info = {
-            "total_rows_to_export": len(filtered_df),
-            "columns_to_export": filtered_df.columns.tolist(),
-            "preview_data": filtered_df.head(5).to_dict('records'),
-            "estimated_file_size_mb": round(filtered_df.memory_usage(deep=True).sum() / 1024 / 1024, 2)
-        }
+        # Preview ricavata dagli id riga in cache
+        try:
+            preview_info = await run_in_pool("export", data_service.get_export_preview, data_filter, dataset.file_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return preview_info
         
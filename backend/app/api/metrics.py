@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Iterable
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.data_service import data_service
+from app.services.executor import work_executor
+from app.services.metrics import Sample, metrics
+
+router = APIRouter()
+
+# Content type del formato testuale di esposizione Prometheus
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "estratti_http_request_duration_seconds",
+    "Durata delle richieste HTTP, fino all'invio completo della risposta",
+    ["method", "route", "status"]
+)
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _route_template(scope: Scope) -> str:
+    """Percorso della route (es. /api/v1/columns/{column_name}), per non creare una serie per ogni URL"""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI che misura ogni richiesta HTTP fino all'ultimo blocco
+    della risposta (inclusi gli export in streaming) e la registra
+    nell'istogramma per metodo, route e codice di stato
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with _in_flight_lock:
+            _in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            with _in_flight_lock:
+                _in_flight -= 1
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=_route_template(scope), status=str(status_code)
+            )
+
+
+def _in_flight_samples() -> Iterable[Sample]:
+    yield {}, _in_flight
+
+
+def _dataset_samples(attribute: str) -> Iterable[Sample]:
+    for dataset in data_service.registry.list_datasets():
+        value = dataset.total_rows if attribute == "rows" else getattr(dataset, attribute)
+        yield {"file_id": dataset.file_id, "loaded": str(dataset.loaded).lower()}, value
+
+
+def _registry_samples(key: str) -> Iterable[Sample]:
+    yield {}, data_service.registry.stats()[key]
+
+
+def _cache_samples(key: str, scale: float = 1.0) -> Iterable[Sample]:
+    yield {}, data_service.result_cache.stats()[key] * scale
+
+
+def _executor_samples(key: str) -> Iterable[Sample]:
+    for endpoint, stats in work_executor.stats()["endpoints"].items():
+        yield {"endpoint": endpoint}, stats[key]
+
+
+metrics.gauge("estratti_http_requests_in_flight", "Richieste HTTP in corso", _in_flight_samples)
+metrics.gauge("estratti_dataset_rows", "Righe per dataset registrato",
+              lambda: _dataset_samples("rows"))
+metrics.gauge("estratti_dataset_data_bytes", "Memoria dei dati per dataset (0 se scaricato)",
+              lambda: _dataset_samples("data_bytes"))
+metrics.gauge("estratti_dataset_index_bytes", "Memoria degli indici per dataset (0 se scaricato)",
+              lambda: _dataset_samples("index_bytes"))
+metrics.gauge("estratti_datasets_memory_bytes", "Memoria complessiva dei dataset caricati",
+              lambda: [({}, data_service.registry.memory_usage())])
+metrics.gauge("estratti_datasets_memory_budget_bytes", "Budget di memoria del registro dei dataset",
+              lambda: [({}, data_service.registry.memory_budget_bytes)])
+metrics.gauge("estratti_dataset_evictions_total", "Dataset scaricati per rispettare il budget",
+              lambda: _registry_samples("evictions"), kind="counter")
+metrics.gauge("estratti_dataset_reloads_total", "Dataset riaperti dallo snapshot",
+              lambda: _registry_samples("reloads"), kind="counter")
+metrics.gauge("estratti_result_cache_hits_total", "Letture trovate nella cache dei risultati",
+              lambda: _cache_samples("hits"), kind="counter")
+metrics.gauge("estratti_result_cache_misses_total", "Letture non trovate nella cache dei risultati",
+              lambda: _cache_samples("misses"), kind="counter")
+metrics.gauge("estratti_result_cache_evictions_total", "Voci rimosse dalla cache per limiti di voci o memoria",
+              lambda: _cache_samples("evictions"), kind="counter")
+metrics.gauge("estratti_result_cache_hit_ratio", "Frazione di letture trovate in cache dall'avvio",
+              lambda: _cache_samples("hit_rate"))
+metrics.gauge("estratti_result_cache_entries", "Voci nella cache dei risultati",
+              lambda: _cache_samples("entries"))
+metrics.gauge("estratti_result_cache_memory_bytes", "Memoria occupata dalla cache dei risultati",
+              lambda: _cache_samples("memory_mb", 1024 * 1024))
+metrics.gauge("estratti_executor_running", "Lavori in esecuzione sul pool per endpoint",
+              lambda: _executor_samples("running"))
+metrics.gauge("estratti_executor_waiting", "Lavori in coda sul pool per endpoint",
+              lambda: _executor_samples("waiting"))
+metrics.gauge("estratti_executor_rejected_total", "Richieste rifiutate con 429 per endpoint",
+              lambda: _executor_samples("rejected"), kind="counter")
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Metriche del processo in formato testuale Prometheus: durata delle
+    richieste e delle fasi di DataService, righe elaborate, memoria dei
+    dataset, cache dei risultati e pool di lavoro
+    """
+    return Response(content=metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
@@ -0,0 +1,128 @@
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.profiling import current_profile, request_profiler
+
+router = APIRouter()
+
+# Header che attiva la profilazione di una richiesta (valore: il token configurato)
+PROFILE_HEADER = "x-profile"
+# Header della risposta con l'id del report
+PROFILE_ID_HEADER = "x-profile-id"
+# Le richieste agli endpoint di debug non vengono profilate
+DEBUG_PREFIX = "/debug"
+
+
+def _requested(value: Optional[str]) -> bool:
+    """La richiesta chiede la profilazione con il token nell'header"""
+    return bool(value) and request_profiler.authorized(value)
+
+
+class RequestProfilerMiddleware:
+    """
+    Middleware ASGI che profila le richieste con l'header X-Profile o
+    prenotate da POST /debug/profile (solo con la profilazione abilitata).
+    Il report è conservato in memoria e il suo id torna nell'header X-Profile-Id.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (scope["type"] != "http" or not request_profiler.enabled
+                or scope["path"].startswith(DEBUG_PREFIX)):
+            await self.app(scope, receive, send)
+            return
+
+        session = request_profiler.begin(
+            scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+            requested=_requested(Headers(scope=scope).get(PROFILE_HEADER))
+        )
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (PROFILE_ID_HEADER.encode(), session.request_id.encode())
+                ]
+            await send(message)
+
+        token = current_profile.set(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            # Snapshot di tracemalloc e statistiche di cProfile fuori dall'event loop
+            await run_in_threadpool(request_profiler.end, session, status_code)
+
+
+def _check_access(token: Optional[str]):
+    """Endpoint di debug disponibili solo con la profilazione abilitata e il token"""
+    if not request_profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profilazione non abilitata")
+    if not request_profiler.authorized(token):
+        raise HTTPException(status_code=403, detail="Token di profilazione non valido")
+
+
+@router.post("/debug/profile")
+async def arm_profile(
+    path: str = Query("/api/v1/", description="Prefisso del percorso delle richieste da profilare"),
+    count: int = Query(1, ge=1, le=100, description="Numero di richieste da profilare"),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """
+    Prenota la profilazione delle prossime richieste a un percorso, senza
+    dover aggiungere l'header X-Profile (es. richieste fatte dal frontend)
+    """
+    _check_access(x_profile_token)
+    return request_profiler.arm(path, count)
+
+
+@router.get("/debug/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """
+    Elenca i report di profilazione conservati, dal più recente
+    """
+    _check_access(x_profile_token)
+    return {**request_profiler.stats(), "profiles": request_profiler.list_reports()}
+
+
+@router.get("/debug/profiles/{request_id}")
+async def get_profile(
+    request_id: str,
+    format: str = Query("json", regex="^(json|text)$", description="json (report) o text (tabella pstats)"),
+    x_profile_token: Optional[str] = Header(None)
+):
+    """
+    Report di una richiesta profilata: funzioni con più tempo cumulativo,
+    picco di memoria tracciata e righe con più allocazioni
+    """
+    _check_access(x_profile_token)
+    try:
+        if format == "text":
+            return PlainTextResponse(request_profiler.get_text(request_id))
+        return request_profiler.get(request_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Profilo '{request_id}' non trovato")
+
+
+@router.delete("/debug/profiles")
+async def clear_profiles(x_profile_token: Optional[str] = Header(None)) -> Dict[str, List]:
+    """
+    Elimina i report conservati e le prenotazioni in sospeso
+    """
+    _check_access(x_profile_token)
+    request_profiler.clear()
+    return {"profiles": []}
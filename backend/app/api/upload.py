@@ -1,63 +1,99 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
 from fastapi.responses import JSONResponse
 import os
 import tempfile
-from typing import Optional
+from typing import List, Optional, Tuple
 from app.services.data_service import data_service
-from app.models.data_models import UploadResponse, ErrorResponse
+from app.models.data_models import UploadResponse, ErrorResponse, IngestionJobStatus
+from app.services.dataset_registry import DatasetNotFoundError
+from app.services.ingestion_jobs import job_manager
+from app.api.dependencies import run_in_pool
+from app.services.dedup import DEDUP_MODES
 from app.core.config import settings
 
 router = APIRouter()
 
+def _resolve_file_type(file: UploadFile, file_type: Optional[str]) -> Tuple[str, str]:
+    """Valida nome, estensione e dimensione dichiarata; restituisce (estensione, tipo file)"""
+    # Validazione file
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Nome file mancante")
+    
+    # Estrazione estensione
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    
+    # Validazione estensione
+    if file_extension not in settings.allowed_extensions:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Estensione non supportata. Supportate: {', '.join(settings.allowed_extensions)}"
+        )
+    
+    # Validazione dimensione file
+    if file.size and file.size > settings.max_file_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File troppo grande. Dimensione massima: {settings.max_file_size // (1024*1024)}MB"
+        )
+    
+    # Determinazione tipo file
+    if not file_type:
+        file_type = file_extension.lstrip('.')
+    
+    return file_extension, file_type
+
+def _validate_dedup_mode(dedup_mode: str):
+    """Valida la modalità di gestione dei duplicati"""
+    if dedup_mode not in DEDUP_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modalità deduplica non valida. Supportate: {', '.join(DEDUP_MODES)}"
+        )
+
+async def _save_to_temp_file(file: UploadFile, suffix: str) -> str:
+    """Scrive l'upload su un file temporaneo a blocchi, con controllo della dimensione"""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        bytes_written = 0
+        with temp_file:
+            while chunk := await file.read(settings.upload_chunk_size):
+                bytes_written += len(chunk)
+                if bytes_written > settings.max_file_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File troppo grande. Dimensione massima: {settings.max_file_size // (1024*1024)}MB"
+                    )
+                temp_file.write(chunk)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
+    return temp_file.name
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
-    file_type: Optional[str] = Form(None)
+    file_type: Optional[str] = Form(None),
+    dedup_against: Optional[str] = Form(None),
+    dedup_mode: str = Form("drop"),
+    append_to: Optional[str] = Form(None)
 ):
     """
-    Endpoint per il caricamento di file CSV/Excel
+    Endpoint per il caricamento di file CSV/Excel.
+    Con dedup_against (file_id di un dataset esistente) le righe già presenti
+    vengono scartate (dedup_mode=drop) o segnalate nella colonna duplicato (flag);
+    con append_to le righe vengono accodate a quel dataset, che mantiene il suo file_id
     """
     try:
-        # Validazione file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="Nome file mancante")
-        
-        # Estrazione estensione
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        
-        # Validazione estensione
-        if file_extension not in settings.allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Estensione non supportata. Supportate: {', '.join(settings.allowed_extensions)}"
-            )
-        
-        # Validazione dimensione file
-        if file.size and file.size > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File troppo grande. Dimensione massima: {settings.max_file_size // (1024*1024)}MB"
-            )
-        
-        # Determinazione tipo file
-        if not file_type:
-            if file_extension == '.csv':
-                file_type = 'csv'
-            elif file_extension == '.xls':
-                file_type = 'xls'
-            elif file_extension == '.xlsx':
-                file_type = 'xlsx'
-        
-        # Creazione file temporaneo
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            # Lettura contenuto file
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        file_extension, file_type = _resolve_file_type(file, file_type)
+        _validate_dedup_mode(dedup_mode)
+        temp_file_path = await _save_to_temp_file(file, file_extension)
         
         try:
             # Processing file tramite servizio
-            result = data_service.upload_file(temp_file_path, file_type)
+            result = await run_in_pool(
+                "upload", data_service.upload_file, temp_file_path, file_type,
+                dedup_against, dedup_mode, append_to
+            )
             
             if result.get("success"):
                 return UploadResponse(
@@ -68,7 +104,8 @@ async def upload_file(
                     columns=result.get("columns"),
                     preview_data=result.get("preview_data"),
                     original_columns=result.get("original_columns"),
-                    column_mapping=result.get("column_mapping")
+                    column_mapping=result.get("column_mapping"),
+                    ingest_stats=result.get("ingest_stats")
                 )
             else:
                 raise HTTPException(
@@ -81,6 +118,8 @@ async def upload_file(
             if os.path.exists(temp_file_path):
                 os.unlink(temp_file_path)
                 
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -90,18 +129,90 @@ async def upload_file(
         )
 
 @router.delete("/upload")
-async def clear_uploaded_data():
+async def clear_uploaded_data(
+    file_id: Optional[str] = Query(None, description="ID del dataset da rimuovere (default: tutti)")
+):
     """
     Pulisce i dati caricati
     """
     try:
-        data_service.clear_data()
+        await run_in_pool("upload", data_service.clear_data, file_id)
         return JSONResponse(
             content={"success": True, "message": "Dati puliti con successo"},
             status_code=200
         )
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Errore nella pulizia dei dati: {str(e)}"
         )
+
+@router.post("/upload/jobs", response_model=IngestionJobStatus, status_code=202)
+async def create_upload_job(
+    file: UploadFile = File(...),
+    file_type: Optional[str] = Form(None),
+    dedup_against: Optional[str] = Form(None),
+    dedup_mode: str = Form("drop"),
+    append_to: Optional[str] = Form(None)
+):
+    """
+    Avvia il caricamento in background: la risposta arriva appena il file è
+    su disco, l'avanzamento si segue con GET /upload/jobs/{job_id}
+    """
+    try:
+        file_extension, file_type = _resolve_file_type(file, file_type)
+        _validate_dedup_mode(dedup_mode)
+        # Dataset indicati controllati subito, non a job già avviato
+        await run_in_pool("upload", data_service.validate_ingest_options, dedup_against, dedup_mode, append_to)
+        temp_file_path = await _save_to_temp_file(file, file_extension)
+        options = {}
+        if dedup_against:
+            options.update({"dedup_against": dedup_against, "dedup_mode": dedup_mode})
+        if append_to:
+            options["append_to"] = append_to
+        job = job_manager.submit(temp_file_path, file_type, file.filename, options)
+        return job.to_dict()
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore interno del server: {str(e)}"
+        )
+
+@router.get("/upload/jobs", response_model=List[IngestionJobStatus])
+async def list_upload_jobs():
+    """
+    Elenco dei job di caricamento, dal più recente
+    """
+    return [job.to_dict() for job in job_manager.list_jobs()]
+
+@router.get("/upload/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_upload_job(job_id: str):
+    """
+    Stato di un job: fase (read/clean/store/index), righe elaborate, avanzamento ed ETA
+    """
+    try:
+        return job_manager.get(job_id).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' non trovato")
+
+@router.delete("/upload/jobs/{job_id}", response_model=IngestionJobStatus)
+async def cancel_upload_job(job_id: str):
+    """
+    Annulla un job in corso; i dati parziali vengono scartati
+    """
+    try:
+        return job_manager.cancel(job_id).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' non trovato")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 import os
 
 class Settings:
@@ -22,16 +22,69 @@ class Settings:
     max_file_size: int = 100 * 1024 * 1024  # 100MB
     allowed_extensions: List[str] = [".csv", ".xls", ".xlsx"]
     upload_folder: str = "uploads"
+    upload_chunk_size: int = 1024 * 1024  # 1MB per blocco in scrittura su disco
+    ingest_chunk_rows: int = 50000  # righe per blocco in lettura/pulizia/salvataggio
+    
+    # Configurazione ingestione in background (POST /upload/jobs)
+    ingest_worker_processes: int = 2  # processi per lettura e pulizia dei file
+    ingest_max_concurrent_jobs: int = 2
+    ingest_job_retention: int = 3600  # secondi di conservazione dei job terminati
+    
+    # Configurazione registro dataset
+    dataset_memory_budget_mb: int = 2048
+    dataset_folder: str = "datasets"
     
     # Configurazione database temporaneo
     temp_db_path: str = "temp_data.db"
+    sqlite_bulk_load: bool = os.getenv("SQLITE_BULK_LOAD", "1") == "1"  # synchronous=OFF e cache ampia in caricamento
+    sqlite_cache_size_mb: int = 64  # cache delle pagine della connessione di caricamento
+    sqlite_busy_timeout: float = 60.0  # secondi di attesa del lock di scrittura (più processi sullo stesso database)
+    
+    # Motore di query per /data: "pandas" (in memoria) o "sqlite" (pushdown SQL)
+    query_engine: str = os.getenv("QUERY_ENGINE", "pandas")
+    
+    # Pool di thread per il lavoro sincrono di DataService
+    executor_workers: int = int(os.getenv("EXECUTOR_WORKERS", "8"))
+    executor_max_queue: int = 16  # richieste in attesa per endpoint prima del 429
+    latency_window: int = 1000  # richieste recenti usate per i percentili di latenza
+    endpoint_concurrency: Dict[str, int] = {
+        "data": 8,
+        "stats": 2,
+        "aggregate": 2,
+        "columns": 2,
+        "export": 2,
+        "upload": 2,
+        "datasets": 4
+    }
     
     # Configurazione paginazione
     default_page_size: int = 100
     max_page_size: int = 1000
     
+    # Colonne di testo con rapporto valori distinti/righe fino a questa soglia diventano categorical
+    categorical_max_ratio: float = 0.5
+    
+    # Oltre questa soglia il profilo delle colonne usa stime (HyperLogLog, quantili campionati)
+    profile_exact_max_rows: int = 1000000
+    
+    # Righe serializzate per blocco nell'export CSV in streaming
+    export_batch_rows: int = 10000
+    
+    # Numero massimo di gruppi restituiti da /data/aggregate
+    aggregate_max_groups: int = 10000
+    
+    # Profilazione su richiesta (cProfile + tracemalloc) con header X-Profile o prenotazione da /debug:
+    # disattivata se non richiesta esplicitamente, e attiva solo con un token (i report contengono le query)
+    profiling_enabled: bool = os.getenv("PROFILING_ENABLED", "0") == "1"
+    profiling_token: Optional[str] = os.getenv("PROFILING_TOKEN") or None  # richiesto da header ed endpoint
+    profiling_max_reports: int = 50
+    profiling_top_n: int = 30
+    profiling_trace_frames: int = 1  # frame per allocazione tracciata (più frame = più overhead)
+    
     # Configurazione cache
     cache_ttl: int = 300  # 5 minuti
+    cache_max_entries: int = 128
+    cache_max_memory_mb: int = 256
 
 settings = Settings()
 
@@ -17,12 +17,30 @@ class UploadResponse(BaseModel):
     preview_data: Optional[List[Dict[str, Any]]] = None
     original_columns: Optional[List[str]] = None
     column_mapping: Optional[Dict[str, str]] = None
+    ingest_stats: Optional[Dict[str, Any]] = None
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    file_name: str
+    status: str
+    stage: Optional[str] = None
+    rows_processed: int = 0
+    total_rows: Optional[int] = None
+    progress: float = 0.0
+    elapsed_seconds: float = 0.0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
 
 class DataFilter(BaseModel):
     search: Optional[str] = None
     date_from: Optional[datetime] = None
     date_to: Optional[datetime] = None
+    date_column: Optional[str] = None
     columns: Optional[List[str]] = None
+    search_columns_only: bool = False
+    running_balance: bool = False
+    balance_column: Optional[str] = None
     page: int = Field(default=1, ge=1)
     page_size: int = Field(default=100, ge=1, le=1000)
     sort_by: Optional[str] = None
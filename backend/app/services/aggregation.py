@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Periodi di raggruppamento delle colonne data -> unità numpy di troncamento
+PERIODS: Dict[str, str] = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+# Funzioni di aggregazione ammesse sulle colonne di importi
+MEASURE_FUNCTIONS = ("sum", "count", "mean")
+# Suffissi delle misure separate per segno
+SIGN_SUFFIXES = {"entrate": 1, "uscite": -1}
+
+
+def parse_group_keys(group_by: List[str], df: pd.DataFrame) -> List[Tuple[str, Optional[str]]]:
+    """
+    Converte le chiavi di raggruppamento ("colonna" oppure "periodo:colonna")
+    in coppie (colonna, periodo); ValueError se una chiave non è valida
+    """
+    if not group_by:
+        raise ValueError("Indica almeno una chiave di raggruppamento")
+    keys = []
+    for key in group_by:
+        period, _, column = key.rpartition(":")
+        if column not in df.columns:
+            raise ValueError(f"Colonna di raggruppamento non trovata: {column}")
+        if period:
+            if period not in PERIODS:
+                raise ValueError(f"Periodo non valido: {period}. Usa {', '.join(PERIODS)}")
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                raise ValueError(f"La colonna '{column}' non è una colonna di date")
+        keys.append((column, period or None))
+    return keys
+
+
+def parse_measures(measures: List[str], df: pd.DataFrame) -> List[Tuple[str, Optional[str]]]:
+    """
+    Converte le misure ("count" oppure "funzione:colonna") in coppie
+    (funzione, colonna); ValueError se la colonna non è numerica
+    """
+    parsed = []
+    for measure in measures:
+        function, _, column = measure.partition(":")
+        if function not in MEASURE_FUNCTIONS:
+            raise ValueError(f"Misura non valida: {function}. Usa {', '.join(MEASURE_FUNCTIONS)}")
+        if not column:
+            if function != "count":
+                raise ValueError(f"La misura '{function}' richiede una colonna (es. {function}:Importo)")
+            parsed.append((function, None))
+            continue
+        if column not in df.columns:
+            raise ValueError(f"Colonna della misura non trovata: {column}")
+        if not pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+            raise ValueError(f"La colonna '{column}' non è una colonna numerica")
+        parsed.append((function, column))
+    return parsed
+
+
+def key_name(column: str, period: Optional[str]) -> str:
+    """Nome della colonna chiave nel risultato (es. month_Data_Operazione)"""
+    return f"{period}_{column}" if period else column
+
+
+def measure_name(function: str, column: Optional[str], suffix: Optional[str] = None) -> str:
+    """Nome della misura nel risultato (es. sum_Importo, sum_Importo_uscite)"""
+    name = f"{function}_{column}" if column else "count_rows"
+    return f"{name}_{suffix}" if suffix else name
+
+
+def _truncate_dates(values: pd.Series, period: str) -> pd.Series:
+    """Tronca le date all'inizio del periodo (settimane da lunedì) con aritmetica numpy"""
+    days = values.to_numpy(dtype="datetime64[us]").astype("datetime64[D]")
+    if period == "week":
+        # 1970-01-01 era giovedì: (giorni + 3) % 7 è la distanza dal lunedì
+        offsets = (days.view(np.int64) + 3) % 7
+        truncated = days - offsets.astype("timedelta64[D]")
+    else:
+        truncated = days.astype(f"datetime64[{PERIODS[period]}]")
+    return pd.Series(truncated.astype("datetime64[us]"), index=values.index)
+
+
+def aggregate(df: pd.DataFrame, rows: np.ndarray, keys: List[Tuple[str, Optional[str]]],
+              measures: List[Tuple[str, Optional[str]]], split_sign: bool = False) -> pd.DataFrame:
+    """
+    Raggruppa le righe selezionate per le chiavi indicate e calcola le misure
+    con un unico groupby vettoriale. Con split_sign ogni misura su colonna è
+    ripetuta separatamente per importi positivi (entrate) e negativi (uscite).
+    """
+    subset = df.iloc[rows]
+    frame: Dict[str, pd.Series] = {}
+    for column, period in keys:
+        values = subset[column]
+        frame[key_name(column, period)] = _truncate_dates(values, period) if period else values
+
+    named_aggregations = {}
+    for function, column in measures:
+        if column is None:
+            frame["__rows"] = pd.Series(np.ones(len(subset), dtype=np.int64), index=subset.index)
+            named_aggregations[measure_name(function, None)] = ("__rows", "sum")
+            continue
+        values = subset[column].astype(np.float64)
+        value_name = f"__value_{column}"
+        frame[value_name] = values
+        named_aggregations[measure_name(function, column)] = (value_name, function)
+        if split_sign:
+            for suffix, sign in SIGN_SUFFIXES.items():
+                signed_name = f"{value_name}_{suffix}"
+                frame[signed_name] = values.where(values * sign > 0)
+                named_aggregations[measure_name(function, column, suffix)] = (signed_name, function)
+
+    group_names = [key_name(column, period) for column, period in keys]
+    grouped = pd.DataFrame(frame).groupby(group_names, observed=True, dropna=False, sort=True)
+    result = grouped.agg(**named_aggregations).reset_index()
+    # Le misure di conteggio restano intere anche con gruppi vuoti per segno
+    for name, (_, function) in named_aggregations.items():
+        if function == "count":
+            result[name] = result[name].astype(np.int64)
+    return result
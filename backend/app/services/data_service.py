@@ -1,287 +1,831 @@
+import numpy as np
 import pandas as pd
 import sqlite3
 import os
+import tempfile
+import threading
+import time
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Set
 from datetime import datetime
 import json
 from app.core.config import settings
 from app.models.data_models import DataFilter, ColumnInfo
+from app.services.search_index import SearchIndex
+from app.services.profile import build_profile, hll_registers, merge_profiles, to_json_value
+from app.services.aggregation import aggregate, parse_group_keys, parse_measures
+from app.services.dedup import DEDUP_MODES, DUPLICATE_COLUMN, DuplicateDetector
+from app.services.result_cache import ResultCache
+from app.services.sql_engine import SQLQueryEngine, table_name_for, quote_identifier
+from app.services.sqlite_loader import (
+    WRITE_LOCK, connect_for_load, create_indexes, create_table, ensure_indexes, insert_rows, load_indexed_columns,
+    load_stats
+)
+from app.services.dataset_registry import Dataset, DatasetNotFoundError, DatasetRegistry
+from app.services.snapshot_store import SnapshotStore
+from app.services.metrics import RESULT_ROWS, ROWS_PROCESSED, StageTimer
+from app.services.ingestion import (
+    ProgressCallback, align_numeric_columns, clean_chunks, compact_dataframe, concat_rows,
+    infer_numeric_columns, read_chunks, report_progress
+)
+
+# Colonna aggiunta alle pagine di /data con running_balance
+RUNNING_BALANCE_COLUMN = "saldo_progressivo"
 
 class DataService:
     def __init__(self):
         self.db_path = settings.temp_db_path
-        self.current_data: Optional[pd.DataFrame] = None
-        self.current_file_id: Optional[str] = None
-        self._original_columns: Optional[List[str]] = None
+        self.registry = DatasetRegistry(
+            memory_budget_bytes=settings.dataset_memory_budget_mb * 1024 * 1024,
+            store=SnapshotStore(settings.dataset_folder)
+        )
+        self.result_cache = ResultCache(
+            ttl=settings.cache_ttl,
+            max_entries=settings.cache_max_entries,
+            max_bytes=settings.cache_max_memory_mb * 1024 * 1024
+        )
+        self.sql_engine = SQLQueryEngine(self.db_path)
+        self._sql_tables: Set[str] = set()
+        # Indici SQLite già creati per dataset: nomi di colonna, None per la colonna di date di default
+        self._sql_indexes: Dict[str, Set[Optional[str]]] = {}
+        self._sql_locks: Dict[str, threading.Lock] = {}
+        self._sql_locks_guard = threading.Lock()
+        # Le aggiunte a un dataset sono serializzate per non perdere righe
+        self._append_lock = threading.Lock()
         self._init_db()
     
     def _init_db(self):
-        """Inizializza il database SQLite temporaneo"""
+        """Inizializza il database SQLite temporaneo (WAL: le letture non attendono i caricamenti)"""
         conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.close()
     
-    def upload_file(self, file_path: str, file_type: str) -> Dict[str, Any]:
+    @property
+    def current_file_id(self) -> Optional[str]:
+        """file_id dell'ultimo dataset caricato"""
+        return self.registry.latest_file_id
+    
+    def get_dataset(self, file_id: Optional[str] = None) -> Dataset:
+        """Restituisce il dataset richiesto (default: ultimo caricato)"""
+        return self.registry.get(file_id)
+    
+    def upload_file(self, file_path: str, file_type: str, dedup_against: Optional[str] = None,
+                    dedup_mode: str = "drop", append_to: Optional[str] = None) -> Dict[str, Any]:
         """Carica e processa un file CSV/Excel"""
         try:
-            # Lettura file in base al tipo
-            if file_type.lower() == 'csv':
-                df = pd.read_csv(file_path, encoding='utf-8')
-            elif file_type.lower() in ['xls', 'xlsx']:
-                df = pd.read_excel(file_path)
-            else:
-                raise ValueError(f"Tipo file non supportato: {file_type}")
-            
-            # Salva i nomi delle colonne originali prima della pulizia
-            self._original_columns = df.columns.tolist()
-            
-            # Pulizia dati base
-            df = self._clean_dataframe(df)
-            
-            # Generazione ID univoco per la sessione
-            file_id = str(uuid.uuid4())
-            
-            # Salvataggio in SQLite per query efficienti
-            self._save_to_sqlite(df, file_id)
+            started = time.perf_counter()
+            timer = StageTimer("ingest")
+            self.validate_ingest_options(dedup_against, dedup_mode, append_to)
             
-            # Aggiornamento stato corrente
-            self.current_data = df
-            self.current_file_id = file_id
-            
-            # Generazione preview (prime 10 righe)
-            preview_data = df.head(10).to_dict('records')
-            
-            return {
-                "success": True,
-                "file_id": file_id,
-                "total_rows": len(df),
-                "columns": df.columns.tolist(),
-                "preview_data": preview_data,
-                "original_columns": self._original_columns,
-                "column_mapping": self.get_column_mapping()
-            }
+            # Lettura e pulizia a blocchi di righe (tempi separati per fase)
+            with timer.stage("read"):
+                raw_chunks, ingest_stats = read_chunks(file_path, file_type, settings.ingest_chunk_rows)
+            cleaned_chunks = timer.iterate(clean_chunks(timer.iterate(raw_chunks, "read")), "clean")
+            return self.ingest(cleaned_chunks, ingest_stats, started=started, timer=timer,
+                               dedup_against=dedup_against, dedup_mode=dedup_mode, append_to=append_to)
             
+        except DatasetNotFoundError:
+            raise
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
     
-    def _clean_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Pulisce e normalizza il dataframe"""
-        # Rimozione righe completamente vuote
-        df = df.dropna(how='all')
-        
-        # Pulizia nomi colonne - rimuove caratteri problematici per SQLite
-        def clean_column_name(col_name):
-            # Rimuove caratteri non validi per SQLite
-            import re
-            # Sostituisce spazi, punti, due punti e altri caratteri problematici con underscore
-            cleaned = re.sub(r'[^a-zA-Z0-9_]', '_', str(col_name).strip())
-            # Rimuove underscore multipli consecutivi
-            cleaned = re.sub(r'_+', '_', cleaned)
-            # Rimuove underscore iniziali e finali
-            cleaned = cleaned.strip('_')
-            # Assicura che il nome non inizi con un numero
-            if cleaned and cleaned[0].isdigit():
-                cleaned = 'col_' + cleaned
-            # Se il nome è vuoto, usa un nome di default
-            if not cleaned:
-                cleaned = 'column'
-            return cleaned.lower()
-        
-        # Applica la pulizia ai nomi delle colonne
-        df.columns = [clean_column_name(col) for col in df.columns]
-        
-        # Conversione date se presenti
-        date_columns = []
-        for col in df.columns:
-            if any(keyword in col.lower() for keyword in ['data', 'date', 'giorno']):
-                date_columns.append(col)
-        
-        for col in date_columns:
-            try:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-            except:
-                pass
+    def validate_ingest_options(self, dedup_against: Optional[str] = None, dedup_mode: str = "drop",
+                                append_to: Optional[str] = None):
+        """
+        Controlla i dataset indicati prima di leggere il file: DatasetNotFoundError
+        se non esistono, ValueError se la combinazione di opzioni non è valida
+        """
+        if dedup_mode not in DEDUP_MODES:
+            raise ValueError(f"Modalità deduplica non valida: {dedup_mode}. Usa {', '.join(DEDUP_MODES)}")
+        if dedup_against is not None:
+            self.registry.resolve_id(dedup_against)
+        if append_to is not None:
+            self.registry.resolve_id(append_to)
+            # In modalità flag i blocchi hanno una colonna in più, che il dataset di destinazione deve già avere
+            if (dedup_against is not None and dedup_mode == "flag"
+                    and DUPLICATE_COLUMN not in self.registry.get(append_to).columns):
+                raise ValueError(
+                    f"dedup_mode=flag aggiunge la colonna '{DUPLICATE_COLUMN}', assente nel dataset "
+                    f"'{append_to}': per accodare le righe usa dedup_mode=drop"
+                )
+    
+    def ingest(self, cleaned_chunks: Iterator[Tuple[List[str], pd.DataFrame]], ingest_stats: Dict[str, Any],
+               progress: Optional[ProgressCallback] = None, started: Optional[float] = None,
+               dedup_against: Optional[str] = None, dedup_mode: str = "drop",
+               append_to: Optional[str] = None, timer: Optional[StageTimer] = None) -> Dict[str, Any]:
+        """
+        Salva, indicizza e registra un dataset a partire dai blocchi già puliti.
+        Con dedup_against le righe già presenti in quel dataset vengono
+        scartate (dedup_mode="drop") o segnalate nella colonna duplicato ("flag");
+        con append_to le righe vengono accodate a quel dataset invece di crearne uno nuovo.
+        I tempi per fase finiscono in ingest_stats["stage_seconds"] e nelle metriche
+        """
+        started = started if started is not None else time.perf_counter()
+        timer = timer if timer is not None else StageTimer("ingest")
+        self.validate_ingest_options(dedup_against, dedup_mode, append_to)
+        
+        # Confronto con un dataset esistente tramite impronte delle righe
+        detector = None
+        if dedup_against is not None:
+            with timer.stage("dedup"):
+                detector = DuplicateDetector(self.registry.get(dedup_against).data, dedup_mode)
+            cleaned_chunks = timer.iterate(detector.filter_chunks(cleaned_chunks), "dedup")
+        
+        if append_to is not None:
+            # Anche la tabella SQLite resta bloccata: un ripristino concorrente dallo snapshot perderebbe le righe nuove
+            with self._append_lock, self._sql_table_lock(append_to):
+                result = self._append(cleaned_chunks, ingest_stats, append_to, progress, started, timer)
+            if detector is not None:
+                result["ingest_stats"]["deduplication"] = detector.stats(dedup_against)
+            return result
+        
+        # Generazione ID univoco per la sessione
+        file_id = str(uuid.uuid4())
+        
+        # Salvataggio in SQLite a blocchi di righe
+        df, original_columns = self._ingest_chunks(cleaned_chunks, file_id, progress, timer)
+        ingest_stats["sqlite"] = load_stats(
+            settings.sqlite_bulk_load, settings.sqlite_cache_size_mb, load_indexed_columns(df, settings.query_engine)
+        )
+        
+        # Rappresentazione compatta in memoria (categorical, stringhe Arrow, downcast)
+        with timer.stage("compact"):
+            df, compaction_stats = compact_dataframe(df, settings.categorical_max_ratio)
+        ingest_stats.update(compaction_stats)
+        
+        # Indice per la ricerca globale, costruito una sola volta per dataset
+        with timer.stage("search_index"):
+            search_index = SearchIndex(df)
+        
+        # Profilo delle colonne, servito da /columns e /data/stats senza ricalcoli
+        with timer.stage("profile"):
+            profile = build_profile(df, settings.profile_exact_max_rows)
+        
+        # Registrazione del dataset, senza toccare quelli di altri utenti
+        dataset = Dataset(file_id, df, original_columns, search_index, profile=profile)
+        
+        # Somme prefisse degli importi lungo la prima colonna data (saldi e totali per intervallo)
+        balance_started = time.perf_counter()
+        with timer.stage("balance_index"):
+            date_columns = dataset.get_date_columns()
+            if date_columns:
+                for amount_column in dataset.get_amount_columns():
+                    dataset.get_prefix_sums(date_columns[0], amount_column)
+        balance_seconds = time.perf_counter() - balance_started
+        
+        with timer.stage("snapshot"):
+            self.registry.add(dataset)
+        
+        # Generazione preview (prime 10 righe)
+        preview_data = df.head(10).to_dict('records')
         
-        # Conversione importi se presenti
-        amount_columns = []
-        for col in df.columns:
-            if any(keyword in col.lower() for keyword in ['importo', 'amount', 'euro', '€']):
-                amount_columns.append(col)
+        elapsed = time.perf_counter() - started
+        ROWS_PROCESSED.inc(len(df), operation="ingest")
+        ingest_stats.update({
+            "profile_seconds": profile["build_seconds"],
+            "balance_index_seconds": round(balance_seconds, 4),
+            "deduplication": detector.stats(dedup_against) if detector is not None else None,
+            "stage_seconds": timer.finish(),
+            "total_seconds": round(elapsed, 4),
+            "total_rows_per_second": round(len(df) / elapsed, 1) if elapsed > 0 else None
+        })
         
-        for col in amount_columns:
+        return {
+            "success": True,
+            "file_id": file_id,
+            "total_rows": len(df),
+            "columns": df.columns.tolist(),
+            "preview_data": preview_data,
+            "original_columns": original_columns,
+            "column_mapping": dataset.get_column_mapping(),
+            "ingest_stats": ingest_stats
+        }
+    
+    def _ingest_chunks(self, cleaned_chunks: Iterator[Tuple[List[str], pd.DataFrame]], file_id: str,
+                       progress: Optional[ProgressCallback] = None,
+                       timer: Optional[StageTimer] = None) -> Tuple[pd.DataFrame, List[str]]:
+        """
+        Unisce i blocchi puliti, deduce i tipi numerici sull'intero file (non
+        blocco per blocco, per avere lo stesso tipo in tutte le righe) e salva
+        il risultato in SQLite
+        """
+        timer = timer if timer is not None else StageTimer("ingest")
+        original_columns: Optional[List[str]] = None
+        stored_chunks: List[pd.DataFrame] = []
+        
+        for chunk_columns, chunk in cleaned_chunks:
+            # Nomi delle colonne originali prima della pulizia
+            if original_columns is None:
+                original_columns = chunk_columns
+            stored_chunks.append(chunk)
+        
+        if not stored_chunks:
+            raise ValueError("Il file non contiene dati")
+        
+        with timer.stage("concat"):
+            df = pd.concat(stored_chunks, ignore_index=True) if len(stored_chunks) > 1 else stored_chunks[0]
+            df = df.reset_index(drop=True)
+        stored_chunks.clear()
+        
+        with timer.stage("dtypes"):
+            df = infer_numeric_columns(df)
+        
+        self._load_sql_table(file_id, df, timer, progress)
+        return df, original_columns
+    
+    def _load_sql_table(self, file_id: str, df: pd.DataFrame, timer: StageTimer,
+                        progress: Optional[ProgressCallback] = None):
+        """
+        Crea la tabella SQLite del dataset e la riempie a blocchi di righe in
+        un'unica transazione con i pragma di bulk load; alla fine si indicizza
+        solo la colonna di date di default, e solo con il motore SQLite
+        """
+        table_name = table_name_for(file_id)
+        # Caricamenti concorrenti in coda sul lock di scrittura, uno per transazione
+        with WRITE_LOCK:
+            conn = connect_for_load(
+                self.db_path, settings.sqlite_bulk_load, settings.sqlite_cache_size_mb, settings.sqlite_busy_timeout
+            )
             try:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            except:
-                pass
+                create_table(conn, table_name, df)
+                for start in range(0, len(df), settings.ingest_chunk_rows):
+                    insert_rows(conn, table_name, df.iloc[start:start + settings.ingest_chunk_rows], timer)
+                    report_progress(progress, "store", min(start + settings.ingest_chunk_rows, len(df)))
+                
+                # Indici creati dopo il caricamento completo, nella stessa transazione
+                report_progress(progress, "index", 0)
+                with timer.stage("sqlite_index"):
+                    create_indexes(conn, table_name, load_indexed_columns(df, settings.query_engine))
+                with timer.stage("sqlite_commit"):
+                    conn.commit()
+                self._sql_tables.add(file_id)
+                # Con il motore SQLite la colonna di date di default è già indicizzata
+                self._sql_indexes[file_id] = {None} if settings.query_engine == "sqlite" else set()
+            except Exception:
+                # Rimozione della tabella parziale
+                conn.rollback()
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+                conn.commit()
+                raise
+            finally:
+                conn.close()
+    
+    def _append(self, cleaned_chunks: Iterator[Tuple[List[str], pd.DataFrame]], ingest_stats: Dict[str, Any],
+                file_id: str, progress: Optional[ProgressCallback], started: float,
+                timer: StageTimer) -> Dict[str, Any]:
+        """
+        Accoda i blocchi puliti a un dataset esistente: inserimento delle sole
+        righe nuove nella tabella SQLite (gli indici SQLite si aggiornano da
+        soli), profilo unito a quello delle righe nuove e strutture derivate
+        estese invece che ricostruite
+        """
+        timer.operation = "append"
+        dataset = self.registry.get(file_id)
+        n_old = dataset.total_rows
+        
+        # Inserimento nella tabella SQLite, se già creata
+        new_chunks = self._append_chunks(cleaned_chunks, dataset, progress, timer)
+        report_progress(progress, "index", 0)
+        
+        # Righe nuove con la stessa rappresentazione compatta del dataset
+        with timer.stage("concat"):
+            data = concat_rows([dataset.data] + new_chunks)
+            new_rows = data.iloc[n_old:]
+        
+        index_started = time.perf_counter()
+        with timer.stage("profile"):
+            delta_profile = build_profile(new_rows, settings.profile_exact_max_rows)
+            # Valori distinti: registri HyperLogLog del dataset uniti a quelli delle righe nuove
+            registers = {
+                col: np.maximum(base_registers, hll_registers(new_rows[col]))
+                for col, base_registers in dataset.get_distinct_registers().items()
+            }
+            profile = merge_profiles(dataset.get_profile(), delta_profile, data, registers)
+        with timer.stage("index_update"):
+            extended = dataset.extended(data, new_rows, profile, registers)
+        with timer.stage("snapshot"):
+            self.registry.append(extended, new_rows)
+        self.result_cache.invalidate(file_id)
+        index_seconds = time.perf_counter() - index_started
+        
+        elapsed = time.perf_counter() - started
+        ROWS_PROCESSED.inc(len(new_rows), operation="append")
+        ingest_stats.update({
+            "append_to": file_id,
+            "appended_rows": len(new_rows),
+            "previous_rows": n_old,
+            "index_update_seconds": round(index_seconds, 4),
+            "stage_seconds": timer.finish(),
+            "total_seconds": round(elapsed, 4),
+            "total_rows_per_second": round(len(new_rows) / elapsed, 1) if elapsed > 0 else None
+        })
         
-        return df
+        return {
+            "success": True,
+            "file_id": file_id,
+            "total_rows": len(data),
+            "columns": data.columns.tolist(),
+            "preview_data": new_rows.head(10).to_dict('records'),
+            "original_columns": extended.original_columns,
+            "column_mapping": extended.get_column_mapping(),
+            "ingest_stats": ingest_stats
+        }
     
-    def _save_to_sqlite(self, df: pd.DataFrame, file_id: str):
-        """Salva il dataframe in SQLite per query efficienti"""
-        conn = sqlite3.connect(self.db_path)
+    def _append_chunks(self, cleaned_chunks: Iterator[Tuple[List[str], pd.DataFrame]], dataset: Dataset,
+                       progress: Optional[ProgressCallback] = None,
+                       timer: Optional[StageTimer] = None) -> List[pd.DataFrame]:
+        """
+        Inserisce i blocchi nella tabella SQLite del dataset in un'unica
+        transazione, annullata in caso di errore (gli indici esistenti si
+        aggiornano con le righe inserite). I blocchi sono prima letti e
+        validati tutti: il lock di scrittura resta tenuto solo per gli insert
+        """
+        timer = timer if timer is not None else StageTimer("append")
+        table_name = table_name_for(dataset.file_id)
+        stored_chunks: List[pd.DataFrame] = []
         
-        # Creazione tabella con nome univoco
-        table_name = f"data_{file_id.replace('-', '_')}"
-        
-        # Salvataggio dataframe
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        
-        # Creazione indici per performance
-        for col in df.columns:
-            if df[col].dtype in ['object', 'datetime64[ns]']:
-                try:
-                    # Usa il nome della colonna pulito per l'indice
-                    safe_col_name = col.replace('-', '_').replace(' ', '_')
-                    index_name = f"idx_{table_name}_{safe_col_name}"
-                    conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({col})")
-                except Exception as e:
-                    # Se la creazione dell'indice fallisce, continua senza crearlo
-                    print(f"Impossibile creare indice per colonna {col}: {e}")
-                    continue
+        for _, chunk in cleaned_chunks:
+            if chunk.columns.tolist() != dataset.columns:
+                raise ValueError(
+                    f"Le colonne del file non coincidono con quelle del dataset: "
+                    f"{', '.join(chunk.columns)} invece di {', '.join(dataset.columns)}"
+                )
+            # Colonne lette come testo riportate al tipo numerico del dataset
+            stored_chunks.append(align_numeric_columns(chunk, dataset.data))
         
-        conn.close()
+        with WRITE_LOCK:
+            conn = connect_for_load(
+                self.db_path, settings.sqlite_bulk_load, settings.sqlite_cache_size_mb, settings.sqlite_busy_timeout
+            )
+            try:
+                # Senza tabella (es. dopo clear_data) la ricrea _ensure_sql_table dallo snapshot
+                has_table = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+                ).fetchone() is not None
+                rows_stored = 0
+                for chunk in stored_chunks:
+                    if has_table:
+                        insert_rows(conn, table_name, chunk, timer)
+                    rows_stored += len(chunk)
+                    report_progress(progress, "store", rows_stored)
+                with timer.stage("sqlite_commit"):
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        
+        return stored_chunks
     
-    def get_data(self, filters: DataFilter) -> Dict[str, Any]:
+    def get_data(self, filters: DataFilter, file_id: Optional[str] = None) -> Dict[str, Any]:
         """Recupera dati con filtri applicati"""
-        if self.current_data is None:
-            return {"error": "Nessun file caricato"}
+        file_id = self.registry.resolve_id(file_id)
+        timer = StageTimer("data")
         
         try:
-            # Applicazione filtri
-            filtered_df = self._apply_filters(self.current_data, filters)
-            
-            # Ordinamento
-            if filters.sort_by and filters.sort_by in filtered_df.columns:
-                filtered_df = filtered_df.sort_values(
-                    by=filters.sort_by, 
-                    ascending=filters.sort_order == 'asc'
-                )
-            
-            # Paginazione
-            total_rows = len(filtered_df)
-            total_pages = (total_rows + filters.page_size - 1) // filters.page_size
-            
-            start_idx = (filters.page - 1) * filters.page_size
-            end_idx = start_idx + filters.page_size
-            
-            page_data = filtered_df.iloc[start_idx:end_idx]
-            
-            return {
-                "data": page_data.to_dict('records'),
-                "total_rows": total_rows,
-                "total_pages": total_pages,
-                "current_page": filters.page,
-                "page_size": filters.page_size,
-                "columns": self.current_data.columns.tolist(),
-                "filters_applied": filters
-            }
-            
-        except Exception as e:
+            page_data, meta = self.get_data_page(filters, file_id, timer)
+            with timer.stage("serialize"):
+                records = page_data.to_dict('records')
+            timer.finish()
+            return {"data": records, **meta}
+        except (ValueError, KeyError) as e:
+            # Solo errori di validazione dei filtri (es. colonna inesistente): gli altri arrivano al chiamante
             return {"error": str(e)}
     
-    def _apply_filters(self, df: pd.DataFrame, filters: DataFilter) -> pd.DataFrame:
-        """Applica i filtri al dataframe"""
-        filtered_df = df.copy()
+    def get_data_page(self, filters: DataFilter, file_id: Optional[str] = None,
+                      timer: Optional[StageTimer] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Pagina filtrata come dataframe, con i metadati di paginazione;
+        le fasi sono registrate su timer (il chiamante aggiunge la serializzazione)
+        """
+        file_id = self.registry.resolve_id(file_id)
+        timer = timer if timer is not None else StageTimer("data")
+        
+        # Pushdown della query sulla tabella SQLite, se configurato
+        # (il saldo progressivo richiede le somme prefisse in memoria)
+        if settings.query_engine == "sqlite" and not filters.running_balance:
+            self._ensure_sql_table(file_id)
+            self._ensure_sql_indexes(file_id, filters, timer)
+            with timer.stage("sql_query"):
+                page_data, meta = self.sql_engine.get_page(file_id, filters)
+            RESULT_ROWS.observe(meta["total_rows"], operation="data")
+            return page_data, meta
+        
+        dataset = self.registry.get(file_id)
+        
+        # Id riga filtrati e ordinati (dalla cache per le pagine successive)
+        row_ids = self._get_row_ids(dataset, filters, timer)
+        
+        # Paginazione
+        total_rows = len(row_ids)
+        total_pages = (total_rows + filters.page_size - 1) // filters.page_size
+        RESULT_ROWS.observe(total_rows, operation="data")
+        
+        start_idx = (filters.page - 1) * filters.page_size
+        end_idx = start_idx + filters.page_size
+        
+        # Proiezione: solo le colonne richieste vengono materializzate
+        with timer.stage("page"):
+            columns, positions = self._projection(dataset, filters)
+            page_data = dataset.data.iloc[row_ids[start_idx:end_idx], positions]
+        
+        # Saldo progressivo delle righe della pagina, letto dalle somme prefisse
+        if filters.running_balance:
+            with timer.stage("running_balance"):
+                date_column, amount_column = self._resolve_balance_columns(
+                    dataset, filters.date_column, filters.balance_column
+                )
+                page_data = page_data.assign(**{
+                    RUNNING_BALANCE_COLUMN: dataset.get_prefix_sums(date_column, amount_column).running_balance(
+                        row_ids[start_idx:end_idx]
+                    )
+                })
+            columns = columns + [RUNNING_BALANCE_COLUMN]
+        
+        return page_data, {
+            "total_rows": total_rows,
+            "total_pages": total_pages,
+            "current_page": filters.page,
+            "page_size": filters.page_size,
+            "columns": columns,
+            "filters_applied": filters
+        }
+    
+    def _projection(self, dataset: Dataset, filters: DataFilter) -> Tuple[List[str], List[int]]:
+        """Colonne richieste (default: tutte) e relative posizioni nel dataframe"""
+        if not filters.columns:
+            return dataset.columns, list(range(len(dataset.columns)))
+        
+        columns = list(dict.fromkeys(filters.columns))
+        unknown = [col for col in columns if col not in dataset.columns]
+        if unknown:
+            raise ValueError(f"Colonne non trovate: {', '.join(unknown)}")
+        return columns, [dataset.columns.index(col) for col in columns]
+    
+    def _search_columns(self, dataset: Dataset, filters: DataFilter) -> Optional[List[str]]:
+        """Colonne in cui cercare: quelle proiettate se richiesto, altrimenti tutte (None)"""
+        if filters.search and filters.search_columns_only and filters.columns:
+            return self._projection(dataset, filters)[0]
+        return None
+    
+    def _get_row_ids(self, dataset: Dataset, filters: DataFilter,
+                     timer: Optional[StageTimer] = None) -> np.ndarray:
+        """Restituisce le posizioni delle righe filtrate e ordinate, usando la cache"""
+        date_column = self._resolve_date_column(dataset, filters)
+        search_columns = self._search_columns(dataset, filters)
+        cache_key = (
+            dataset.file_id,
+            dataset.version,
+            filters.search,
+            tuple(search_columns) if search_columns else None,
+            date_column,
+            filters.date_from,
+            filters.date_to,
+            filters.sort_by,
+            filters.sort_order
+        )
+        row_ids = self.result_cache.get(cache_key)
+        if row_ids is None:
+            row_ids = self._filter_rows(dataset, filters, date_column, search_columns, timer)
+            self.result_cache.put(cache_key, row_ids)
+        return row_ids
+    
+    def _resolve_date_column(self, dataset: Dataset, filters: DataFilter) -> Optional[str]:
+        """Colonna su cui applicare l'intervallo di date (default: la prima datetime)"""
+        if not (filters.date_from or filters.date_to):
+            return None
+        date_columns = dataset.get_date_columns()
+        if filters.date_column:
+            if filters.date_column not in date_columns:
+                raise ValueError(f"La colonna '{filters.date_column}' non è una colonna di date")
+            return filters.date_column
+        return date_columns[0] if date_columns else None
+    
+    def _filter_rows(self, dataset: Dataset, filters: DataFilter, date_column: Optional[str] = None,
+                     search_columns: Optional[List[str]] = None,
+                     timer: Optional[StageTimer] = None) -> np.ndarray:
+        """Applica filtri e ordinamento, restituendo le posizioni delle righe"""
+        timer = timer if timer is not None else StageTimer("filter")
         
-        # Filtro ricerca globale
+        # Filtro ricerca globale tramite indice invertito
         if filters.search:
-            search_mask = pd.DataFrame([filtered_df[col].astype(str).str.contains(
-                filters.search, case=False, na=False
-            ) for col in filtered_df.columns]).any()
-            filtered_df = filtered_df[search_mask]
-        
-        # Filtro date
-        if filters.date_from:
-            date_columns = [col for col in filtered_df.columns if pd.api.types.is_datetime64_any_dtype(filtered_df[col])]
-            if date_columns:
-                date_mask = filtered_df[date_columns[0]] >= filters.date_from
-                filtered_df = filtered_df[date_mask]
+            with timer.stage("search"):
+                rows = dataset.get_search_index().search(filters.search, search_columns)
+        else:
+            rows = np.arange(dataset.total_rows)
         
-        if filters.date_to:
-            date_columns = [col for col in filtered_df.columns if pd.api.types.is_datetime64_any_dtype(filtered_df[col])]
-            if date_columns:
-                date_mask = filtered_df[date_columns[0]] <= filters.date_to
-                filtered_df = filtered_df[date_mask]
+        # Intervallo di date tramite ricerca binaria sull'indice ordinato della colonna
+        if date_column:
+            with timer.stage("date_filter"):
+                rows = dataset.get_date_index(date_column).filter_rows(rows, filters.date_from, filters.date_to)
         
-        return filtered_df
+        # Ordinamento tramite la permutazione precalcolata della colonna
+        if filters.sort_by and filters.sort_by in dataset.columns:
+            with timer.stage("sort"):
+                rows = dataset.get_sort_permutation(filters.sort_by).sort_rows(
+                    rows, ascending=filters.sort_order == 'asc'
+                )
+        
+        return rows
     
-    def get_columns_info(self) -> List[ColumnInfo]:
-        """Recupera informazioni dettagliate sulle colonne"""
-        if self.current_data is None:
-            return []
+    def get_export_preview(self, filters: DataFilter, file_id: Optional[str] = None) -> Dict[str, Any]:
+        """Anteprima dell'export ricavata dagli id riga in cache"""
+        dataset = self.registry.get(file_id)
+        row_ids = self._get_row_ids(dataset, filters)
+        columns, positions = self._projection(dataset, filters)
         
-        columns_info = []
-        for col in self.current_data.columns:
-            col_data = self.current_data[col]
-            
-            # Tipo di dato
-            dtype = str(col_data.dtype)
-            
-            # Valori di esempio (primi 5 non nulli)
-            sample_values = col_data.dropna().head(5).tolist()
-            
-            # Conteggio valori null
-            null_count = col_data.isnull().sum()
-            
-            # Conteggio valori unici
-            unique_count = col_data.nunique()
-            
-            columns_info.append(ColumnInfo(
-                name=col,
-                type=dtype,
-                sample_values=sample_values,
-                null_count=int(null_count),
-                unique_count=int(unique_count)
-            ))
+        # Stima proporzionale all'occupazione del dataset e alle colonne esportate
+        estimated_bytes = (
+            dataset.data_bytes * len(row_ids) / max(dataset.total_rows, 1)
+            * len(columns) / max(len(dataset.columns), 1)
+        )
         
-        return columns_info
+        return {
+            "total_rows_to_export": len(row_ids),
+            "columns_to_export": columns,
+            "preview_data": dataset.data.iloc[row_ids[:5], positions].to_dict('records'),
+            "estimated_file_size_mb": round(estimated_bytes / 1024 / 1024, 2)
+        }
     
-    def get_column_mapping(self) -> Dict[str, str]:
-        """Restituisce la mappatura tra nomi colonne originali e puliti"""
-        if not hasattr(self, '_original_columns') or self._original_columns is None:
-            return {}
+    def get_columns_info(self, file_id: Optional[str] = None) -> List[ColumnInfo]:
+        """Recupera informazioni dettagliate sulle colonne dal profilo del dataset"""
+        profile = self.registry.get(file_id).get_profile()
         
-        mapping = {}
-        for i, original_name in enumerate(self._original_columns):
-            if i < len(self.current_data.columns):
-                mapping[original_name] = self.current_data.columns[i]
+        return [
+            ColumnInfo(
+                name=col,
+                type=col_profile["type"],
+                sample_values=col_profile["sample_values"][:5],
+                null_count=col_profile["null_count"],
+                unique_count=col_profile["unique_count"]
+            )
+            for col, col_profile in profile["columns"].items()
+        ]
+    
+    def get_column_profile(self, column_name: str, file_id: Optional[str] = None) -> Dict[str, Any]:
+        """Profilo di una singola colonna; KeyError se la colonna non esiste"""
+        profile = self.registry.get(file_id).get_profile()
+        return {"name": column_name, **profile["columns"][column_name]}
+    
+    def get_data_stats(self, file_id: Optional[str] = None) -> Dict[str, Any]:
+        """Statistiche del dataset ricavate dal profilo calcolato all'ingest"""
+        dataset = self.registry.get(file_id)
+        profile = dataset.get_profile()
+        
+        return {
+            "total_rows": profile["total_rows"],
+            "total_columns": profile["total_columns"],
+            "memory_usage_mb": round(dataset.data_bytes / 1024 / 1024, 2),
+            "columns_info": profile["columns"]
+        }
+    
+    def _resolve_balance_columns(self, dataset: Dataset, date_column: Optional[str] = None,
+                                 amount_column: Optional[str] = None) -> Tuple[str, str]:
+        """Colonna data e colonna importo del saldo (default: la prima di ciascun tipo)"""
+        date_columns = dataset.get_date_columns()
+        amount_columns = dataset.get_amount_columns()
+        if date_column is not None and date_column not in date_columns:
+            raise ValueError(f"La colonna '{date_column}' non è una colonna di date")
+        if amount_column is not None and amount_column not in amount_columns:
+            raise ValueError(f"La colonna '{amount_column}' non è una colonna di importi")
+        if not date_columns or not amount_columns:
+            raise ValueError("Il dataset non ha una colonna di date e una di importi")
+        return date_column or date_columns[0], amount_column or amount_columns[0]
+    
+    def get_balance(self, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                    date_column: Optional[str] = None, amount_column: Optional[str] = None,
+                    opening_balance: float = 0.0, file_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Saldo a inizio e fine intervallo e totali (entrate, uscite, movimenti)
+        tra date_from e date_to inclusi, tramite ricerca binaria e differenza
+        di somme prefisse; senza date_from è il saldo alla data date_to
+        """
+        dataset = self.registry.get(file_id)
+        date_column, amount_column = self._resolve_balance_columns(dataset, date_column, amount_column)
+        totals = dataset.get_prefix_sums(date_column, amount_column).range_totals(date_from, date_to)
         
-        return mapping
+        return {
+            "date_column": date_column,
+            "amount_column": amount_column,
+            "date_from": date_from,
+            "date_to": date_to,
+            "opening_balance": opening_balance,
+            **totals,
+            "balance_before": opening_balance + totals["balance_before"],
+            "balance_after": opening_balance + totals["balance_after"]
+        }
     
-    def export_data(self, filters: DataFilter, format: str = "csv") -> str:
-        """Esporta i dati filtrati"""
-        if self.current_data is None:
-            raise ValueError("Nessun file caricato")
+    def aggregate_data(self, filters: DataFilter, group_by: List[str], measures: List[str],
+                       split_sign: bool = False, sort_by: Optional[str] = None, sort_order: str = "asc",
+                       limit: Optional[int] = None, file_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Totali raggruppati per periodo e/o colonna di testo sulle righe che
+        rispettano i filtri correnti; il risultato completo è in cache per
+        dataset, filtri, chiavi e misure, ordinamento e limite si applicano dopo
+        """
+        dataset = self.registry.get(file_id)
+        keys = parse_group_keys(group_by, dataset.data)
+        parsed_measures = parse_measures(measures or ["count"], dataset.data)
         
-        # Applicazione filtri
-        filtered_df = self._apply_filters(self.current_data, filters)
+        # L'ordinamento delle righe non cambia i totali: id riga in ordine naturale
+        unsorted_filters = filters.model_copy(update={"sort_by": None, "sort_order": "asc"})
+        cache_key = (
+            dataset.file_id,
+            dataset.version,
+            "aggregate",
+            filters.search,
+            tuple(self._search_columns(dataset, filters) or ()),
+            self._resolve_date_column(dataset, filters),
+            filters.date_from,
+            filters.date_to,
+            tuple(keys),
+            tuple(parsed_measures),
+            split_sign
+        )
+        timer = StageTimer("aggregate")
+        result = self.result_cache.get(cache_key)
+        cached = result is not None
+        if result is None:
+            row_ids = self._get_row_ids(dataset, unsorted_filters, timer)
+            RESULT_ROWS.observe(len(row_ids), operation="aggregate")
+            with timer.stage("group"):
+                result = aggregate(dataset.data, row_ids, keys, parsed_measures, split_sign)
+            self.result_cache.put(cache_key, result)
+        
+        if sort_by:
+            if sort_by not in result.columns:
+                raise ValueError(f"Colonna di ordinamento non presente nel risultato: {sort_by}")
+            result = result.sort_values(sort_by, ascending=sort_order == "asc", kind="stable")
+        limit = min(limit or settings.aggregate_max_groups, settings.aggregate_max_groups)
+        
+        with timer.stage("serialize"):
+            data = [
+                {col: to_json_value(value) for col, value in record.items()}
+                for record in result.head(limit).to_dict('records')
+            ]
+        timer.finish()
+        
+        return {
+            "group_by": list(result.columns[:len(keys)]),
+            "measures": list(result.columns[len(keys):]),
+            "total_groups": len(result),
+            "data": data,
+            "cached": cached
+        }
+    
+    def export_csv_stream(self, filters: DataFilter, file_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Export CSV in streaming: filtra subito (così gli errori emergono prima
+        della risposta) e restituisce un iteratore che serializza le righe a
+        blocchi di export_batch_rows, senza file temporanei
+        """
+        dataset = self.registry.get(file_id)
+        timer = StageTimer("export")
+        row_ids = self._get_row_ids(dataset, filters, timer)
+        RESULT_ROWS.observe(len(row_ids), operation="export")
+        _, positions = self._projection(dataset, filters)
+        return self._iter_csv_batches(dataset.data, row_ids, positions, settings.export_batch_rows, timer)
+    
+    def _iter_csv_batches(self, df: pd.DataFrame, row_ids: np.ndarray, positions: List[int],
+                          batch_rows: int, timer: Optional[StageTimer] = None) -> Iterator[str]:
+        """Serializza in CSV le righe e le colonne indicate, un blocco alla volta"""
+        timer = timer if timer is not None else StageTimer("export")
+        # Intestazione inviata subito, anche se il filtro non restituisce righe
+        yield df.iloc[:0, positions].to_csv(index=False)
+        for start in range(0, len(row_ids), batch_rows):
+            with timer.stage("serialize"):
+                batch = df.iloc[row_ids[start:start + batch_rows], positions].to_csv(index=False, header=False)
+            yield batch
+        timer.finish()
+    
+    def export_data(self, filters: DataFilter, format: str = "xlsx", file_id: Optional[str] = None) -> str:
+        """Esporta i dati filtrati in un file temporaneo (il chiamante lo elimina dopo l'invio)"""
+        dataset = self.registry.get(file_id)
+        timer = StageTimer("export")
         
-        # Generazione nome file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"export_{timestamp}.{format}"
-        filepath = os.path.join(settings.upload_folder, filename)
+        # Applicazione filtri e proiezione delle colonne
+        _, positions = self._projection(dataset, filters)
+        row_ids = self._get_row_ids(dataset, filters, timer)
+        RESULT_ROWS.observe(len(row_ids), operation="export")
+        filtered_df = dataset.data.iloc[row_ids, positions]
         
-        # Esportazione
-        if format.lower() == "csv":
-            filtered_df.to_csv(filepath, index=False, encoding='utf-8')
-        elif format.lower() == "xlsx":
-            filtered_df.to_excel(filepath, index=False)
+        fd, filepath = tempfile.mkstemp(prefix="export_", suffix=f".{format}")
+        os.close(fd)
+        try:
+            with timer.stage("serialize"):
+                if format.lower() == "csv":
+                    filtered_df.to_csv(filepath, index=False, encoding='utf-8')
+                elif format.lower() == "xlsx":
+                    filtered_df.to_excel(filepath, index=False)
+        except Exception:
+            os.unlink(filepath)
+            raise
         
+        timer.finish()
         return filepath
     
-    def clear_data(self):
-        """Pulisce i dati correnti"""
-        self.current_data = None
-        self.current_file_id = None
-        self._original_columns = None
+    def _sql_table_lock(self, file_id: str) -> threading.Lock:
+        """Lock della tabella SQLite di un dataset (creazione, ripristino, aggiunte, rimozione)"""
+        with self._sql_locks_guard:
+            return self._sql_locks.setdefault(file_id, threading.Lock())
+    
+    def _ensure_sql_table(self, file_id: str):
+        """
+        Ricrea la tabella SQLite dallo snapshot se è stata rimossa (es. dopo
+        clear_data); con più richieste concorrenti la ricrea una sola volta
+        """
+        if file_id in self._sql_tables:
+            return
         
-        # Rimozione database temporaneo
+        with self._sql_table_lock(file_id):
+            if file_id in self._sql_tables:
+                return
+            conn = sqlite3.connect(self.db_path)
+            try:
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name_for(file_id),)
+                ).fetchone()
+            finally:
+                conn.close()
+            if not exists:
+                timer = StageTimer("sqlite_restore")
+                self._load_sql_table(file_id, self.registry.get(file_id).data, timer)
+                timer.finish()
+            self._sql_tables.add(file_id)
+    
+    def _ensure_sql_indexes(self, file_id: str, filters: DataFilter, timer: StageTimer):
+        """
+        Crea al primo uso gli indici SQLite della colonna ordinata e della
+        colonna di date filtrata, invece di indicizzare tutto al caricamento
+        """
+        date_filter = bool(filters.date_from or filters.date_to)
+        requested = [filters.sort_by] if filters.sort_by else []
+        if date_filter:
+            requested.append(filters.date_column)
+        indexed = self._sql_indexes.get(file_id, set())
+        missing = [col for col in requested if col not in indexed]
+        if not missing:
+            return
+        
+        with self._sql_table_lock(file_id), WRITE_LOCK, timer.stage("sqlite_index"):
+            conn = connect_for_load(
+                self.db_path, settings.sqlite_bulk_load, settings.sqlite_cache_size_mb, settings.sqlite_busy_timeout
+            )
+            try:
+                ensure_indexes(conn, table_name_for(file_id), [col for col in missing if col], None in missing)
+                conn.commit()
+            finally:
+                conn.close()
+            self._sql_indexes.setdefault(file_id, set()).update(missing)
+    
+    def _drop_sql_table(self, file_id: str):
+        """Rimuove la tabella SQLite di un dataset"""
+        with self._sql_table_lock(file_id), WRITE_LOCK:
+            conn = sqlite3.connect(self.db_path, timeout=settings.sqlite_busy_timeout)
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name_for(file_id))}")
+                conn.commit()
+            finally:
+                conn.close()
+            self._sql_tables.discard(file_id)
+            self._sql_indexes.pop(file_id, None)
+    
+    def clear_data(self, file_id: Optional[str] = None):
+        """Scarica dalla memoria un dataset (o tutti); gli snapshot restano riapribili"""
+        if file_id is not None:
+            self.registry.unload(file_id)
+            self.result_cache.invalidate(file_id)
+            self._drop_sql_table(file_id)
+            return
+        
+        self.registry.unload()
+        self.result_cache.invalidate()
+        self._sql_tables.clear()
+        self._sql_indexes.clear()
+        
+        # Rimozione database temporaneo, con i file del WAL
         if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+            for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
             self._init_db()
+    
+    def delete_dataset(self, file_id: str):
+        """Elimina definitivamente un dataset, il suo snapshot e la tabella SQLite"""
+        self.registry.remove(file_id)
+        self.result_cache.invalidate(file_id)
+        self._drop_sql_table(file_id)
+    
+    def get_datasets(self) -> Dict[str, Any]:
+        """Elenco dei dataset registrati con la relativa occupazione di memoria"""
+        return {
+            "datasets": [dataset.info() for dataset in self.registry.list_datasets()],
+            **self.registry.stats()
+        }
 
 # Istanza globale del servizio
 data_service = DataService()
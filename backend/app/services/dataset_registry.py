@@ -0,0 +1,377 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.profile import build_profile, hll_registers
+from app.services.search_index import SearchIndex
+from app.services.ingestion import is_amount_column
+from app.services.sort_index import DateIndex, PrefixSumIndex, SortPermutation
+from app.services.snapshot_store import SnapshotStore
+from app.services.metrics import STAGE_SECONDS
+
+
+class DatasetNotFoundError(LookupError):
+    """Il file_id richiesto non corrisponde ad alcun dataset registrato"""
+
+
+class Dataset:
+    """Un dataset registrato con le strutture derivate (indice di ricerca)"""
+
+    def __init__(self, file_id: str, data: Optional[pd.DataFrame], original_columns: List[str],
+                 search_index: Optional[SearchIndex] = None, columns: Optional[List[str]] = None,
+                 total_rows: Optional[int] = None, created_at: Optional[float] = None,
+                 profile: Optional[Dict[str, Any]] = None):
+        self.file_id = file_id
+        self.data = data
+        self.original_columns = original_columns
+        self.columns: List[str] = columns if columns is not None else data.columns.tolist()
+        self.total_rows = total_rows if total_rows is not None else len(data)
+        self.search_index = search_index
+        self.sort_permutations: Dict[str, SortPermutation] = {}
+        self.date_indexes: Dict[str, DateIndex] = {}
+        self.prefix_sums: Dict[Tuple[str, str], PrefixSumIndex] = {}
+        self.distinct_registers: Dict[str, np.ndarray] = {}
+        self._date_columns: Optional[List[str]] = None
+        self.profile = profile
+        # Versione delle righe, incrementata a ogni aggiunta: fa parte delle chiavi della cache dei
+        # risultati, così una richiesta ancora in corso sulla versione precedente non vi rimette voci vecchie
+        self.version = 0
+        self.created_at = created_at if created_at is not None else time.time()
+        self.last_access = self.created_at
+        self.data_bytes = 0
+        self.index_bytes = 0
+        self.refresh_memory()
+
+    @classmethod
+    def from_catalog(cls, entry: Dict[str, Any]) -> "Dataset":
+        """Dataset non ancora caricato, ricostruito da una voce di catalogo"""
+        return cls(
+            file_id=entry["file_id"],
+            data=None,
+            original_columns=entry.get("original_columns", []),
+            columns=entry["columns"],
+            total_rows=entry["total_rows"],
+            created_at=entry["created_at"],
+            profile=entry.get("profile")
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self.data is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.data_bytes + self.index_bytes
+
+    def refresh_memory(self):
+        """Aggiorna l'occupazione in memoria del dataframe e dell'indice di ricerca"""
+        if self.data is None:
+            return
+        self.data_bytes = int(self.data.memory_usage(deep=True).sum())
+        self.index_bytes = self.search_index.memory_usage() if self.search_index is not None else 0
+        self.index_bytes += sum(p.memory_usage() for p in self.sort_permutations.values())
+        self.index_bytes += sum(i.memory_usage() for i in self.date_indexes.values())
+        self.index_bytes += sum(p.memory_usage() for p in self.prefix_sums.values())
+        self.index_bytes += sum(r.nbytes for r in self.distinct_registers.values())
+
+    def get_search_index(self) -> SearchIndex:
+        """Indice di ricerca, costruito alla prima richiesta se il dataset è stato riaperto"""
+        if self.search_index is None:
+            self.search_index = SearchIndex(self.data)
+            self.refresh_memory()
+        return self.search_index
+
+    def get_sort_permutation(self, column: str) -> SortPermutation:
+        """Permutazione ordinata della colonna, calcolata al primo ordinamento richiesto"""
+        if column not in self.sort_permutations:
+            self.sort_permutations[column] = SortPermutation(self.data[column])
+            self.refresh_memory()
+        return self.sort_permutations[column]
+
+    def get_date_columns(self) -> List[str]:
+        """Colonne datetime del dataset, nell'ordine del file"""
+        if self._date_columns is None:
+            self._date_columns = [
+                col for col in self.data.columns if pd.api.types.is_datetime64_any_dtype(self.data[col])
+            ]
+        return self._date_columns
+
+    def get_date_index(self, column: str) -> DateIndex:
+        """Indice ordinato della colonna datetime, costruito sulla sua permutazione"""
+        if column not in self.date_indexes:
+            self.date_indexes[column] = DateIndex(self.data[column], self.get_sort_permutation(column))
+            self.refresh_memory()
+        return self.date_indexes[column]
+
+    def get_amount_columns(self) -> List[str]:
+        """Colonne numeriche di importi (riconosciute dal nome, come in fase di pulizia)"""
+        return [
+            col for col in self.columns
+            if is_amount_column(col) and pd.api.types.is_numeric_dtype(self.data[col])
+            and not pd.api.types.is_bool_dtype(self.data[col])
+        ]
+
+    def get_prefix_sums(self, date_column: str, amount_column: str) -> PrefixSumIndex:
+        """Somme prefisse degli importi nell'ordine della colonna data"""
+        key = (date_column, amount_column)
+        if key not in self.prefix_sums:
+            self.prefix_sums[key] = PrefixSumIndex(self.get_date_index(date_column), self.data[amount_column])
+            self.refresh_memory()
+        return self.prefix_sums[key]
+
+    def get_profile(self) -> Dict[str, Any]:
+        """Profilo delle colonne, calcolato qui solo per snapshot salvati senza profilo"""
+        if self.profile is None:
+            self.profile = build_profile(self.data, settings.profile_exact_max_rows)
+        return self.profile
+
+    def get_distinct_registers(self) -> Dict[str, np.ndarray]:
+        """
+        Registri HyperLogLog per colonna, calcolati alla prima aggiunta di
+        righe e poi uniti a quelli delle righe nuove
+        """
+        missing = [col for col in self.columns if col not in self.distinct_registers]
+        if missing:
+            for col in missing:
+                self.distinct_registers[col] = hll_registers(self.data[col])
+            self.refresh_memory()
+        return self.distinct_registers
+
+    def extended(self, data: pd.DataFrame, new_rows: pd.DataFrame, profile: Optional[Dict[str, Any]],
+                 distinct_registers: Optional[Dict[str, np.ndarray]] = None) -> "Dataset":
+        """
+        Nuovo oggetto Dataset con le righe accodate: l'indice di ricerca si
+        estende con le sole righe nuove, così come permutazioni, indici delle
+        date e somme prefisse quando i nuovi valori non precedono i vecchi
+        (gli altri si ricalcolano alla prima richiesta)
+        """
+        search_index = self.search_index.extended(data) if self.search_index is not None else None
+        dataset = Dataset(
+            self.file_id, data, self.original_columns, search_index,
+            created_at=self.created_at, profile=profile
+        )
+        dataset.version = self.version + 1
+        dataset.distinct_registers = dict(distinct_registers or {})
+        for column, permutation in self.sort_permutations.items():
+            extended = permutation.extended(data[column])
+            if extended is not None:
+                dataset.sort_permutations[column] = extended
+        for column, date_index in self.date_indexes.items():
+            if column in dataset.sort_permutations:
+                dataset.date_indexes[column] = date_index.extended(data[column], dataset.sort_permutations[column])
+        for (date_column, amount_column), prefix_sums in self.prefix_sums.items():
+            if date_column in dataset.date_indexes:
+                dataset.prefix_sums[(date_column, amount_column)] = prefix_sums.extended(
+                    dataset.date_indexes[date_column], data[amount_column]
+                )
+        dataset.refresh_memory()
+        return dataset
+
+    def get_column_mapping(self) -> Dict[str, str]:
+        """Restituisce la mappatura tra nomi colonne originali e puliti"""
+        if not self.original_columns:
+            return {}
+
+        mapping = {}
+        for i, original_name in enumerate(self.original_columns):
+            if i < len(self.columns):
+                mapping[original_name] = self.columns[i]
+
+        return mapping
+
+    def info(self) -> Dict[str, Any]:
+        """Metadati del dataset esposti dall'API"""
+        return {
+            "file_id": self.file_id,
+            "total_rows": self.total_rows,
+            "columns": self.columns,
+            "loaded": self.loaded,
+            "memory_usage_mb": round(self.memory_bytes / 1024 / 1024, 2),
+            "created_at": self.created_at,
+            "last_access": self.last_access
+        }
+
+
+class DatasetRegistry:
+    """
+    Registro dei dataset indicizzati per file_id con budget di memoria.
+
+    Ogni dataset ha uno snapshot colonnare su disco: quando la memoria
+    complessiva supera il budget, i dataset usati meno di recente vengono
+    scaricati e riaperti dallo snapshot alla prima richiesta. All'avvio il
+    registro riparte dal catalogo degli snapshot, senza caricare nulla.
+    """
+
+    def __init__(self, memory_budget_bytes: int, store: SnapshotStore):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.store = store
+        self._datasets: "OrderedDict[str, Dataset]" = OrderedDict()
+        self._latest_file_id: Optional[str] = None
+        self._lock = threading.RLock()
+        # Riaperture dallo snapshot in corso, una per dataset
+        self._loading: Dict[str, threading.Lock] = {}
+        self.evictions = 0
+        self.reloads = 0
+        self.last_reload_seconds: Optional[float] = None
+
+        entries = self.store.entries()
+        for entry in entries:
+            self._datasets[entry["file_id"]] = Dataset.from_catalog(entry)
+        # Dopo un riavvio il dataset di default è l'ultimo creato o esteso
+        if entries:
+            latest = max(entries, key=lambda e: e.get("updated_at", e["created_at"]))
+            self._latest_file_id = latest["file_id"]
+
+    @property
+    def latest_file_id(self) -> Optional[str]:
+        """file_id dell'ultimo dataset caricato"""
+        return self._latest_file_id
+
+    def add(self, dataset: Dataset):
+        """Registra un nuovo dataset salvandone lo snapshot, liberando memoria se necessario"""
+        self.store.save(dataset.file_id, dataset.data, {
+            "original_columns": dataset.original_columns,
+            "profile": dataset.profile
+        })
+        with self._lock:
+            self._datasets[dataset.file_id] = dataset
+            self._latest_file_id = dataset.file_id
+            self._enforce_budget(keep=dataset.file_id)
+
+    def append(self, dataset: Dataset, new_rows: pd.DataFrame):
+        """Sostituisce un dataset con la sua versione estesa, accodando le righe nuove allo snapshot"""
+        self.store.append(dataset.file_id, new_rows, dataset.data, {
+            "original_columns": dataset.original_columns,
+            "profile": dataset.profile
+        })
+        with self._lock:
+            self._datasets[dataset.file_id] = dataset
+            self._datasets.move_to_end(dataset.file_id)
+            self._latest_file_id = dataset.file_id
+            self._enforce_budget(keep=dataset.file_id)
+
+    def resolve_id(self, file_id: Optional[str] = None) -> str:
+        """Risolve il file_id richiesto (default: ultimo caricato) senza caricare i dati"""
+        with self._lock:
+            if file_id is None:
+                if self._latest_file_id is None:
+                    raise ValueError("Nessun file caricato")
+                return self._latest_file_id
+            if file_id not in self._datasets:
+                raise DatasetNotFoundError(f"Dataset '{file_id}' non trovato")
+            return file_id
+
+    def get(self, file_id: Optional[str] = None) -> Dataset:
+        """
+        Restituisce il dataset in memoria, riaprendolo dallo snapshot se
+        necessario. La lettura dal disco avviene fuori dal lock del registro:
+        le richieste su altri dataset non attendono, quelle sullo stesso
+        dataset attendono un'unica riapertura.
+        """
+        while True:
+            with self._lock:
+                file_id = self.resolve_id(file_id)
+                dataset = self._datasets[file_id]
+                if dataset.loaded:
+                    dataset.last_access = time.time()
+                    self._datasets.move_to_end(file_id)
+                    return dataset
+                loading = self._loading.setdefault(file_id, threading.Lock())
+
+            with loading:
+                with self._lock:
+                    # Riaperto da un'altra richiesta mentre si attendeva
+                    if self._datasets[self.resolve_id(file_id)].loaded:
+                        continue
+                started = time.perf_counter()
+                try:
+                    data = self.store.load(file_id)
+                except Exception:
+                    with self._lock:
+                        self._loading.pop(file_id, None)
+                    raise
+                seconds = time.perf_counter() - started
+                with self._lock:
+                    self._loading.pop(file_id, None)
+                    dataset = self._datasets[self.resolve_id(file_id)]
+                    # Sostituito nel frattempo da una versione già in memoria (es. righe accodate)
+                    if not dataset.loaded:
+                        dataset.data = data
+                        dataset.refresh_memory()
+                        STAGE_SECONDS.observe(seconds, operation="snapshot", stage="reload")
+                        self.last_reload_seconds = round(seconds, 4)
+                        self.reloads += 1
+                        self._enforce_budget(keep=file_id)
+
+    def unload(self, file_id: Optional[str] = None) -> List[str]:
+        """Scarica dalla memoria un dataset (o tutti), mantenendone lo snapshot"""
+        with self._lock:
+            file_ids = [self.resolve_id(file_id)] if file_id is not None else list(self._datasets)
+            for fid in file_ids:
+                if self._datasets[fid].loaded:
+                    self._release(self._datasets[fid])
+            if file_id is None or self._latest_file_id == file_id:
+                self._latest_file_id = None
+            return file_ids
+
+    def remove(self, file_id: str) -> Dataset:
+        """Rimuove definitivamente un dataset e il suo snapshot"""
+        with self._lock:
+            dataset = self._datasets.pop(self.resolve_id(file_id))
+            self.store.remove(file_id)
+            if self._latest_file_id == file_id:
+                self._latest_file_id = None
+            return dataset
+
+    def list_datasets(self) -> List[Dataset]:
+        """Dataset registrati, dal più al meno recentemente usato"""
+        with self._lock:
+            return list(reversed(self._datasets.values()))
+
+    def memory_usage(self) -> int:
+        """Memoria occupata dai dataset attualmente caricati"""
+        with self._lock:
+            return sum(d.memory_bytes for d in self._datasets.values() if d.loaded)
+
+    def _enforce_budget(self, keep: str):
+        """Scarica i dataset meno recenti finché la memoria rientra nel budget"""
+        for file_id in list(self._datasets):
+            if self.memory_usage() <= self.memory_budget_bytes:
+                break
+            dataset = self._datasets[file_id]
+            if file_id != keep and dataset.loaded:
+                self._release(dataset)
+                self.evictions += 1
+
+    def _release(self, dataset: Dataset):
+        """Libera la memoria di un dataset: lo snapshot su disco resta la copia di riferimento"""
+        # Le richieste in corso mantengono il riferimento all'oggetto originale
+        released = copy.copy(dataset)
+        released.data = None
+        released.search_index = None
+        released.sort_permutations = {}
+        released.date_indexes = {}
+        released.prefix_sums = {}
+        released.distinct_registers = {}
+        released.data_bytes = 0
+        released.index_bytes = 0
+        self._datasets[dataset.file_id] = released
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche di occupazione del registro"""
+        with self._lock:
+            return {
+                "total_datasets": len(self._datasets),
+                "loaded": sum(1 for d in self._datasets.values() if d.loaded),
+                "memory_usage_mb": round(self.memory_usage() / 1024 / 1024, 2),
+                "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 2),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "last_reload_seconds": self.last_reload_seconds
+            }
@@ -0,0 +1,128 @@
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.ingestion import is_amount_column, is_description_column
+
+# Modalità di gestione dei duplicati: scartati oppure segnalati in una colonna
+DEDUP_MODES = ("drop", "flag")
+# Colonna booleana aggiunta in modalità flag
+DUPLICATE_COLUMN = "duplicato"
+
+
+def fingerprint_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Colonne dell'impronta: prima colonna data, primo importo e prima
+    descrizione; se nessuna è riconoscibile, tutte le colonne
+    """
+    date_column = next((c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None)
+    amount_column = next(
+        (c for c in df.columns if is_amount_column(c) and pd.api.types.is_numeric_dtype(df[c])), None
+    )
+    description_column = next((c for c in df.columns if is_description_column(c)), None)
+    columns = [c for c in (date_column, amount_column, description_column) if c is not None]
+    return columns or list(df.columns)
+
+
+def normalize_text(series: pd.Series) -> pd.Series:
+    """Minuscolo, solo lettere e cifre, spazi compattati (es. "BONIFICO  a/f" -> "bonifico a f")"""
+    text = series.astype(str).str.lower()
+    text = text.str.replace(r'[^0-9a-zà-ÿ]+', ' ', regex=True).str.strip()
+    return text.where(series.notna(), '')
+
+
+def row_fingerprints(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """
+    Impronta a 64 bit di ogni riga: data al giorno, importo in centesimi e
+    testo normalizzato, combinati con l'hash vettoriale di pandas
+    """
+    normalized: Dict[str, Any] = {}
+    for col in columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            days = values.to_numpy(dtype="datetime64[us]").astype("datetime64[D]")
+            normalized[col] = days.view(np.int64)
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            cents = np.round(values.to_numpy(dtype=np.float64, na_value=np.nan) * 100)
+            normalized[col] = np.where(np.isnan(cents), np.iinfo(np.int64).min, cents).astype(np.int64)
+        else:
+            normalized[col] = normalize_text(values).to_numpy(dtype=object)
+    frame = pd.DataFrame(normalized)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+
+class DuplicateDetector:
+    """
+    Riconosce le righe di un nuovo caricamento già presenti in un dataset.
+
+    Le impronte del dataset esistente sono contate una volta sola; ogni
+    blocco di righe nuove viene confrontato tramite tabelle hash (O(n), senza
+    confronti a coppie). Le ripetizioni sono contate: se il dataset contiene
+    due movimenti identici e il nuovo file tre, solo i primi due sono
+    duplicati, così da non perdere operazioni realmente ripetute.
+    """
+
+    def __init__(self, existing: pd.DataFrame, mode: str = "drop"):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Modalità deduplica non valida: {mode}. Usa {', '.join(DEDUP_MODES)}")
+        started = time.perf_counter()
+        self.mode = mode
+        self.columns = fingerprint_columns(existing)
+        # Colonne numeriche del dataset: nei blocchi di un CSV arrivano come testo
+        self.numeric_columns = [
+            col for col in self.columns
+            if pd.api.types.is_numeric_dtype(existing[col]) and not pd.api.types.is_bool_dtype(existing[col])
+        ]
+        self.existing_counts = pd.Series(row_fingerprints(existing, self.columns)).value_counts()
+        self.seen_counts = pd.Series(dtype=np.int64)
+        self.checked_rows = 0
+        self.duplicate_rows = 0
+        self.seconds = time.perf_counter() - started
+
+    def find_duplicates(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Maschera delle righe del blocco già presenti nel dataset esistente"""
+        missing = [col for col in self.columns if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Colonne mancanti per il confronto dei duplicati: {', '.join(missing)}")
+
+        values = chunk[self.columns]
+        for col in self.numeric_columns:
+            if pd.api.types.is_string_dtype(values[col]):
+                values = values.assign(**{col: pd.to_numeric(values[col], errors='coerce')})
+        fingerprints = pd.Series(row_fingerprints(values, self.columns))
+        # Occorrenza della riga tra quelle con la stessa impronta, contando i blocchi precedenti
+        occurrence = (
+            fingerprints.groupby(fingerprints, sort=False).cumcount().to_numpy()
+            + self.seen_counts.reindex(fingerprints).fillna(0).to_numpy(dtype=np.int64)
+        )
+        available = self.existing_counts.reindex(fingerprints).fillna(0).to_numpy(dtype=np.int64)
+        self.seen_counts = self.seen_counts.add(fingerprints.value_counts(), fill_value=0)
+        return occurrence < available
+
+    def filter_chunks(self, cleaned_chunks: Iterator[Tuple[List[str], pd.DataFrame]]
+                      ) -> Iterator[Tuple[List[str], pd.DataFrame]]:
+        """Scarta o segnala i duplicati in ogni blocco già pulito"""
+        for original_columns, chunk in cleaned_chunks:
+            started = time.perf_counter()
+            duplicates = self.find_duplicates(chunk)
+            self.checked_rows += len(chunk)
+            self.duplicate_rows += int(duplicates.sum())
+            if self.mode == "drop":
+                chunk = chunk[~duplicates]
+            else:
+                chunk = chunk.assign(**{DUPLICATE_COLUMN: duplicates})
+            self.seconds += time.perf_counter() - started
+            yield original_columns, chunk
+
+    def stats(self, against: Optional[str] = None) -> Dict[str, Any]:
+        """Riepilogo della deduplica per le statistiche di ingest"""
+        return {
+            "against": against,
+            "mode": self.mode,
+            "fingerprint_columns": self.columns,
+            "checked_rows": self.checked_rows,
+            "duplicate_rows": self.duplicate_rows,
+            "seconds": round(self.seconds, 4)
+        }
@@ -0,0 +1,247 @@
+import datetime
+import logging
+import posixpath
+import re
+import time
+import zipfile
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+try:
+    # Lettore Excel in Rust: legge il foglio in streaming senza il modello a oggetti di openpyxl
+    from python_calamine import CalamineWorkbook
+except ImportError:  # pragma: no cover - dipendenza opzionale
+    CalamineWorkbook = None
+
+logger = logging.getLogger(__name__)
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Intervallo dichiarato all'inizio dell'XML del foglio, es. <dimension ref="A1:H50001"/>
+_DIMENSION_PATTERN = re.compile(rb'<(?:\w+:)?dimension\s+ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"')
+
+
+def _column_number(letters: bytes) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + letter - ord('A') + 1
+    return number
+
+
+def _xlsx_dimensions(file_path: str) -> Dict[str, Optional[int]]:
+    """
+    Celle dichiarate da ogni foglio di un .xlsx, lette dal tag dimension in
+    testa all'XML del foglio senza leggerne i dati (None se assente)
+    """
+    dimensions: Dict[str, Optional[int]] = {}
+    with zipfile.ZipFile(file_path) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in relationships.iter(f"{_PACKAGE_REL_NS}Relationship")}
+        for sheet in workbook.iter(f"{_MAIN_NS}sheet"):
+            target = targets.get(sheet.get(f"{_REL_NS}id"), "")
+            member = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            try:
+                with archive.open(member) as f:
+                    match = _DIMENSION_PATTERN.search(f.read(4096))
+            except KeyError:
+                match = None
+            if match is None:
+                dimensions[sheet.get("name")] = None
+                continue
+            first_col, first_row, last_col, last_row = match.groups()
+            rows = int(last_row or first_row) - int(first_row) + 1
+            cols = _column_number(last_col or first_col) - _column_number(first_col) + 1
+            dimensions[sheet.get("name")] = rows * cols
+    return dimensions
+
+
+def _pick_sheet_calamine(file_path: str, file_type: str) -> Tuple[str, int]:
+    """
+    Sceglie il foglio con più celle (a parità, il primo). Con un solo foglio
+    non serve leggere nulla; per gli .xlsx bastano le dimensioni dichiarate,
+    mentre i fogli senza dimensione e i .xls vanno letti (solo per contarne
+    le celle: il foglio scelto è poi letto da read_excel)
+    """
+    workbook = CalamineWorkbook.from_path(file_path)
+    try:
+        names = workbook.sheet_names
+        if len(names) == 1:
+            return names[0], -1
+        dimensions: Dict[str, Optional[int]] = {}
+        if file_type.lower() == 'xlsx':
+            try:
+                dimensions = _xlsx_dimensions(file_path)
+            except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+                dimensions = {}
+
+        best_name, best_cells = names[0], -1
+        for name in names:
+            cells = dimensions.get(name)
+            if cells is None:
+                sheet = workbook.get_sheet_by_name(name)
+                cells = sheet.height * sheet.width
+            if cells > best_cells:
+                best_name, best_cells = name, cells
+        return best_name, best_cells
+    finally:
+        workbook.close()
+
+
+def _is_missing(values: np.ndarray) -> np.ndarray:
+    """Celle vuote o con i marcatori di valore mancante di read_excel ("", "NA", "#N/A"...)"""
+    return pd.Series(values, dtype=object).isin(STR_NA_VALUES).to_numpy()
+
+
+def _convert_cell(value: Any) -> Any:
+    """Come read_excel: numeri senza decimali come interi, date come datetime"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+
+def _typed_column(values: np.ndarray, missing: np.ndarray) -> Any:
+    """
+    Array tipizzato di una colonna a partire dalle celle lette da calamine,
+    con i tipi che darebbe read_excel: booleani, numeri (interi se senza
+    decimali né valori mancanti, i booleani come 0/1), date, testo (quello
+    solo numerico diventa numero) o, per le colonne miste, oggetti con le
+    celle convertite (missing: celle vuote o mancanti)
+    """
+    if len(values) == 0:
+        return values
+    kinds = set(map(type, values[~missing]))
+    if kinds == {bool} and not missing.any():
+        return values.astype(bool)
+    if kinds <= {float, int, bool}:
+        numbers = values.copy()
+        numbers[missing] = np.nan
+        numbers = numbers.astype(np.float64)
+        if not missing.any() and np.all(np.abs(numbers) < 2 ** 63) and np.all(numbers == np.trunc(numbers)):
+            return numbers.astype(np.int64)
+        return numbers
+    if kinds <= {datetime.date, datetime.datetime}:
+        dates = values.copy()
+        dates[missing] = None
+        return pd.to_datetime(dates).as_unit('us').to_numpy()
+
+    if kinds == {str}:
+        converted = values.copy()
+    else:
+        converted = np.array([_convert_cell(value) for value in values], dtype=object)
+    converted[missing] = np.nan
+    if str in kinds:
+        try:
+            return pd.to_numeric(converted, errors='raise')
+        except (ValueError, TypeError):
+            pass
+    if kinds == {str}:
+        return pd.array(converted, dtype="str")
+    return converted
+
+
+def _column_names(header: List[Any]) -> List[Any]:
+    """Nomi di colonna come in read_excel: "Unnamed: i" per i vuoti, suffissi ".1", ".2" per i duplicati"""
+    names = [
+        f"Unnamed: {i}" if name is None or name == "" else _convert_cell(name)
+        for i, name in enumerate(header)
+    ]
+    counts: Dict[Any, int] = defaultdict(int)
+    for i, name in enumerate(names):
+        count = counts[name]
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts[name]
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def _read_sheet_calamine(file_path: str, sheet_name: str) -> pd.DataFrame:
+    """
+    Legge il foglio con calamine costruendo direttamente una colonna
+    tipizzata per ogni colonna del foglio, senza il parser di testo di
+    read_excel, che reinterpreta cella per cella righe già tipizzate
+    """
+    workbook = CalamineWorkbook.from_path(file_path)
+    try:
+        rows = workbook.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+    finally:
+        workbook.close()
+
+    if not rows or not rows[0]:
+        return pd.DataFrame()
+    # Il foglio è un rettangolo di celle: una matrice di oggetti, una colonna per volta
+    cells = np.empty((len(rows), len(rows[0])), dtype=object)
+    cells[:] = rows
+    # Prima riga come intestazione; le righe vuote restano (le rimuove la pulizia), come in read_excel
+    names = _column_names(cells[0].tolist())
+    return pd.DataFrame({
+        name: _typed_column(cells[1:, col], _is_missing(cells[1:, col])) for col, name in enumerate(names)
+    })
+
+
+def _pick_sheet_openpyxl(file_path: str) -> Tuple[str, int]:
+    """Sceglie il foglio con la dimensione dichiarata maggiore (a parità, il primo)"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        best_name, best_cells = workbook.sheetnames[0], -1
+        for worksheet in workbook.worksheets:
+            cells = (worksheet.max_row or 0) * (worksheet.max_column or 0)
+            if cells > best_cells:
+                best_name, best_cells = worksheet.title, cells
+        return best_name, best_cells
+    finally:
+        workbook.close()
+
+
+def read_excel_file(file_path: str, file_type: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Legge un file .xlsx/.xls scegliendo automaticamente il foglio con i dati.
+
+    Usa calamine quando disponibile, costruendo le colonne tipizzate
+    direttamente dalle celle (stessi tipi di read_excel), e ricade su
+    read_excel con openpyxl in modalità read-only altrimenti. Restituisce il dataframe e le statistiche
+    di lettura (motore, foglio, righe/secondo).
+    """
+    started = time.perf_counter()
+
+    engine: Optional[str]
+    if CalamineWorkbook is not None:
+        engine = "calamine"
+        sheet_name, _ = _pick_sheet_calamine(file_path, file_type)
+    elif file_type.lower() == 'xlsx':
+        engine = "openpyxl"
+        sheet_name, _ = _pick_sheet_openpyxl(file_path)
+    else:
+        # .xls senza calamine: motore predefinito di pandas, primo foglio
+        engine = None
+        sheet_name = 0
+
+    if engine == "calamine":
+        df = _read_sheet_calamine(file_path, sheet_name)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine=engine)
+
+    elapsed = time.perf_counter() - started
+    read_info = {
+        "engine": engine or "default",
+        "sheet": sheet_name,
+        "rows": len(df),
+        "read_seconds": round(elapsed, 4),
+        "rows_per_second": round(len(df) / elapsed, 1) if elapsed > 0 else None
+    }
+    logger.info("Lettura Excel (%s, foglio '%s'): %d righe in %.2fs (%s righe/s)",
+                read_info['engine'], sheet_name, len(df), elapsed, read_info['rows_per_second'])
+    return df, read_info
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.profiling import current_profile
+
+
+# Fine dell'iteratore consumato sul pool
+_EXHAUSTED = object()
+
+
+class ExecutorSaturatedError(Exception):
+    """Troppe richieste in corso o in coda per l'endpoint"""
+
+
+class EndpointLimiter:
+    """Limite di concorrenza e coda di attesa di un endpoint, con le latenze osservate"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, latency_window: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        # Latenze (attesa in coda + esecuzione) e sola attesa, in secondi
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        self.queue_waits: Deque[float] = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semaforo legato all'event loop corrente (ricreato se il loop cambia)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._semaphore
+
+    async def acquire(self) -> float:
+        """
+        Attende un posto libero per l'endpoint e restituisce l'attesa in coda;
+        rifiuta subito la richiesta se anche la coda è piena
+        """
+        with self._lock:
+            if self.running >= self.max_concurrent and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Troppe richieste in corso per '{self.name}', riprovare più tardi"
+                )
+            self.waiting += 1
+
+        started = time.perf_counter()
+        try:
+            await self._get_semaphore().acquire()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.running += 1
+        return time.perf_counter() - started
+
+    def release(self, latency: float, queue_wait: float):
+        """Libera il posto e registra la latenza della richiesta"""
+        self._semaphore.release()
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.latencies.append(latency)
+            self.queue_waits.append(queue_wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori e percentili di latenza (ms) sulla finestra recente"""
+        with self._lock:
+            latencies = np.array(self.latencies, dtype=float) * 1000
+            queue_waits = np.array(self.queue_waits, dtype=float) * 1000
+            stats = {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update({
+                "latency_p50_ms": round(float(p50), 2),
+                "latency_p95_ms": round(float(p95), 2),
+                "latency_p99_ms": round(float(p99), 2),
+                "latency_max_ms": round(float(latencies.max()), 2),
+                "queue_wait_p95_ms": round(float(np.percentile(queue_waits, 95)), 2)
+            })
+        return stats
+
+
+class WorkExecutor:
+    """
+    Pool di thread limitato su cui gli endpoint eseguono il lavoro sincrono
+    di DataService, così l'event loop resta libero per le altre richieste.
+
+    Ogni endpoint ha un proprio limite di concorrenza e una coda di attesa
+    limitata: oltre la coda la richiesta viene rifiutata (HTTP 429).
+    """
+
+    def __init__(self, max_workers: int, endpoint_limits: Dict[str, int], max_queue: int,
+                 latency_window: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.latency_window = latency_window
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dataservice")
+        self._limiters: Dict[str, EndpointLimiter] = {
+            name: EndpointLimiter(name, limit, max_queue, latency_window)
+            for name, limit in endpoint_limits.items()
+        }
+        self._lock = threading.Lock()
+
+    def _get_limiter(self, endpoint: str) -> EndpointLimiter:
+        """Limiter dell'endpoint (per quelli non configurati: limite pari al pool)"""
+        with self._lock:
+            if endpoint not in self._limiters:
+                self._limiters[endpoint] = EndpointLimiter(
+                    endpoint, self.max_workers, self.max_queue, self.latency_window
+                )
+            return self._limiters[endpoint]
+
+    async def run(self, endpoint: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Esegue func sul pool rispettando il limite dell'endpoint"""
+        limiter = self._get_limiter(endpoint)
+        started = time.perf_counter()
+        queue_wait = await limiter.acquire()
+        # Richiesta in profilazione: cProfile attivo nel thread che esegue il lavoro
+        session = current_profile.get()
+        loop = asyncio.get_running_loop()
+        try:
+            if session is not None:
+                future = self._pool.submit(session.run, func, *args, **kwargs)
+            else:
+                future = self._pool.submit(func, *args, **kwargs)
+        except BaseException:
+            limiter.release(time.perf_counter() - started, queue_wait)
+            raise
+
+        future.add_done_callback(self._release_callback(loop, limiter, started, queue_wait))
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _release_callback(loop: asyncio.AbstractEventLoop, limiter: EndpointLimiter, started: float,
+                          queue_wait: float) -> Callable[[Any], None]:
+        """
+        Callback che libera il posto dell'endpoint quando il thread ha finito,
+        non quando la coroutine viene cancellata (es. client disconnesso): il
+        lavoro già avviato continua a occupare il pool
+        """
+        def on_done(_):
+            latency = time.perf_counter() - started
+            try:
+                loop.call_soon_threadsafe(limiter.release, latency, queue_wait)
+            except RuntimeError:
+                # Event loop già chiuso: nessuno attende più il semaforo
+                limiter.release(latency, queue_wait)
+
+        return on_done
+
+    async def iterate(self, endpoint: str, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """
+        Consuma sul pool un iteratore sincrono (es. i blocchi di un export in
+        streaming), un elemento per volta, tenendo il posto dell'endpoint
+        finché non è esaurito o chiuso. Il posto si prende qui, prima che la
+        risposta parta, così la saturazione si traduce ancora in un 429.
+        """
+        limiter = self._get_limiter(endpoint)
+        started = time.perf_counter()
+        queue_wait = await limiter.acquire()
+        items = self._iterate(iterator, limiter, started, queue_wait)
+        # Generatore avviato: da qui il finally libera il posto anche se la risposta si interrompe
+        await items.__anext__()
+        return items
+
+    async def _iterate(self, iterator: Iterator[Any], limiter: EndpointLimiter, started: float,
+                       queue_wait: float) -> AsyncIterator[Any]:
+        release = self._release_callback(asyncio.get_running_loop(), limiter, started, queue_wait)
+        pending = None
+        try:
+            yield None
+            while True:
+                pending = self._pool.submit(next, iterator, _EXHAUSTED)
+                item = await asyncio.wrap_future(pending)
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            if pending is not None and not pending.done():
+                pending.add_done_callback(release)
+            else:
+                release(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche del pool e di ciascun endpoint"""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {
+            "max_workers": self.max_workers,
+            "endpoints": {limiter.name: limiter.stats() for limiter in limiters}
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Istanza globale del pool di lavoro
+work_executor = WorkExecutor(
+    max_workers=settings.executor_workers,
+    endpoint_limits=settings.endpoint_concurrency,
+    max_queue=settings.executor_max_queue,
+    latency_window=settings.latency_window
+)
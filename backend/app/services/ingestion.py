@@ -0,0 +1,317 @@
+import pickle
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from app.services.excel_reader import read_excel_file
+from app.services.locale_parsing import infer_date_format, infer_number_format, parse_amounts, parse_dates
+from app.services.metrics import StageTimer
+
+try:
+    # Stringhe Arrow con NaN come valore mancante, come le colonne object
+    ARROW_STRING_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)
+except TypeError:  # pragma: no cover - pandas < 2.3
+    ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Parole chiave nei nomi delle colonne di date, di importi e di descrizioni
+DATE_KEYWORDS = ['data', 'date', 'giorno']
+AMOUNT_KEYWORDS = ['importo', 'amount', 'euro', '€']
+DESCRIPTION_KEYWORDS = ['descrizione', 'description', 'causale', 'dettagli', 'beneficiario']
+
+# Callback di avanzamento: (fase, righe elaborate)
+ProgressCallback = Callable[[str, int], None]
+
+
+class IngestionCancelled(Exception):
+    """L'ingestione è stata annullata dall'utente"""
+
+
+def report_progress(progress: Optional[ProgressCallback], stage: str, rows: int):
+    """Notifica l'avanzamento, se è stato richiesto"""
+    if progress is not None:
+        progress(stage, rows)
+
+
+def is_amount_column(col_name: str) -> bool:
+    """Il nome della colonna indica un importo"""
+    return any(keyword in col_name.lower() for keyword in AMOUNT_KEYWORDS)
+
+
+def is_description_column(col_name: str) -> bool:
+    """Il nome della colonna indica una descrizione testuale del movimento"""
+    return any(keyword in col_name.lower() for keyword in DESCRIPTION_KEYWORDS)
+
+
+def clean_column_name(col_name) -> str:
+    """Pulizia nomi colonne - rimuove caratteri problematici per SQLite"""
+    # Sostituisce spazi, punti, due punti e altri caratteri problematici con underscore
+    cleaned = re.sub(r'[^a-zA-Z0-9_]', '_', str(col_name).strip())
+    # Rimuove underscore multipli consecutivi
+    cleaned = re.sub(r'_+', '_', cleaned)
+    # Rimuove underscore iniziali e finali
+    cleaned = cleaned.strip('_')
+    # Assicura che il nome non inizi con un numero
+    if cleaned and cleaned[0].isdigit():
+        cleaned = 'col_' + cleaned
+    # Se il nome è vuoto, usa un nome di default
+    if not cleaned:
+        cleaned = 'column'
+    return cleaned.lower()
+
+
+def clean_dataframe(df: pd.DataFrame, formats: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Pulisce e normalizza il dataframe.
+
+    Il formato di date e importi (es. dd/mm/yyyy, "1.234,56 €") viene dedotto
+    da un campione e poi applicato all'intera colonna in modo vettoriale;
+    passando lo stesso dizionario formats a ogni blocco, il formato dedotto
+    sul primo blocco con valori vale per tutto il file (anche quando è None,
+    cioè nessun formato riconosciuto).
+    """
+    formats = formats if formats is not None else {}
+
+    # Rimozione righe completamente vuote
+    df = df.dropna(how='all')
+
+    # Applica la pulizia ai nomi delle colonne
+    df.columns = [clean_column_name(col) for col in df.columns]
+
+    # Conversione date se presenti
+    date_columns = []
+    for col in df.columns:
+        if any(keyword in col.lower() for keyword in DATE_KEYWORDS):
+            date_columns.append(col)
+
+    for col in date_columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        if col not in formats and df[col].notna().any():
+            formats[col] = infer_date_format(df[col])
+        try:
+            if formats.get(col) is not None:
+                df[col] = parse_dates(df[col], formats[col])
+            else:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        except:
+            pass
+
+    # Conversione importi se presenti
+    amount_columns = []
+    for col in df.columns:
+        if is_amount_column(col):
+            amount_columns.append(col)
+
+    for col in amount_columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        if col not in formats and df[col].notna().any():
+            formats[col] = infer_number_format(df[col])
+        try:
+            if formats.get(col) is not None:
+                df[col] = parse_amounts(df[col], formats[col])
+            else:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        except:
+            pass
+
+    return df
+
+
+def infer_numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte in numeri le colonne di testo i cui valori sono tutti numerici,
+    come farebbe read_csv leggendo l'intero file. Va applicata al dataframe
+    completo: sui singoli blocchi la stessa colonna potrebbe risultare
+    numerica in uno e testuale in un altro.
+    """
+    for col in df.columns:
+        col_data = df[col]
+        if not pd.api.types.is_string_dtype(col_data) or isinstance(col_data.dtype, pd.CategoricalDtype):
+            continue
+        try:
+            df[col] = pd.to_numeric(col_data)
+        except (ValueError, TypeError):
+            continue
+    return df
+
+
+def align_numeric_columns(chunk: pd.DataFrame, reference: pd.DataFrame) -> pd.DataFrame:
+    """
+    Riporta al tipo numerico del dataset le colonne di un blocco accodato
+    lette come testo. ValueError se la colonna contiene valori non numerici.
+    """
+    for col in chunk.columns:
+        if col not in reference.columns or not pd.api.types.is_string_dtype(chunk[col]):
+            continue
+        if not pd.api.types.is_numeric_dtype(reference[col]) or pd.api.types.is_bool_dtype(reference[col]):
+            continue
+        try:
+            chunk[col] = pd.to_numeric(chunk[col])
+        except (ValueError, TypeError):
+            raise ValueError(f"La colonna {col} contiene valori non numerici, ma nel dataset è numerica")
+    return chunk
+
+
+def _downcast_numeric(col_data: pd.Series) -> pd.Series:
+    """Riduce interi e float al tipo più piccolo che rappresenta esattamente i valori"""
+    if pd.api.types.is_integer_dtype(col_data):
+        return pd.to_numeric(col_data, downcast='integer')
+    downcast = col_data.astype(np.float32)
+    same = (downcast.astype(np.float64) == col_data) | col_data.isna()
+    return downcast if same.all() else col_data
+
+
+def compact_dataframe(df: pd.DataFrame, categorical_max_ratio: float) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Rappresentazione compatta del dataframe pulito: testo ripetuto come
+    categorical, altro testo come stringhe Arrow, numeri ridotti dove non si
+    perde precisione. Restituisce anche la memoria prima e dopo.
+    """
+    memory_before = int(df.memory_usage(deep=True).sum())
+    conversions: Dict[str, str] = {}
+
+    for col in df.columns:
+        col_data = df[col]
+        if pd.api.types.is_bool_dtype(col_data) or isinstance(col_data.dtype, pd.CategoricalDtype):
+            continue
+
+        if pd.api.types.is_numeric_dtype(col_data):
+            compacted = _downcast_numeric(col_data)
+        elif pd.api.types.is_string_dtype(col_data):
+            # Solo colonne di testo: le object con tipi misti restano invariate
+            if pd.api.types.infer_dtype(col_data, skipna=True) not in ('string', 'empty'):
+                continue
+            not_null = col_data.count()
+            if not_null and col_data.nunique() / not_null <= categorical_max_ratio:
+                compacted = col_data.astype('category')
+            else:
+                compacted = col_data.astype(ARROW_STRING_DTYPE)
+        else:
+            continue
+
+        if compacted.dtype != col_data.dtype:
+            df[col] = compacted
+            conversions[col] = str(compacted.dtype)
+
+    memory_after = int(df.memory_usage(deep=True).sum())
+    return df, {
+        "memory_before_mb": round(memory_before / 1024 / 1024, 2),
+        "memory_after_mb": round(memory_after / 1024 / 1024, 2),
+        "compaction_ratio": round(memory_before / memory_after, 2) if memory_after else None,
+        "converted_columns": conversions
+    }
+
+
+def concat_rows(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Accoda le righe di più dataframe con le stesse colonne mantenendo la
+    rappresentazione compatta del primo: le categorical vengono unite (con
+    categorie ordinate, come astype('category')), il testo resta Arrow.
+    ValueError se le colonne non coincidono.
+    """
+    base = frames[0]
+    for frame in frames[1:]:
+        if frame.columns.tolist() != base.columns.tolist():
+            raise ValueError(
+                f"Le colonne non coincidono con quelle del dataset: "
+                f"{', '.join(frame.columns)} invece di {', '.join(base.columns)}"
+            )
+
+    columns: Dict[str, Any] = {}
+    for col in base.columns:
+        parts = [frame[col] for frame in frames]
+        dtype = base[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categoricals = [part.astype('category') for part in parts]
+            columns[col] = pd.Series(union_categoricals(categoricals, sort_categories=True))
+        elif dtype == ARROW_STRING_DTYPE:
+            columns[col] = pd.concat([part.astype(ARROW_STRING_DTYPE) for part in parts], ignore_index=True)
+        else:
+            # Numeri e date: pandas sceglie il tipo comune (es. int8 + int64 -> int64)
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def read_chunks(file_path: str, file_type: str, chunk_rows: int) -> Tuple[Iterator[pd.DataFrame], Dict[str, Any]]:
+    """
+    Legge il file a blocchi di righe di dimensione fissa. Il CSV è letto come
+    testo: read_csv dedurrebbe i tipi blocco per blocco (es. una colonna
+    intera nel primo blocco e alfanumerica nel successivo); date e importi
+    sono convertiti da clean_dataframe, le altre colonne numeriche da
+    infer_numeric_columns sul dataframe completo.
+    """
+    if file_type.lower() == 'csv':
+        reader = pd.read_csv(file_path, encoding='utf-8', chunksize=chunk_rows, dtype=str)
+        return reader, {"engine": "read_csv", "chunk_rows": chunk_rows}
+    elif file_type.lower() in ['xls', 'xlsx']:
+        # Il formato Excel non supporta la lettura a blocchi: lettore dedicato sul foglio con i dati
+        df, read_info = read_excel_file(file_path, file_type)
+        return iter([df]), read_info
+    else:
+        raise ValueError(f"Tipo file non supportato: {file_type}")
+
+
+def clean_chunks(raw_chunks: Iterator[pd.DataFrame]) -> Iterator[Tuple[List[str], pd.DataFrame]]:
+    """Pulisce i blocchi letti, restituendo anche i nomi delle colonne originali"""
+    # Formati di date e importi dedotti sul primo blocco utile, riusati per i successivi
+    formats: Dict[str, Any] = {}
+    for raw_chunk in raw_chunks:
+        original_columns = raw_chunk.columns.tolist()
+        yield original_columns, clean_dataframe(raw_chunk, formats)
+
+
+def count_csv_rows(file_path: str) -> int:
+    """Stima veloce delle righe di un CSV contando i fine riga"""
+    lines = 0
+    with open(file_path, 'rb') as f:
+        while block := f.read(1024 * 1024):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+def parse_file_worker(file_path: str, file_type: str, chunk_rows: int, output_path: str,
+                      progress_queue, cancel_event) -> Dict[str, Any]:
+    """
+    Eseguita in un processo separato: legge e pulisce il file a blocchi,
+    serializzando in sequenza ogni blocco pulito su output_path.
+    L'avanzamento viene inviato su progress_queue come ("total"|"clean", righe);
+    i tempi di lettura e pulizia tornano al processo principale in read_info["stage_seconds"].
+    """
+    if file_type.lower() == 'csv':
+        progress_queue.put(("total", count_csv_rows(file_path)))
+
+    timer = StageTimer("ingest")
+    with timer.stage("read"):
+        raw_chunks, read_info = read_chunks(file_path, file_type, chunk_rows)
+    raw_chunks = timer.iterate(raw_chunks, "read")
+    if file_type.lower() != 'csv':
+        # Excel letto in un unico blocco: il totale è noto dopo la lettura
+        raw_chunks = list(raw_chunks)
+        progress_queue.put(("total", sum(len(chunk) for chunk in raw_chunks)))
+
+    rows_cleaned = 0
+    with open(output_path, 'wb') as out:
+        for original_columns, chunk in timer.iterate(clean_chunks(raw_chunks), "clean"):
+            if cancel_event.is_set():
+                raise IngestionCancelled()
+            with timer.stage("spill"):
+                pickle.dump((original_columns, chunk), out, protocol=pickle.HIGHEST_PROTOCOL)
+            rows_cleaned += len(chunk)
+            progress_queue.put(("clean", rows_cleaned))
+
+    # Le metriche del processo figlio non sono visibili: i tempi viaggiano con il risultato
+    return {**read_info, "stage_seconds": timer.seconds}
+
+
+def load_chunks(chunks_path: str) -> Iterator[Tuple[List[str], pd.DataFrame]]:
+    """Rilegge uno alla volta i blocchi puliti scritti da parse_file_worker"""
+    with open(chunks_path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
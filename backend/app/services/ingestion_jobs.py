@@ -0,0 +1,228 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.data_service import data_service
+from app.services.ingestion import IngestionCancelled, load_chunks, parse_file_worker
+from app.services.metrics import StageTimer
+
+# Peso di ogni fase sull'avanzamento complessivo, usato per stimare l'ETA
+STAGE_WEIGHTS = {"read": 0.0, "clean": 0.5, "store": 0.35, "index": 0.15}
+STAGE_ORDER = ["read", "clean", "store", "index"]
+
+
+class IngestionJob:
+    """Stato di un'ingestione in background"""
+
+    def __init__(self, file_path: str, file_type: str, file_name: str,
+                 options: Optional[Dict[str, Any]] = None):
+        self.job_id = str(uuid.uuid4())
+        self.file_path = file_path
+        self.file_type = file_type
+        self.file_name = file_name
+        # Opzioni passate a data_service.ingest (es. deduplica)
+        self.options = options or {}
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.rows_processed = 0
+        self.total_rows: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.cancel_requested = threading.Event()
+
+    def update(self, stage: str, rows: int):
+        """Aggiorna fase e righe elaborate; solleva IngestionCancelled se richiesto"""
+        if self.cancel_requested.is_set():
+            raise IngestionCancelled()
+        self.stage = stage
+        self.rows_processed = rows
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def progress(self) -> float:
+        """Frazione di lavoro completata, pesata per fase"""
+        if self.status == "completed":
+            return 1.0
+        if self.stage is None:
+            return 0.0
+        done = sum(STAGE_WEIGHTS[s] for s in STAGE_ORDER[:STAGE_ORDER.index(self.stage)])
+        if self.total_rows:
+            done += STAGE_WEIGHTS[self.stage] * min(self.rows_processed / self.total_rows, 1.0)
+        return round(done, 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Stato del job esposto dall'API"""
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        progress = self.progress()
+        eta = None
+        if self.status == "running" and progress > 0:
+            eta = round(elapsed * (1 - progress) / progress, 1)
+        return {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "stage": self.stage,
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "progress": progress,
+            "elapsed_seconds": round(elapsed, 2),
+            "eta_seconds": eta,
+            "error": self.error,
+            "result": self.result
+        }
+
+
+class IngestionJobManager:
+    """
+    Esegue le ingestioni in background: lettura e pulizia in un pool di
+    processi (così l'event loop dell'API resta libero), salvataggio e
+    indicizzazione in un thread dedicato per job.
+    """
+
+    def __init__(self, max_jobs: int, worker_processes: int, retention_seconds: int):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="ingest")
+        self._worker_processes = worker_processes
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """Pool di processi e manager per le code di avanzamento, creati al primo job"""
+        with self._lock:
+            if self._processes is None:
+                context = multiprocessing.get_context("spawn")
+                self._manager = context.Manager()
+                self._processes = ProcessPoolExecutor(max_workers=self._worker_processes, mp_context=context)
+            return self._processes
+
+    def submit(self, file_path: str, file_type: str, file_name: str,
+               options: Optional[Dict[str, Any]] = None) -> IngestionJob:
+        """Accoda un nuovo job; il file temporaneo diventa di proprietà del job"""
+        self._prune()
+        job = IngestionJob(file_path, file_type, file_name, options)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._threads.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob:
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError(job_id)
+            return self._jobs[job_id]
+
+    def list_jobs(self) -> List[IngestionJob]:
+        self._prune()
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> IngestionJob:
+        """Richiede l'annullamento; ha effetto al blocco di righe successivo"""
+        job = self.get(job_id)
+        if job.finished:
+            raise ValueError(f"Il job {job_id} è già terminato ({job.status})")
+        job.cancel_requested.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def _prune(self):
+        """Rimuove i job terminati da più di retention_seconds"""
+        limit = time.time() - self.retention_seconds
+        with self._lock:
+            for job_id in [j.job_id for j in self._jobs.values() if j.finished and j.finished_at < limit]:
+                del self._jobs[job_id]
+
+    def _run(self, job: IngestionJob):
+        """Esecuzione completa di un job: read/clean nel processo, store/index qui"""
+        if job.cancel_requested.is_set():
+            self._cleanup(job, None)
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        started = time.perf_counter()
+        job.stage = "read"
+        chunks_path = None
+        try:
+            pool = self._get_process_pool()
+            progress_queue = self._manager.Queue()
+            cancel_event = self._manager.Event()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".chunks") as f:
+                chunks_path = f.name
+
+            future = pool.submit(
+                parse_file_worker, job.file_path, job.file_type,
+                settings.ingest_chunk_rows, chunks_path, progress_queue, cancel_event
+            )
+            while not future.done():
+                if job.cancel_requested.is_set():
+                    cancel_event.set()
+                self._drain(job, progress_queue, timeout=0.2)
+            ingest_stats = future.result()
+            self._drain(job, progress_queue, timeout=0)
+
+            # Tempi di lettura e pulizia misurati nel processo, completati qui con le fasi successive
+            timer = StageTimer("ingest", ingest_stats.pop("stage_seconds", None))
+            result = data_service.ingest(timer.iterate(load_chunks(chunks_path), "load"), ingest_stats,
+                                         progress=job.update, started=started, timer=timer, **job.options)
+            job.result = result
+            job.status = "completed"
+        except IngestionCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._cleanup(job, chunks_path)
+
+    def _drain(self, job: IngestionJob, progress_queue, timeout: float):
+        """Applica al job gli aggiornamenti di avanzamento inviati dal processo"""
+        try:
+            while True:
+                kind, value = progress_queue.get(timeout=timeout) if timeout else progress_queue.get_nowait()
+                if kind == "total":
+                    job.total_rows = value
+                else:
+                    job.stage = kind
+                    job.rows_processed = value
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    def _cleanup(self, job: IngestionJob, chunks_path: Optional[str]):
+        for path in (job.file_path, chunks_path):
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+    def shutdown(self):
+        """Arresta pool e manager alla chiusura dell'applicazione"""
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+
+
+# Istanza globale del gestore dei job
+job_manager = IngestionJobManager(
+    max_jobs=settings.ingest_max_concurrent_jobs,
+    worker_processes=settings.ingest_worker_processes,
+    retention_seconds=settings.ingest_job_retention
+)
@@ -0,0 +1,163 @@
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Valori letti per dedurre il formato di una colonna
+FORMAT_SAMPLE_SIZE = 1000
+# Quota minima di valori del campione che il formato scelto deve interpretare
+MIN_FORMAT_MATCH = 0.9
+
+# Formati data provati in ordine: a parità di esito vince il primo (giorno prima del mese)
+DATE_FORMATS: List[str] = [
+    "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+    "%Y-%m-%d", "%Y/%m/%d", "%Y%m%d",
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M"
+]
+
+# Simboli di valuta e spazi (anche non separabili) ignorati negli importi
+_CURRENCY_PATTERN = '[€$£\\s\u00a0\u202f]|EUR|eur'
+# Importi con separatore delle migliaia e decimale: (migliaia, decimale) -> regex
+NUMBER_FORMATS = {
+    (".", ","): re.compile(r'^\d{1,3}(\.\d{3})*(,\d+)?$|^\d+(,\d+)?$'),
+    (",", "."): re.compile(r'^\d{1,3}(,\d{3})*(\.\d+)?$|^\d+(\.\d+)?$'),
+}
+
+
+def _sample(series: pd.Series) -> pd.Series:
+    """Primi valori non nulli della colonna, come testo ripulito"""
+    return series.dropna().head(FORMAT_SAMPLE_SIZE).astype(str).str.strip()
+
+
+def infer_date_format(series: pd.Series) -> Optional[str]:
+    """Deduce il formato data dal campione; None se nessun formato è affidabile"""
+    sample = _sample(series)
+    if sample.empty:
+        return None
+
+    # Formati verificati con lo stesso strptime di Arrow usato da parse_dates
+    text = pa.array(sample, type=pa.string(), from_pandas=True)
+    best_format, best_ratio = None, 0.0
+    for date_format in DATE_FORMATS:
+        parsed = _strptime(text, date_format)
+        ratio = 1.0 - parsed.null_count / len(parsed)
+        if ratio > best_ratio:
+            best_format, best_ratio = date_format, ratio
+        if ratio == 1.0:
+            break
+    return best_format if best_ratio >= MIN_FORMAT_MATCH else None
+
+
+def _strip_amount_text(text: pd.Series) -> pd.Series:
+    """Rimuove valuta, spazi e segno lasciando solo cifre e separatori"""
+    return text.str.replace(_CURRENCY_PATTERN, '', regex=True).str.strip('+-')
+
+
+def infer_number_format(series: pd.Series) -> Optional[Tuple[str, str]]:
+    """
+    Deduce (separatore migliaia, separatore decimale) dal campione.
+    In caso di ambiguità (es. "1.234") vale la convenzione italiana solo se
+    tutte le cifre dopo il punto sono gruppi da tre.
+    """
+    sample = _strip_amount_text(_sample(series))
+    sample = sample[sample != '']
+    if sample.empty:
+        return None
+
+    scores = {fmt: sample.str.match(pattern).mean() for fmt, pattern in NUMBER_FORMATS.items()}
+    italian, english = scores[(".", ",")], scores[(",", ".")]
+    if max(italian, english) < MIN_FORMAT_MATCH:
+        return None
+    if italian != english:
+        return (".", ",") if italian > english else (",", ".")
+
+    dotted = sample[sample.str.contains('.', regex=False)]
+    if not dotted.empty and dotted.str.match(r'^\d{1,3}(\.\d{3})+$').all():
+        return (".", ",")
+    return (",", ".")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def parse_amounts(series: pd.Series, number_format: Tuple[str, str]) -> pd.Series:
+    """
+    Converte importi testuali (es. "1.234,56 €", "-12,50", "12,50-") in float;
+    le celle già numeriche di una colonna mista (es. da Excel) restano
+    invariate, senza passare dal testo e dal separatore delle migliaia
+    """
+    if series.dtype == object:
+        numeric = series.map(_is_number).to_numpy(dtype=bool)
+        if numeric.any():
+            values = pd.Series(np.nan, index=series.index, name=series.name)
+            values[numeric] = series[numeric].astype(np.float64)
+            values[~numeric] = _parse_amount_text(series[~numeric], number_format)
+            return values
+    return _parse_amount_text(series, number_format)
+
+
+def _parse_amount_text(series: pd.Series, number_format: Tuple[str, str]) -> pd.Series:
+    thousands, decimal = number_format
+    text = series.astype(str).str.replace(_CURRENCY_PATTERN, '', regex=True)
+    # Segno meno anche in coda, come in alcuni estratti conto
+    negative = text.str.startswith('-') | text.str.endswith('-')
+    text = text.str.strip('+-').str.replace(thousands, '', regex=False)
+    if decimal != '.':
+        text = text.str.replace(decimal, '.', regex=False)
+    values = pd.to_numeric(text, errors='coerce')
+    return values.where(~negative.fillna(False).to_numpy(dtype=bool), -values).astype(np.float64)
+
+
+def parse_dates(series: pd.Series, date_format: str) -> pd.Series:
+    """
+    Converte le date testuali con un formato esplicito tramite strptime di
+    Arrow (vettoriale, nessun parsing per elemento); i valori che non
+    rispettano il formato (es. date ISO o celle datetime in una colonna
+    mista) passano dal parser generico di pandas, e solo quelli non
+    interpretabili nemmeno così diventano NaT
+    """
+    text = pa.array(series.astype(str).str.strip(), type=pa.string(), from_pandas=True)
+    parsed = _strptime(text, date_format)
+    result = pd.Series(parsed.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
+
+    unmatched = (result.isna() & series.notna()).to_numpy(dtype=bool)
+    if unmatched.any():
+        result[unmatched] = _parse_dates_fallback(series[unmatched], date_format).astype(result.dtype)
+    return result
+
+
+def _parse_dates_fallback(series: pd.Series, date_format: str) -> pd.Series:
+    """
+    Parser generico per i valori fuori formato: prima ISO 8601 (l'ordine
+    giorno/mese dedotto non va applicato a "AAAA-MM-GG"), poi formati misti
+    con lo stesso ordine del formato dedotto; l'orario resta quello scritto
+    """
+    def naive(value) -> pd.Timestamp:
+        return value.tz_localize(None) if value is not pd.NaT and value.tzinfo is not None else value
+
+    def to_datetime(values: pd.Series, **kwargs) -> pd.Series:
+        try:
+            parsed = pd.to_datetime(values, errors='coerce', **kwargs)
+        except ValueError:
+            # Offset diversi (o date con e senza offset) tra le celle: conversione valore per valore
+            parsed = values.map(lambda v: naive(pd.to_datetime(v, errors='coerce', **kwargs)))
+            return pd.to_datetime(parsed, errors='coerce')
+        return parsed.dt.tz_localize(None) if parsed.dt.tz is not None else parsed
+
+    parsed = to_datetime(series, format='ISO8601')
+    missing = parsed.isna().to_numpy(dtype=bool)
+    if missing.any():
+        parsed[missing] = to_datetime(
+            series[missing], format='mixed', dayfirst=date_format.startswith('%d')
+        ).astype(parsed.dtype)
+    return parsed
+
+
+def _strptime(text: pa.Array, date_format: str) -> pa.Array:
+    """strptime di Arrow al microsecondo; i valori non conformi diventano nulli"""
+    return pc.strptime(text, format=date_format, unit='us', error_is_null=True)
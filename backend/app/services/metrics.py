@@ -0,0 +1,233 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Limiti superiori (secondi) degli istogrammi di durata
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Limiti superiori degli istogrammi di numero di righe
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Campione di una metrica calcolata al momento della lettura: (etichette, valore)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Etichette nel formato testuale Prometheus: {nome="valore",...}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Metrica con nome, descrizione ed etichette; i valori sono indicizzati per tupla di etichette"""
+
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Etichette non valide per {self.name}: {', '.join(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Contatore monotono"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Istogramma a bucket fissi con somma e conteggio delle osservazioni"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per ogni combinazione di etichette: (conteggi per bucket + overflow, somma)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[position] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        lines = self.header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Valore istantaneo letto da una funzione al momento dell'esposizione"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, collect: Callable[[], Iterable[Sample]],
+                 kind: str = "gauge"):
+        super().__init__(name, description)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.collect():
+            names = sorted(labels)
+            lines.append(f"{self.name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registro delle metriche del processo, esposto in formato testuale
+    Prometheus da GET /metrics. Contatori e istogrammi sono aggiornati
+    durante le richieste; le metriche calcolate (memoria dei dataset, cache,
+    pool di lavoro) sono lette solo al momento dell'esposizione.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def gauge(self, name: str, description: str, collect: Callable[[], Iterable[Sample]],
+              kind: str = "gauge") -> Gauge:
+        """Metrica calcolata da collect() a ogni esposizione (kind="counter" per totali già cumulati)"""
+        return self._register(Gauge(name, description, collect, kind))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro globale e metriche comuni a servizi e API
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "estratti_stage_duration_seconds",
+    "Durata delle fasi di DataService (lettura, pulizia, SQLite, indici, filtri, serializzazione)",
+    ["operation", "stage"]
+)
+ROWS_PROCESSED = metrics.counter(
+    "estratti_rows_processed_total", "Righe elaborate per operazione", ["operation"]
+)
+RESULT_ROWS = metrics.histogram(
+    "estratti_result_rows", "Righe selezionate dai filtri per operazione", ["operation"], buckets=ROW_BUCKETS
+)
+
+
+class StageTimer:
+    """
+    Tempi per fase di una singola operazione (es. un ingest o una pagina di /data).
+
+    Le fasi possono essere annidate (es. la pulizia consuma la lettura a
+    blocchi): ogni fase registra solo il proprio tempo esclusivo, così la
+    somma delle fasi non conta due volte lo stesso intervallo. Con finish()
+    i tempi confluiscono nell'istogramma delle fasi e vengono restituiti per
+    le statistiche della risposta.
+    """
+
+    def __init__(self, operation: str, seconds: Optional[Dict[str, float]] = None):
+        self.operation = operation
+        self.seconds: Dict[str, float] = dict(seconds or {})
+        self._nested = 0.0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        outer_nested, self._nested = self._nested, 0.0
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.add(name, elapsed - self._nested)
+            self._nested = outer_nested + elapsed
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def iterate(self, iterator: Iterable[T], name: str) -> Iterator[T]:
+        """Attribuisce alla fase il tempo speso a produrre ogni elemento dell'iteratore"""
+        iterator = iter(iterator)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def finish(self) -> Dict[str, float]:
+        """Registra le fasi nell'istogramma e restituisce i tempi arrotondati"""
+        for name, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, operation=self.operation, stage=name)
+        return {name: round(seconds, 4) for name, seconds in self.seconds.items()}
@@ -0,0 +1,281 @@
+import math
+import time
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Quantili calcolati per le colonne numeriche
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+# Precisione dello sketch HyperLogLog: 2^14 registri, errore standard ~0.8%
+HLL_PRECISION = 14
+# Campione uniforme usato per i quantili approssimati
+QUANTILE_SAMPLE_SIZE = 100000
+TOP_K = 5
+
+
+def to_json_value(value: Any) -> Any:
+    """Converte un valore pandas/numpy in un tipo serializzabile in JSON"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _hash_values(series: pd.Series) -> np.ndarray:
+    """
+    Hash a 64 bit dei valori non nulli, indipendenti dalla rappresentazione
+    (int8 o int64, categorical o stringhe Arrow): due parti dello stesso
+    dataset compattate diversamente danno gli stessi hash
+    """
+    values = series.dropna()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.Series(values.to_numpy(dtype="datetime64[us]").view(np.int64))
+    elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = values.astype(np.float64)
+    elif isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(values):
+        values = values.astype(object)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+def hll_registers(series: pd.Series) -> np.ndarray:
+    """Registri HyperLogLog dei valori non nulli della colonna (uniti tra parti con il massimo)"""
+    registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+    hashes = _hash_values(series)
+    if len(hashes) == 0:
+        return registers
+
+    buckets = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    # Rango = posizione del primo bit a 1 nei bit restanti
+    rest = (hashes << np.uint64(HLL_PRECISION)) | np.uint64(1 << (HLL_PRECISION - 1))
+    ranks = np.maximum(64 - np.floor(np.log2(rest.astype(np.float64))).astype(np.int64), 1)
+    np.maximum.at(registers, buckets, ranks.astype(np.uint8))
+    return registers
+
+
+def hll_estimate(registers: np.ndarray) -> int:
+    """Stima dei valori distinti dai registri HyperLogLog"""
+    m = len(registers)
+    zeros = int(np.count_nonzero(registers == 0))
+    if zeros == m:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    if estimate <= 2.5 * m and zeros:
+        # Correzione per cardinalità basse (linear counting)
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+def approx_distinct(series: pd.Series) -> int:
+    """Stima dei valori distinti con HyperLogLog (valori nulli esclusi)"""
+    return hll_estimate(hll_registers(series))
+
+
+def _column_sample(col_data: pd.Series) -> Tuple[np.ndarray, bool]:
+    """
+    Valori non nulli della colonna come float, su un campione uniforme di
+    righe se la colonna è più grande del campione; True se campionati
+    """
+    if len(col_data) <= QUANTILE_SAMPLE_SIZE:
+        return col_data.dropna().to_numpy(dtype=np.float64), False
+    rng = np.random.default_rng(0)
+    positions = np.sort(rng.choice(len(col_data), QUANTILE_SAMPLE_SIZE, replace=False))
+    return col_data.iloc[positions].dropna().to_numpy(dtype=np.float64), True
+
+
+def _quantiles(values: np.ndarray, approximate: bool) -> Dict[str, float]:
+    """Quantili esatti, oppure su un campione uniforme per le colonne molto grandi"""
+    if approximate and len(values) > QUANTILE_SAMPLE_SIZE:
+        rng = np.random.default_rng(0)
+        values = rng.choice(values, QUANTILE_SAMPLE_SIZE, replace=False)
+    result = np.quantile(values, QUANTILES)
+    return {f"p{int(q * 100):02d}": float(v) for q, v in zip(QUANTILES, result)}
+
+
+def _profile_column(col_data: pd.Series, approximate: bool) -> Dict[str, Any]:
+    """Profilo di una singola colonna"""
+    total_rows = len(col_data)
+    not_null = col_data.dropna()
+    null_count = total_rows - len(not_null)
+    unique_count = approx_distinct(col_data) if approximate else int(not_null.nunique())
+
+    profile: Dict[str, Any] = {
+        "type": str(col_data.dtype),
+        "total_rows": total_rows,
+        "null_count": int(null_count),
+        "null_percentage": round(null_count / total_rows * 100, 2) if total_rows else 0.0,
+        "unique_count": unique_count,
+        "unique_percentage": round(unique_count / total_rows * 100, 2) if total_rows else 0.0,
+        "approximate": approximate,
+        "sample_values": [to_json_value(v) for v in not_null.head(10).tolist()],
+        "last_values": [to_json_value(v) for v in not_null.tail(5).tolist()],
+        "top_values": [
+            {"value": to_json_value(value), "count": int(count)}
+            for value, count in not_null.value_counts().head(TOP_K).items()
+        ]
+    }
+
+    if len(not_null) == 0:
+        return profile
+
+    if pd.api.types.is_bool_dtype(col_data):
+        return profile
+
+    if pd.api.types.is_numeric_dtype(col_data):
+        values = not_null.to_numpy(dtype=np.float64)
+        profile.update({
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "median": float(np.median(values)),
+            "std": to_json_value(float(not_null.std())),
+            "quantiles": _quantiles(values, approximate)
+        })
+    elif pd.api.types.is_datetime64_any_dtype(col_data):
+        min_date, max_date = not_null.min(), not_null.max()
+        profile.update({
+            "min_date": min_date.isoformat(),
+            "max_date": max_date.isoformat(),
+            "date_range_days": (max_date - min_date).days
+        })
+    elif pd.api.types.is_string_dtype(col_data) or pd.api.types.is_object_dtype(col_data):
+        text_lengths = not_null.astype(str).str.len()
+        profile.update({
+            "avg_text_length": float(text_lengths.mean()),
+            "min_text_length": int(text_lengths.min()),
+            "max_text_length": int(text_lengths.max())
+        })
+
+    return profile
+
+
+def build_profile(df: pd.DataFrame, exact_max_rows: int) -> Dict[str, Any]:
+    """
+    Profilo del dataset (conteggi, momenti, quantili, valori più frequenti,
+    intervalli di date) calcolato una volta in fase di ingest.
+
+    Oltre exact_max_rows righe i valori distinti sono stimati con HyperLogLog
+    e i quantili su un campione uniforme; il profilo è serializzabile in JSON
+    per essere salvato nel catalogo degli snapshot.
+    """
+    started = time.perf_counter()
+    approximate = len(df) > exact_max_rows
+    columns: Dict[str, Dict[str, Any]] = {
+        col: _profile_column(df[col], approximate) for col in df.columns
+    }
+    return {
+        "total_rows": len(df),
+        "total_columns": len(df.columns),
+        "columns": columns,
+        "build_seconds": round(time.perf_counter() - started, 4)
+    }
+
+
+def _merge_column(base: Dict[str, Any], delta: Dict[str, Any], col_data: pd.Series,
+                  registers: np.ndarray) -> Dict[str, Any]:
+    """
+    Unisce i profili di una colonna calcolati su due insiemi di righe
+    disgiunti; col_data è la colonna completa, registers i registri
+    HyperLogLog già uniti delle due parti
+    """
+    total_rows = base["total_rows"] + delta["total_rows"]
+    null_count = base["null_count"] + delta["null_count"]
+    base_values = base["total_rows"] - base["null_count"]
+    delta_values = delta["total_rows"] - delta["null_count"]
+    values = base_values + delta_values
+    # Distinti: stima HyperLogLog sull'unione (un valore presente in entrambe le parti conta una volta)
+    unique_count = min(hll_estimate(registers), values)
+
+    top_counts: Dict[Any, int] = {}
+    for top in base["top_values"] + delta["top_values"]:
+        top_counts[top["value"]] = top_counts.get(top["value"], 0) + top["count"]
+
+    merged: Dict[str, Any] = {
+        "type": base["type"],
+        "total_rows": total_rows,
+        "null_count": null_count,
+        "null_percentage": round(null_count / total_rows * 100, 2) if total_rows else 0.0,
+        "unique_count": unique_count,
+        "unique_percentage": round(unique_count / total_rows * 100, 2) if total_rows else 0.0,
+        "approximate": True,
+        "sample_values": (base["sample_values"] + delta["sample_values"])[:10],
+        "last_values": (base["last_values"] + delta["last_values"])[-5:],
+        "top_values": [
+            {"value": value, "count": count}
+            for value, count in sorted(top_counts.items(), key=lambda item: -item[1])[:TOP_K]
+        ]
+    }
+    if not base_values or not delta_values:
+        # Una delle due parti non ha valori: le statistiche sono quelle dell'altra
+        source = base if base_values else delta
+        merged.update({key: value for key, value in source.items() if key not in merged})
+        return merged
+
+    if "mean" in base and "mean" in delta:
+        # Media e varianza combinate (formula di Chan); mediana e quantili non si possono
+        # combinare: ricalcolati sulla colonna completa, o su un suo campione uniforme
+        mean = (base["mean"] * base_values + delta["mean"] * delta_values) / values
+        m2 = sum(
+            (part["std"] or 0.0) ** 2 * (n - 1) + n * (part["mean"] - mean) ** 2
+            for part, n in ((base, base_values), (delta, delta_values))
+        )
+        sample, sampled = _column_sample(col_data)
+        quantiles = _quantiles(sample, approximate=False)
+        merged.update({
+            "min": min(base["min"], delta["min"]),
+            "max": max(base["max"], delta["max"]),
+            "mean": mean,
+            "median": quantiles["p50"],
+            "std": to_json_value(math.sqrt(m2 / (values - 1))) if values > 1 else None,
+            "quantiles": quantiles,
+            "quantiles_approximate": sampled
+        })
+    elif "min_date" in base and "min_date" in delta:
+        min_date = min(pd.Timestamp(base["min_date"]), pd.Timestamp(delta["min_date"]))
+        max_date = max(pd.Timestamp(base["max_date"]), pd.Timestamp(delta["max_date"]))
+        merged.update({
+            "min_date": min_date.isoformat(),
+            "max_date": max_date.isoformat(),
+            "date_range_days": (max_date - min_date).days
+        })
+    elif "avg_text_length" in base and "avg_text_length" in delta:
+        merged.update({
+            "avg_text_length": (base["avg_text_length"] * base_values + delta["avg_text_length"] * delta_values) / values,
+            "min_text_length": min(base["min_text_length"], delta["min_text_length"]),
+            "max_text_length": max(base["max_text_length"], delta["max_text_length"])
+        })
+    return merged
+
+
+def merge_profiles(base: Dict[str, Any], delta: Dict[str, Any], data: pd.DataFrame,
+                   registers: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Profilo del dataset dopo l'aggiunta di righe, dal profilo esistente e da
+    quello delle sole righe nuove: conteggi, minimi/massimi, media, deviazione
+    standard e intervalli di date sono esatti; i valori distinti sono stimati
+    dai registri HyperLogLog uniti (registers, per colonna), mediana e
+    quantili ricalcolati su data (su un campione oltre QUANTILE_SAMPLE_SIZE
+    righe, con quantiles_approximate=True), i valori più frequenti sommati
+    dai due profili (approximate=True)
+    """
+    started = time.perf_counter()
+    columns = {
+        col: _merge_column(col_profile, delta["columns"][col], data[col], registers[col])
+        for col, col_profile in base["columns"].items()
+    }
+    return {
+        "total_rows": base["total_rows"] + delta["total_rows"],
+        "total_columns": base["total_columns"],
+        "columns": columns,
+        "build_seconds": round(time.perf_counter() - started, 4)
+    }
@@ -0,0 +1,272 @@
+import contextvars
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Sessione di profilazione della richiesta corrente, propagata ai thread del pool di lavoro
+current_profile: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+class ProfileSession:
+    """
+    Profilazione di una singola richiesta.
+
+    La CPU è misurata con cProfile nei thread del pool di lavoro, dove gira
+    il lavoro sincrono di DataService (l'event loop, condiviso con le altre
+    richieste, non viene profilato). Le allocazioni sono tracciate con
+    tracemalloc per tutta la durata della richiesta: il tracciamento è
+    globale, quindi include anche eventuali richieste concorrenti.
+    """
+
+    def __init__(self, method: str, path: str, query: str, trace_frames: int):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.query = query
+        self.trace_frames = trace_frames
+        self.started_at = time.time()
+        self.profiler = cProfile.Profile()
+        self.pool_seconds = 0.0
+        self.errors: List[str] = []
+        self._started = 0.0
+        self._stop_tracing = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._started = time.perf_counter()
+        # Se tracemalloc era già attivo (es. PYTHONTRACEMALLOC) resta attivo a fine richiesta
+        self._stop_tracing = not tracemalloc.is_tracing()
+        if self._stop_tracing:
+            tracemalloc.start(self.trace_frames)
+        tracemalloc.reset_peak()
+
+    def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Esegue func (in un thread del pool) con cProfile attivo"""
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                self.profiler.enable()
+            except ValueError as e:
+                # Un altro profiler è già attivo nel processo: si esegue senza profilare
+                self.errors.append(str(e))
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.profiler.disable()
+                self.pool_seconds += time.perf_counter() - started
+
+    def finish(self, status_code: int, top_n: int) -> Tuple[Dict[str, Any], str]:
+        """Ferma il tracciamento e restituisce il report della richiesta e la tabella di pstats"""
+        duration = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stop_tracing:
+            tracemalloc.stop()
+
+        report = {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status_code": status_code,
+            "started_at": self.started_at,
+            "duration_seconds": round(duration, 4),
+            "pool_seconds": round(self.pool_seconds, 4),
+            "cpu": self._cpu_report(top_n),
+            "memory": {
+                "peak_traced_mb": round(peak / 1024 / 1024, 2),
+                "traced_at_end_mb": round(current / 1024 / 1024, 2),
+                "top_allocations": self._allocation_report(snapshot, top_n)
+            },
+            "errors": self.errors
+        }
+        return report, self._stats_text(top_n)
+
+    def _cpu_report(self, top_n: int) -> Dict[str, Any]:
+        """Funzioni con il maggior tempo cumulativo (tempi in secondi)"""
+        stats = pstats.Stats(self.profiler).stats if self.pool_seconds else {}
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return {
+            "total_calls": sum(nc for _, (_, nc, _, _, _) in stats.items()),
+            "top_functions": [
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": nc,
+                    "primitive_calls": cc,
+                    "total_time": round(tt, 6),
+                    "cumulative_time": round(ct, 6)
+                }
+                for (filename, line, name), (cc, nc, tt, ct, _) in rows[:top_n]
+            ]
+        }
+
+    def _allocation_report(self, snapshot: tracemalloc.Snapshot, top_n: int) -> List[Dict[str, Any]]:
+        """Righe di codice con più memoria ancora allocata a fine richiesta"""
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ])
+        return [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count
+            }
+            for stat in snapshot.statistics("lineno")[:top_n]
+        ]
+
+    def _stats_text(self, top_n: int) -> str:
+        """Tabella testuale di pstats, ordinata per tempo cumulativo"""
+        if not self.pool_seconds:
+            return ""
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats("cumulative").print_stats(top_n)
+        return output.getvalue()
+
+
+class RequestProfiler:
+    """
+    Profilazione su richiesta: una richiesta viene profilata se ha l'header
+    di attivazione oppure se rientra tra le prossime richieste prenotate da
+    un amministratore per un certo percorso. Una sola richiesta alla volta è
+    profilata (cProfile e tracemalloc sono globali al processo); i report
+    più recenti restano consultabili per request_id. Senza token la
+    profilazione resta disattivata: i report contengono percorsi e query
+    (es. i termini cercati dai clienti).
+    """
+
+    def __init__(self, enabled: bool, max_reports: int, top_n: int, trace_frames: int,
+                 token: Optional[str] = None):
+        if enabled and not token:
+            logger.warning("Profilazione richiesta senza PROFILING_TOKEN: resta disattivata")
+            enabled = False
+        self.enabled = enabled
+        self.max_reports = max_reports
+        self.top_n = top_n
+        self.trace_frames = trace_frames
+        self.token = token
+        self._reports: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._texts: Dict[str, str] = {}
+        self._armed: List[Dict[str, Any]] = []
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self.skipped_busy = 0
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """Il token fornito coincide con quello configurato"""
+        return self.token is not None and token is not None and hmac.compare_digest(token, self.token)
+
+    def arm(self, path_prefix: str, count: int) -> Dict[str, Any]:
+        """Prenota la profilazione delle prossime count richieste il cui percorso inizia con path_prefix"""
+        with self._lock:
+            entry = {"path_prefix": path_prefix, "remaining": count}
+            self._armed.append(entry)
+            return dict(entry)
+
+    def _take_armed(self, path: str) -> bool:
+        with self._lock:
+            for entry in self._armed:
+                if path.startswith(entry["path_prefix"]):
+                    entry["remaining"] -= 1
+                    if entry["remaining"] <= 0:
+                        self._armed.remove(entry)
+                    return True
+        return False
+
+    def begin(self, method: str, path: str, query: str, requested: bool) -> Optional[ProfileSession]:
+        """Apre una sessione se la richiesta va profilata e nessun'altra è in corso"""
+        if not self.enabled or not (requested or self._take_armed(path)):
+            return None
+        if not self._active.acquire(blocking=False):
+            self.skipped_busy += 1
+            return None
+        session = ProfileSession(method, path, query, self.trace_frames)
+        try:
+            session.start()
+        except Exception:
+            self._active.release()
+            raise
+        return session
+
+    def end(self, session: ProfileSession, status_code: int):
+        """
+        Chiude la sessione e conserva il report, scartando i più vecchi oltre
+        max_reports. Lo snapshot di tracemalloc è costoso: va chiamata da un
+        thread di lavoro, non dall'event loop.
+        """
+        try:
+            report, text = session.finish(status_code, self.top_n)
+        finally:
+            self._active.release()
+        with self._lock:
+            self._reports[session.request_id] = report
+            self._texts[session.request_id] = text
+            while len(self._reports) > self.max_reports:
+                oldest, _ = self._reports.popitem(last=False)
+                self._texts.pop(oldest, None)
+
+    def get(self, request_id: str) -> Dict[str, Any]:
+        """Report di una richiesta; KeyError se non presente"""
+        with self._lock:
+            return self._reports[request_id]
+
+    def get_text(self, request_id: str) -> str:
+        """Tabella di pstats di una richiesta; KeyError se non presente"""
+        with self._lock:
+            return self._texts[request_id]
+
+    def list_reports(self) -> List[Dict[str, Any]]:
+        """Riepilogo dei report, dal più recente"""
+        with self._lock:
+            reports = list(reversed(self._reports.values()))
+        return [
+            {
+                key: report[key]
+                for key in ("request_id", "method", "path", "query", "status_code", "started_at",
+                            "duration_seconds", "pool_seconds")
+            }
+            for report in reports
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._reports.clear()
+            self._texts.clear()
+            self._armed.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "reports": len(self._reports),
+                "max_reports": self.max_reports,
+                "armed": [dict(entry) for entry in self._armed],
+                "skipped_busy": self.skipped_busy
+            }
+
+
+# Istanza globale del profilatore delle richieste
+request_profiler = RequestProfiler(
+    enabled=settings.profiling_enabled,
+    max_reports=settings.profiling_max_reports,
+    top_n=settings.profiling_top_n,
+    trace_frames=settings.profiling_trace_frames,
+    token=settings.profiling_token
+)
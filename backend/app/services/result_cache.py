@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+
+def _nbytes(value: Any) -> int:
+    """Memoria occupata da un valore in cache (array numpy o dataframe)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return int(value.nbytes)
+
+
+class ResultCache:
+    """
+    Cache LRU con scadenza (TTL) per i vettori di id riga filtrati e ordinati
+    e per i risultati delle aggregazioni.
+
+    Le chiavi sono tuple il cui primo elemento è il file_id del dataset, così
+    da poter invalidare in blocco tutte le viste di un dataset, e il secondo
+    la sua versione: un risultato calcolato su righe ormai estese non viene
+    più letto anche se inserito dopo l'invalidazione.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Restituisce il valore in cache o None se assente/scaduto"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            created_at, value = entry
+            if time.monotonic() - created_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any):
+        """Inserisce un valore rispettando il limite di voci e di memoria"""
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            # Troppo grande per la cache: non vale la pena svuotarla
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), value)
+            self._bytes += nbytes
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, file_id: Optional[Hashable] = None):
+        """Invalida le voci di un dataset, o l'intera cache se file_id è None"""
+        with self._lock:
+            if file_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k in self._entries if k[0] == file_id]:
+                self._remove(key)
+
+    def _remove(self, key: Tuple):
+        _, value = self._entries.pop(key)
+        self._bytes -= _nbytes(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche di utilizzo della cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_mb": round(self._bytes / 1024 / 1024, 2),
+                "max_entries": self.max_entries,
+                "max_memory_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
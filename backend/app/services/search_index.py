@@ -0,0 +1,273 @@
+import copy
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Un token è una sequenza di caratteri alfanumerici (unicode): \w+ lato query,
+# la stessa classe di caratteri nella sintassi RE2 di Arrow lato indice
+TOKEN_PATTERN = r'\w+'
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+_TOKEN_SEPARATOR = r'[^\p{L}\p{N}_]+'
+# Segmenti di token accodati dalle aggiunte di righe prima di riunirli in uno solo
+MAX_TOKEN_SEGMENTS = 8
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, n_keys: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Raggruppa coppie (chiave, valore) in formato CSR: offsets[k]:offsets[k+1]
+    delimita i valori (ordinati, senza duplicati) della chiave k
+    """
+    pairs = np.unique(keys.astype(np.int64) << 32 | values.astype(np.int64))
+    sorted_keys = pairs >> 32
+    offsets = np.searchsorted(sorted_keys, np.arange(n_keys + 1))
+    return offsets, (pairs & 0xFFFFFFFF).astype(np.int32)
+
+
+def _gather(offsets: np.ndarray, values: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Concatena le liste CSR delle chiavi indicate, senza cicli Python"""
+    starts, ends = offsets[keys], offsets[keys + 1]
+    lengths = ends - starts
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return values[positions]
+
+
+def _to_numpy_mask(mask) -> np.ndarray:
+    return np.asarray(mask.to_numpy(zero_copy_only=False), dtype=bool)
+
+
+def _column_values(series: pd.Series) -> Tuple[np.ndarray, pa.Array, bool]:
+    """
+    Codici per riga (-1 per i nulli) e testo normalizzato dei valori distinti
+    della colonna; per le categorical i codici sono quelli del dataframe
+    (condivisi, True), per le altre colonne un factorize con il tipo intero
+    più piccolo
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques, shared = series.cat.codes.to_numpy(), series.cat.categories, True
+    else:
+        codes, uniques = pd.factorize(series)
+        shared = False
+        for dtype in (np.int8, np.int16, np.int32):
+            if len(uniques) < np.iinfo(dtype).max:
+                codes = codes.astype(dtype)
+                break
+    uniques = pd.Series(uniques)
+    if pd.api.types.is_string_dtype(uniques) and not pd.api.types.is_object_dtype(uniques):
+        text = pa.array(uniques, type=pa.large_string())
+    else:
+        # Stessa rappresentazione testuale di astype(str) sulla colonna, calcolata sui soli valori distinti
+        text = pa.array(uniques.astype(str).to_numpy(dtype=object), type=pa.large_string())
+    return codes, pc.utf8_lower(text), shared
+
+
+class _ColumnSegment:
+    """Righe [row_start, row_start + len(codes)) di una colonna e i loro valori distinti"""
+
+    __slots__ = ("row_start", "codes", "value_start", "n_values", "shared")
+
+    def __init__(self, row_start: int, codes: np.ndarray, value_start: int, n_values: int, shared: bool):
+        self.row_start = row_start
+        self.codes = codes
+        self.value_start = value_start
+        self.n_values = n_values
+        self.shared = shared
+
+
+class _TokenIndex:
+    """
+    Token dei valori distinti (posting list token -> valori) e trigrammi dei
+    token (trigramma -> token), in array CSR di interi
+    """
+
+    def __init__(self, values: pa.Array, first_value: int):
+        tokens = pc.split_pattern_regex(values, _TOKEN_SEPARATOR)
+        flat = pc.list_flatten(tokens)
+        owners = pc.list_parent_indices(tokens).to_numpy()
+        not_empty = _to_numpy_mask(pc.greater(pc.binary_length(flat), 0))
+        encoded = pc.dictionary_encode(flat.filter(pa.array(not_empty)))
+        self.vocabulary: pa.Array = encoded.dictionary
+        self.token_offsets, self.token_values = _csr(
+            encoded.indices.to_numpy(zero_copy_only=False), owners[not_empty], len(self.vocabulary)
+        )
+        self.token_values += first_value
+
+        # Trigrammi del vocabolario, estratti per posizione su tutti i token abbastanza lunghi
+        lengths = pc.utf8_length(self.vocabulary).to_numpy(zero_copy_only=False)
+        trigram_parts, token_parts = [], []
+        for start in range(int(lengths.max()) - 2 if len(lengths) else 0):
+            token_ids = np.flatnonzero(lengths >= start + 3)
+            if len(token_ids) == 0:
+                break
+            trigram_parts.append(pc.utf8_slice_codeunits(self.vocabulary.take(token_ids), start, start + 3))
+            token_parts.append(token_ids)
+        self.trigram_ids: Dict[str, int] = {}
+        self.trigram_offsets = np.zeros(1, dtype=np.int64)
+        self.trigram_tokens = np.array([], dtype=np.int32)
+        if trigram_parts:
+            trigrams = pc.dictionary_encode(pa.chunked_array(trigram_parts)).combine_chunks()
+            self.trigram_ids = {trigram: i for i, trigram in enumerate(trigrams.dictionary.to_pylist())}
+            self.trigram_offsets, self.trigram_tokens = _csr(
+                trigrams.indices.to_numpy(zero_copy_only=False), np.concatenate(token_parts), len(self.trigram_ids)
+            )
+
+    def tokens_containing(self, piece: str) -> np.ndarray:
+        """Id dei token che contengono la sottostringa (almeno 3 caratteri)"""
+        trigram_ids = []
+        for i in range(len(piece) - 2):
+            trigram_id = self.trigram_ids.get(piece[i:i + 3])
+            if trigram_id is None:
+                return np.array([], dtype=np.int32)
+            trigram_ids.append(trigram_id)
+        # Intersezione partendo dalla lista più corta
+        trigram_ids.sort(key=lambda t: self.trigram_offsets[t + 1] - self.trigram_offsets[t])
+        candidates = None
+        for trigram_id in trigram_ids:
+            tokens = self.trigram_tokens[self.trigram_offsets[trigram_id]:self.trigram_offsets[trigram_id + 1]]
+            candidates = tokens if candidates is None else np.intersect1d(candidates, tokens, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+        if len(piece) > 3:
+            candidates = candidates[_to_numpy_mask(pc.match_substring(self.vocabulary.take(candidates), piece))]
+        return candidates
+
+    def values_containing(self, piece: str, limit: int) -> Optional[np.ndarray]:
+        """
+        Id dei valori con un token che contiene la sottostringa; None se le
+        posting list superano limit (più conveniente una scansione dei valori)
+        """
+        token_ids = self.tokens_containing(piece)
+        if int((self.token_offsets[token_ids + 1] - self.token_offsets[token_ids]).sum()) > limit:
+            return None
+        return _gather(self.token_offsets, self.token_values, token_ids)
+
+    def memory_usage(self) -> int:
+        arrays = (self.token_offsets, self.token_values, self.trigram_offsets, self.trigram_tokens)
+        # Dizionario dei trigrammi: stima di ~100 byte per voce (chiave, valore e slot)
+        return int(self.vocabulary.nbytes + sum(a.nbytes for a in arrays) + 100 * len(self.trigram_ids))
+
+
+class SearchIndex:
+    """
+    Indice per la ricerca globale su un dataset.
+
+    Ogni colonna è rappresentata dai codici per riga dei suoi valori distinti
+    (per le categorical gli stessi codici del dataframe) e dal testo
+    normalizzato di quei valori, calcolato una volta in fase di ingest. I
+    valori distinti sono scomposti in token, con un indice a trigrammi sul
+    vocabolario dei token: una sottostringa della query si risolve nei valori
+    che la contengono senza scorrere le righe, e le righe si ottengono dai
+    codici con una tabella di lookup vettoriale. Le query senza frammenti di
+    almeno 3 caratteri (es. "po", "-") scorrono il testo dei valori distinti.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_rows = len(df)
+        self.columns = df.columns.tolist()
+        self._segments: Dict[str, List[_ColumnSegment]] = {}
+        texts = []
+        n_values = 0
+        for col in self.columns:
+            codes, text, shared = _column_values(df[col].reset_index(drop=True))
+            self._segments[col] = [_ColumnSegment(0, codes, n_values, len(text), shared)]
+            texts.append(text)
+            n_values += len(text)
+        self.values: pa.Array = pa.concat_arrays(texts) if texts else pa.array([], type=pa.large_string())
+        self._token_indexes = [_TokenIndex(self.values, 0)]
+
+    def extended(self, data: pd.DataFrame) -> "SearchIndex":
+        """
+        Nuovo indice per il dataframe con le righe accodate (data è il
+        dataframe completo): si codificano e si scompongono in token solo i
+        valori delle righe nuove, in un segmento aggiunto; le categorical
+        riprendono i codici del nuovo dataframe (le categorie unite possono
+        cambiare ordine). L'indice corrente resta invariato per le richieste
+        in corso.
+        """
+        index = copy.copy(self)
+        index.n_rows = len(data)
+        index._segments = {}
+        texts = []
+        n_values = len(self.values)
+        for col in self.columns:
+            if isinstance(data[col].dtype, pd.CategoricalDtype):
+                codes, text, shared = _column_values(data[col].reset_index(drop=True))
+                index._segments[col] = [_ColumnSegment(0, codes, n_values, len(text), shared)]
+            else:
+                codes, text, shared = _column_values(data[col].iloc[self.n_rows:].reset_index(drop=True))
+                segment = _ColumnSegment(self.n_rows, codes, n_values, len(text), shared)
+                index._segments[col] = self._segments[col] + [segment]
+            texts.append(text)
+            n_values += len(text)
+
+        new_values = pa.concat_arrays(texts)
+        index.values = pa.concat_arrays([self.values, new_values])
+        if len(self._token_indexes) < MAX_TOKEN_SEGMENTS:
+            index._token_indexes = self._token_indexes + [_TokenIndex(new_values, len(self.values))]
+        else:
+            index._token_indexes = [_TokenIndex(index.values, 0)]
+        return index
+
+    def _matching_values(self, needle: str) -> np.ndarray:
+        """Maschera dei valori distinti che contengono la query"""
+        pieces = sorted({p for p in _TOKEN_RE.findall(needle) if len(p) >= 3}, key=len, reverse=True)
+        # I frammenti contenuti in frammenti più lunghi non restringono i candidati
+        pieces = [p for i, p in enumerate(pieces) if not any(p in longer for longer in pieces[:i])]
+        if not pieces:
+            # Frammenti corti o solo punteggiatura: scansione del testo dei valori distinti
+            return _to_numpy_mask(pc.match_substring(self.values, needle))
+
+        # Oltre metà dei valori nelle posting list la scansione costa meno dell'espansione
+        limit = len(self.values) // 2
+        candidates: Optional[np.ndarray] = None
+        for piece in pieces:
+            piece_mask = np.zeros(len(self.values), dtype=bool)
+            for token_index in self._token_indexes:
+                value_ids = token_index.values_containing(piece, limit)
+                if value_ids is None:
+                    return _to_numpy_mask(pc.match_substring(self.values, needle))
+                piece_mask[value_ids] = True
+            candidates = piece_mask if candidates is None else candidates & piece_mask
+            if not candidates.any():
+                return candidates
+
+        if pieces != [needle]:
+            # Query con più frammenti o punteggiatura: verifica letterale sui soli valori candidati
+            value_ids = np.flatnonzero(candidates)
+            verified = _to_numpy_mask(pc.match_substring(self.values.take(value_ids), needle))
+            candidates[value_ids[~verified]] = False
+        return candidates
+
+    def search(self, query: str, columns: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Restituisce le posizioni (ordinate) delle righe che contengono la query
+        come sottostringa letterale, senza distinzione tra maiuscole e minuscole.
+        Con columns la corrispondenza è cercata solo in quelle colonne.
+        """
+        needle = query.lower()
+        if not needle:
+            return np.arange(self.n_rows)
+
+        matching = self._matching_values(needle)
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for col in (columns if columns is not None else self.columns):
+            for segment in self._segments[col]:
+                hits = matching[segment.value_start:segment.value_start + segment.n_values]
+                if not hits.any():
+                    continue
+                # Lookup per codice, con una posizione in più (sempre False) per i nulli (-1)
+                lookup = np.append(hits, False)
+                mask[segment.row_start:segment.row_start + len(segment.codes)] |= lookup[segment.codes]
+        return np.flatnonzero(mask)
+
+    def memory_usage(self) -> int:
+        """Byte occupati da testo dei valori distinti, codici per riga (non condivisi) e indici dei token"""
+        memory = self.values.nbytes + sum(t.memory_usage() for t in self._token_indexes)
+        memory += sum(
+            segment.codes.nbytes
+            for segments in self._segments.values() for segment in segments if not segment.shared
+        )
+        return int(memory)
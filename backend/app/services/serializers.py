@@ -0,0 +1,47 @@
+import json
+from typing import Any, Dict
+
+import pandas as pd
+import pyarrow as pa
+
+# Tipi di contenuto dei formati di risposta alternativi di /data
+COLUMNAR_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Chiave dei metadati di paginazione nello schema Arrow
+ARROW_METADATA_KEY = b"pagination"
+
+
+def _meta_to_json(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadati di paginazione serializzabili (il DataFilter diventa un dict)"""
+    filters = meta.get("filters_applied")
+    if filters is not None and hasattr(filters, "model_dump"):
+        meta = {**meta, "filters_applied": filters.model_dump(mode="json")}
+    return meta
+
+
+def to_columnar_json(page_data: pd.DataFrame, meta: Dict[str, Any]) -> bytes:
+    """
+    Pagina in formato colonnare: {"data": {colonna: [valori]}, ...metadati}.
+    Ogni colonna è serializzata dall'encoder JSON nativo di pandas, senza
+    passare dai record né dalla validazione pydantic per cella.
+    """
+    data = ",".join(
+        f"{json.dumps(str(col))}:{page_data[col].to_json(orient='values', date_format='iso', date_unit='ms')}"
+        for col in page_data.columns
+    )
+    header = json.dumps(_meta_to_json(meta), ensure_ascii=False)
+    # Metadati seguiti dal blocco dati, nello stesso oggetto JSON
+    return f'{header[:-1]}, "layout": "columnar", "data": {{{data}}}}}'.encode("utf-8")
+
+
+def to_arrow_ipc(page_data: pd.DataFrame, meta: Dict[str, Any]) -> bytes:
+    """Pagina come stream Arrow IPC, con i metadati di paginazione nello schema"""
+    table = pa.Table.from_pandas(page_data, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        ARROW_METADATA_KEY: json.dumps(_meta_to_json(meta)).encode("utf-8")
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
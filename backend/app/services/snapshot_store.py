@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from app.services.ingestion import concat_rows
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = "catalog.json"
+
+
+class SnapshotStore:
+    """
+    Snapshot colonnari su disco dei dataset puliti, con un catalogo dei file_id noti.
+
+    I dataframe sono salvati in formato Arrow IPC (Feather v2) non compresso:
+    la riapertura è una lettura colonnare del file, senza ripassare da
+    read_excel e dalla pulizia. Il file è letto via memory-map ma
+    convertito in un dataframe pandas, quindi i dati riaperti occupano
+    memoria come quelli appena caricati. Le colonne non rappresentabili in
+    Arrow (es. object con tipi misti) ricadono su un pickle dello stesso
+    dataframe.
+
+    Le righe accodate a un dataset esistente sono scritte come segmenti
+    separati ({file_id}.{n}.arrow): il costo di un'aggiunta dipende dalle
+    sole righe nuove, e alla riapertura i segmenti vengono riuniti.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.catalog_path = os.path.join(folder, CATALOG_FILENAME)
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        self._catalog: Dict[str, Dict[str, Any]] = self._read_catalog()
+
+    def _read_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """Legge il catalogo, scartando le voci senza snapshot su disco"""
+        if not os.path.exists(self.catalog_path):
+            return {}
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Impossibile leggere il catalogo dei dataset: %s", e)
+            return {}
+        return {
+            file_id: entry for file_id, entry in catalog.items()
+            if os.path.exists(os.path.join(self.folder, entry["filename"]))
+        }
+
+    def _write_catalog(self):
+        """Scrive il catalogo in modo atomico"""
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._catalog, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.catalog_path)
+
+    def save(self, file_id: str, df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Salva lo snapshot del dataframe e lo registra nel catalogo"""
+        started = time.perf_counter()
+        df = df.reset_index(drop=True)
+        try:
+            filename = f"{file_id}.arrow"
+            df.to_feather(os.path.join(self.folder, filename), compression='uncompressed')
+            snapshot_format = "arrow"
+        except pa.ArrowException:
+            filename = f"{file_id}.pkl"
+            df.to_pickle(os.path.join(self.folder, filename))
+            snapshot_format = "pickle"
+
+        now = time.time()
+        entry = {
+            "file_id": file_id,
+            "filename": filename,
+            "format": snapshot_format,
+            "total_rows": len(df),
+            "columns": df.columns.tolist(),
+            "size_bytes": os.path.getsize(os.path.join(self.folder, filename)),
+            "created_at": now,
+            "updated_at": now,
+            "write_seconds": round(time.perf_counter() - started, 4),
+            **(metadata or {})
+        }
+        with self._lock:
+            previous = self._catalog.get(file_id)
+            self._catalog[file_id] = entry
+            self._write_catalog()
+        if previous is not None:
+            # Snapshot riscritto per intero: i file precedenti non servono più
+            for old_filename in [previous["filename"]] + previous.get("segments", []):
+                if old_filename != filename and os.path.exists(os.path.join(self.folder, old_filename)):
+                    os.remove(os.path.join(self.folder, old_filename))
+        return entry
+
+    def append(self, file_id: str, new_rows: pd.DataFrame, full_df: pd.DataFrame,
+               metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Accoda righe allo snapshot scrivendo solo un nuovo segmento; se lo
+        snapshot non è in formato Arrow lo riscrive per intero da full_df
+        """
+        entry = self.get_entry(file_id)
+        if entry["format"] != "arrow":
+            return self.save(file_id, full_df, metadata)
+
+        started = time.perf_counter()
+        segments = list(entry.get("segments", []))
+        filename = f"{file_id}.{len(segments) + 1}.arrow"
+        try:
+            new_rows.reset_index(drop=True).to_feather(
+                os.path.join(self.folder, filename), compression='uncompressed'
+            )
+        except pa.ArrowException:
+            return self.save(file_id, full_df, metadata)
+
+        segments.append(filename)
+        entry.update({
+            "segments": segments,
+            "total_rows": len(full_df),
+            "size_bytes": entry["size_bytes"] + os.path.getsize(os.path.join(self.folder, filename)),
+            "updated_at": time.time(),
+            "append_seconds": round(time.perf_counter() - started, 4),
+            **(metadata or {})
+        })
+        with self._lock:
+            self._catalog[file_id] = entry
+            self._write_catalog()
+        return entry
+
+    def load(self, file_id: str) -> pd.DataFrame:
+        """Riapre uno snapshot come dataframe pandas (copia in memoria), con gli eventuali segmenti accodati"""
+        entry = self.get_entry(file_id)
+        path = os.path.join(self.folder, entry["filename"])
+        if entry["format"] != "arrow":
+            return pd.read_pickle(path)
+        df = feather.read_table(path, memory_map=True).to_pandas()
+        segments = [
+            feather.read_table(os.path.join(self.folder, segment), memory_map=True).to_pandas()
+            for segment in entry.get("segments", [])
+        ]
+        return concat_rows([df] + segments) if segments else df
+
+    def get_entry(self, file_id: str) -> Dict[str, Any]:
+        """Voce di catalogo di un dataset"""
+        with self._lock:
+            if file_id not in self._catalog:
+                raise KeyError(file_id)
+            return dict(self._catalog[file_id])
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Voci di catalogo ordinate per data di creazione"""
+        with self._lock:
+            return sorted((dict(e) for e in self._catalog.values()), key=lambda e: e["created_at"])
+
+    def remove(self, file_id: str):
+        """Elimina snapshot e voce di catalogo"""
+        with self._lock:
+            entry = self._catalog.pop(file_id, None)
+            if entry is None:
+                return
+            for filename in [entry["filename"]] + entry.get("segments", []):
+                path = os.path.join(self.folder, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_catalog()
@@ -0,0 +1,296 @@
+import copy
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def _mixed_type_order(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ordine stabile di una colonna con tipi non confrontabili (es. numeri e
+    testo nella stessa colonna Excel): prima i numeri, poi il testo, poi gli
+    altri valori come testo, ciascun gruppo nel proprio ordine. Restituisce
+    le posizioni ordinate e gli indici lungo la permutazione in cui cambia
+    il tipo (inizio di un nuovo gruppo di valori)
+    """
+    kinds = values.map(lambda v: 0 if _is_number(v) else 1 if isinstance(v, str) else 2).to_numpy()
+    parts = []
+    for kind in (0, 1, 2):
+        part = values[kinds == kind]
+        if kind == 2:
+            part = part.astype(str)
+        parts.append(part.sort_values(kind='stable').index.to_numpy(np.int64))
+    sizes = np.cumsum([len(part) for part in parts])[:-1]
+    return np.concatenate(parts), sizes[sizes < len(values)]
+
+
+class SortPermutation:
+    """
+    Permutazione ordinata di una colonna, calcolata una volta e riusata per
+    ogni pagina ordinata su quella colonna.
+
+    L'ordinamento è stabile (a parità di valore resta l'ordine delle righe)
+    con i valori nulli in fondo, come ORDER BY col IS NULL, col, rowid.
+    L'ordine decrescente si ricava dalla stessa permutazione invertendo i
+    gruppi di valori uguali, senza un secondo ordinamento.
+    """
+
+    def __init__(self, series: pd.Series):
+        series = series.reset_index(drop=True)
+        self.n_rows = len(series)
+        not_null = series.dropna()
+
+        # Posizioni dei valori non nulli in ordine crescente (mergesort, stabile)
+        kind_changes = None
+        try:
+            self.ascending = not_null.sort_values(kind='stable').index.to_numpy(np.int64)
+        except TypeError:
+            self.ascending, kind_changes = _mixed_type_order(not_null)
+        self.nulls = np.flatnonzero(series.isna().to_numpy())
+
+        # Gruppi di valori uguali lungo la permutazione
+        sorted_values = not_null.loc[self.ascending]
+        if isinstance(sorted_values.dtype, pd.CategoricalDtype):
+            sorted_values = sorted_values.cat.codes
+        values = sorted_values.to_numpy()
+        changes = np.empty(len(values), dtype=bool)
+        changes[:1] = True
+        changes[1:] = values[1:] != values[:-1]
+        if kind_changes is not None:
+            changes[kind_changes] = True
+        group_ids = np.cumsum(changes) - 1
+        self.n_groups = int(group_ids[-1]) + 1 if len(group_ids) else 0
+        self.group_starts = np.flatnonzero(changes)
+
+        # Gruppo di ogni riga (i nulli dopo l'ultimo gruppo), per ordinare pochi id riga
+        self.row_groups = np.full(self.n_rows, self.n_groups, dtype=np.int64)
+        self.row_groups[self.ascending] = group_ids
+
+    def permutation(self, ascending: bool = True) -> np.ndarray:
+        """Permutazione completa delle righe, nulli in fondo"""
+        if ascending:
+            return np.concatenate((self.ascending, self.nulls))
+
+        # Gruppi in ordine inverso, righe in ordine originale dentro ogni gruppo
+        n_values = len(self.ascending)
+        sizes = np.diff(np.append(self.group_starts, n_values))
+        new_starts = n_values - self.group_starts - sizes
+        offsets = np.arange(n_values) - np.repeat(self.group_starts, sizes)
+        descending = np.empty(n_values, dtype=np.int64)
+        descending[np.repeat(new_starts, sizes) + offsets] = self.ascending
+        return np.concatenate((descending, self.nulls))
+
+    def sort_rows(self, rows: np.ndarray, ascending: bool = True) -> np.ndarray:
+        """
+        Ordina un sottoinsieme di posizioni (ordinate e senza duplicati):
+        filtra la permutazione in O(n) oppure, per pochi id riga, ordina
+        solo quelli per gruppo in O(k log k)
+        """
+        k = len(rows)
+        if k == 0:
+            return rows
+        if k == self.n_rows:
+            return self.permutation(ascending)
+
+        if k * max(np.log2(k), 1) < self.n_rows:
+            groups = self.row_groups[rows]
+            if not ascending:
+                groups = np.where(groups == self.n_groups, self.n_groups, self.n_groups - 1 - groups)
+            return rows[np.argsort(groups, kind='stable')]
+
+        permutation = self.permutation(ascending)
+        selected = np.zeros(self.n_rows, dtype=bool)
+        selected[rows] = True
+        return permutation[selected[permutation]]
+
+    def extended(self, series: pd.Series) -> Optional["SortPermutation"]:
+        """
+        Permutazione della colonna dopo l'aggiunta di righe in coda (series è la
+        colonna completa). Se i nuovi valori non precedono quelli esistenti,
+        come per le date di un estratto del mese successivo, le righe nuove si
+        accodano in O(k); altrimenti None e la permutazione va ricalcolata.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return None
+        series = series.reset_index(drop=True)
+        new = series.iloc[self.n_rows:]
+        delta = SortPermutation(new)
+        if len(delta.ascending) and len(self.ascending):
+            last_value = series.iloc[self.ascending[-1]]
+            first_new = new.iloc[delta.ascending[0]]
+            try:
+                if first_new < last_value:
+                    return None
+            except TypeError:
+                # Tipi non confrontabili: l'ordine tra i tipi lo stabilisce solo il ricalcolo
+                return None
+            same_group = bool(first_new == last_value)
+        else:
+            same_group = False
+
+        extended = copy.copy(self)
+        extended.n_rows = len(series)
+        extended.ascending = np.concatenate((self.ascending, delta.ascending + self.n_rows))
+        extended.nulls = np.concatenate((self.nulls, delta.nulls + self.n_rows))
+        # Gruppi delle righe nuove dopo quelli esistenti (il primo si fonde con l'ultimo se uguale)
+        offset = self.n_groups - 1 if same_group else self.n_groups
+        new_starts = delta.group_starts[1:] if same_group else delta.group_starts
+        extended.group_starts = np.concatenate((self.group_starts, new_starts + len(self.ascending)))
+        extended.n_groups = offset + delta.n_groups
+        row_groups = np.where(delta.row_groups == delta.n_groups, extended.n_groups, delta.row_groups + offset)
+        old_groups = np.where(self.row_groups == self.n_groups, extended.n_groups, self.row_groups)
+        extended.row_groups = np.concatenate((old_groups, row_groups))
+        return extended
+
+    def memory_usage(self) -> int:
+        return int(self.ascending.nbytes + self.nulls.nbytes + self.group_starts.nbytes + self.row_groups.nbytes)
+
+
+class DateIndex:
+    """
+    Indice ordinato di una colonna datetime: un intervallo di date si risolve
+    con due ricerche binarie (searchsorted) sui valori ordinati della
+    permutazione, senza scorrere la colonna.
+    """
+
+    def __init__(self, series: pd.Series, permutation: SortPermutation):
+        self.n_rows = len(series)
+        self.row_ids = permutation.ascending
+        self.sorted_values = series.to_numpy()[self.row_ids]
+
+    def extended(self, series: pd.Series, permutation: SortPermutation) -> "DateIndex":
+        """Indice dopo l'aggiunta di righe in coda, dalla permutazione già estesa"""
+        extended = copy.copy(self)
+        extended.n_rows = len(series)
+        extended.row_ids = permutation.ascending
+        new_ids = permutation.ascending[len(self.row_ids):]
+        new_values = series.iloc[self.n_rows:].to_numpy()[new_ids - self.n_rows]
+        extended.sorted_values = np.concatenate((self.sorted_values, new_values))
+        return extended
+
+    def bounds(self, date_from=None, date_to=None) -> Tuple[int, int]:
+        """Estremi [start, end) dell'intervallo di date lungo la permutazione"""
+        start = 0 if date_from is None else int(np.searchsorted(self.sorted_values, _to_datetime64(date_from), side='left'))
+        end = len(self.sorted_values) if date_to is None else int(np.searchsorted(self.sorted_values, _to_datetime64(date_to), side='right'))
+        return start, max(start, end)
+
+    def range_rows(self, date_from=None, date_to=None) -> np.ndarray:
+        """Posizioni (ordinate) delle righe con date_from <= data <= date_to"""
+        start, end = self.bounds(date_from, date_to)
+        return np.sort(self.row_ids[start:end])
+
+    def filter_rows(self, rows: np.ndarray, date_from=None, date_to=None) -> np.ndarray:
+        """Restringe un insieme ordinato di posizioni all'intervallo di date"""
+        in_range = self.range_rows(date_from, date_to)
+        if len(rows) == self.n_rows:
+            return in_range
+        return np.intersect1d(rows, in_range, assume_unique=True)
+
+    def memory_usage(self) -> int:
+        # row_ids è condiviso con la permutazione della colonna
+        return int(self.sorted_values.nbytes)
+
+
+class PrefixSumIndex:
+    """
+    Somme cumulate di una colonna di importi nell'ordine della colonna data
+    (stesso ordinamento stabile del DateIndex). Saldo a una data e totali di
+    un intervallo si ottengono con una ricerca binaria e una sottrazione tra
+    due somme prefisse, senza scorrere le righe.
+
+    Gli importi nulli valgono zero; le righe senza data non entrano nel saldo.
+    """
+
+    def __init__(self, date_index: DateIndex, amounts: pd.Series):
+        self.date_index = date_index
+        values = amounts.to_numpy(dtype=np.float64, na_value=np.nan)[date_index.row_ids]
+        for name, prefix in self._prefixes(values, start=None).items():
+            setattr(self, name, prefix)
+
+        # Posizione di ogni riga nell'ordine per data (-1 per le righe senza data)
+        self.ranks = np.full(date_index.n_rows, -1, dtype=np.int64)
+        self.ranks[date_index.row_ids] = np.arange(len(date_index.row_ids))
+
+    def _prefixes(self, values: np.ndarray, start: Optional["PrefixSumIndex"]) -> Dict[str, np.ndarray]:
+        """Somme prefisse di totali, entrate, uscite e conteggi, proseguendo quelle di start"""
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+        series = {
+            "totals": values,
+            "credits": np.where(values > 0, values, 0.0),
+            "debits": np.where(values < 0, values, 0.0),
+            "counts": present.astype(np.int64),
+            "credit_counts": (values > 0).astype(np.int64),
+            "debit_counts": (values < 0).astype(np.int64)
+        }
+        if start is None:
+            return {name: _prefix(array) for name, array in series.items()}
+        return {
+            name: np.concatenate((getattr(start, name), _prefix(array)[1:] + getattr(start, name)[-1]))
+            for name, array in series.items()
+        }
+
+    def extended(self, date_index: DateIndex, amounts: pd.Series) -> "PrefixSumIndex":
+        """
+        Somme prefisse dopo l'aggiunta di righe in coda (date non precedenti):
+        si prosegue dall'ultimo totale sommando solo gli importi nuovi
+        """
+        n_old = self.date_index.n_rows
+        new_ids = date_index.row_ids[len(self.date_index.row_ids):]
+        values = amounts.iloc[n_old:].to_numpy(dtype=np.float64, na_value=np.nan)[new_ids - n_old]
+
+        extended = copy.copy(self)
+        extended.date_index = date_index
+        for name, prefix in self._prefixes(values, start=self).items():
+            setattr(extended, name, prefix)
+        new_ranks = np.full(date_index.n_rows - n_old, -1, dtype=np.int64)
+        new_ranks[new_ids - n_old] = np.arange(len(self.date_index.row_ids), len(date_index.row_ids))
+        extended.ranks = np.concatenate((self.ranks, new_ranks))
+        return extended
+
+    def balance_at(self, date) -> float:
+        """Somma degli importi fino alla data indicata (inclusa)"""
+        return float(self.totals[self.date_index.bounds(date_to=date)[1]])
+
+    def range_totals(self, date_from=None, date_to=None) -> Dict[str, Any]:
+        """Totali dell'intervallo date_from <= data <= date_to"""
+        start, end = self.date_index.bounds(date_from, date_to)
+        return {
+            "balance_before": float(self.totals[start]),
+            "balance_after": float(self.totals[end]),
+            "total": float(self.totals[end] - self.totals[start]),
+            "credits": float(self.credits[end] - self.credits[start]),
+            "debits": float(self.debits[end] - self.debits[start]),
+            "count": int(self.counts[end] - self.counts[start]),
+            "credit_count": int(self.credit_counts[end] - self.credit_counts[start]),
+            "debit_count": int(self.debit_counts[end] - self.debit_counts[start])
+        }
+
+    def running_balance(self, rows: np.ndarray) -> np.ndarray:
+        """Saldo progressivo (in ordine di data) delle righe indicate; NaN per le righe senza data"""
+        ranks = self.ranks[rows]
+        return np.where(ranks >= 0, self.totals[ranks + 1], np.nan)
+
+    def memory_usage(self) -> int:
+        arrays = (self.totals, self.credits, self.debits, self.counts,
+                  self.credit_counts, self.debit_counts, self.ranks)
+        return int(sum(a.nbytes for a in arrays))
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Somme cumulate precedute da uno zero"""
+    prefix = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+def _to_datetime64(value) -> np.datetime64:
+    """Converte un estremo dell'intervallo in datetime64 senza fuso orario"""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return timestamp.to_datetime64()
@@ -0,0 +1,165 @@
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.models.data_models import DataFilter
+
+# Tipi dichiarati da pandas.to_sql per le colonne datetime
+DATETIME_DECLTYPES = ("TIMESTAMP", "DATETIME", "DATE")
+
+
+def table_name_for(file_id: str) -> str:
+    """Nome della tabella SQLite associata a un file_id"""
+    return f"data_{file_id.replace('-', '_')}"
+
+
+def quote_identifier(name: str) -> str:
+    """Quota un identificatore SQLite"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def index_name_for(table_name: str, column: str) -> str:
+    """Nome dell'indice SQLite di una colonna"""
+    return f"idx_{table_name}_{column}"
+
+
+def _escape_like(value: str) -> str:
+    """Escape dei caratteri speciali di LIKE"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def unicode_lower(value: Any) -> Optional[str]:
+    """lower() di Python registrata su SQLite, il cui lower/LIKE ignora il maiuscolo solo per l'ASCII"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def connect_for_query(db_path: str) -> sqlite3.Connection:
+    """Connessione di sola lettura delle query, con unicode_lower per la ricerca"""
+    conn = sqlite3.connect(db_path)
+    conn.create_function("unicode_lower", 1, unicode_lower, deterministic=True)
+    return conn
+
+
+class SQLQueryEngine:
+    """
+    Motore di query alternativo che traduce un DataFilter in SQL parametrico
+    sulla tabella data_<uuid> creata all'upload, così i dati non devono
+    risiedere in memoria. Le query non scrivono mai sul database: gli
+    indici delle colonne ordinate li crea DataService al primo uso.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _table_columns(self, conn: sqlite3.Connection, table_name: str) -> List[Tuple[str, str]]:
+        """Restituisce (nome, tipo dichiarato) per ogni colonna della tabella"""
+        rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+        if not rows:
+            raise ValueError(f"Tabella {table_name} non trovata")
+        return [(row[1], (row[2] or "").upper()) for row in rows]
+
+    def _date_column(self, columns: List[Tuple[str, str]], filters: DataFilter) -> Optional[str]:
+        """Colonna dell'intervallo di date: quella richiesta o la prima datetime (come il motore pandas)"""
+        date_columns = [name for name, decltype in columns if decltype in DATETIME_DECLTYPES]
+        if filters.date_column and (filters.date_from or filters.date_to):
+            if filters.date_column not in date_columns:
+                raise ValueError(f"La colonna '{filters.date_column}' non è una colonna di date")
+            return filters.date_column
+        return date_columns[0] if date_columns else None
+
+    @staticmethod
+    def _search_expression(name: str, decltype: str, ascii_needle: bool) -> str:
+        """
+        Colonna confrontata dalla ricerca: con una query ASCII basta il LIKE
+        nativo, che ignora il maiuscolo delle lettere ASCII senza chiamate a
+        Python; altrimenti le colonne di testo passano da unicode_lower
+        """
+        column = quote_identifier(name)
+        return f"unicode_lower({column})" if decltype == "TEXT" and not ascii_needle else column
+
+    def _build_where(self, columns: List[Tuple[str, str]], filters: DataFilter) -> Tuple[str, List[Any]]:
+        """Costruisce la clausola WHERE con i relativi parametri"""
+        clauses: List[str] = []
+        params: List[Any] = []
+
+        # Ricerca globale: sottostringa letterale su tutte le colonne (o solo su quelle proiettate),
+        # senza distinguere maiuscole e minuscole anche per le lettere accentate (come il motore pandas)
+        if filters.search:
+            pattern = f"%{_escape_like(filters.search.lower())}%"
+            ascii_needle = filters.search.isascii()
+            declared = dict(columns)
+            search_columns = [name for name, _ in columns]
+            if filters.search_columns_only and filters.columns:
+                search_columns = list(dict.fromkeys(filters.columns))
+            clauses.append("(" + " OR ".join(
+                f"{self._search_expression(name, declared.get(name, ''), ascii_needle)} LIKE ? ESCAPE '\\'"
+                for name in search_columns
+            ) + ")")
+            params.extend([pattern] * len(search_columns))
+
+        # Filtro date sulla colonna richiesta o sulla prima datetime (come il motore pandas)
+        date_column = self._date_column(columns, filters)
+        if date_column:
+            date_col = quote_identifier(date_column)
+            if filters.date_from:
+                clauses.append(f"{date_col} >= ?")
+                params.append(filters.date_from.strftime('%Y-%m-%d %H:%M:%S'))
+            if filters.date_to:
+                clauses.append(f"{date_col} <= ?")
+                params.append(filters.date_to.strftime('%Y-%m-%d %H:%M:%S'))
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def get_page(self, file_id: str, filters: DataFilter) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Recupera una pagina di dati filtrata e ordinata direttamente da SQLite, con i metadati"""
+        table_name = table_name_for(file_id)
+        conn = connect_for_query(self.db_path)
+        try:
+            columns = self._table_columns(conn, table_name)
+            column_names = [name for name, _ in columns]
+
+            # Proiezione: solo le colonne richieste vengono lette e restituite
+            selected = list(dict.fromkeys(filters.columns)) if filters.columns else column_names
+            unknown = [name for name in selected if name not in column_names]
+            if unknown:
+                raise ValueError(f"Colonne non trovate: {', '.join(unknown)}")
+            declared = dict(columns)
+            where, params = self._build_where(columns, filters)
+            table = quote_identifier(table_name)
+
+            total_rows = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+
+            # Ordinamento con i NULL in fondo, come sort_values di pandas
+            # (NULLS LAST, a differenza di "colonna IS NULL", lascia usare l'indice della colonna)
+            order_by = " ORDER BY rowid"
+            if filters.sort_by and filters.sort_by in column_names:
+                sort_col = quote_identifier(filters.sort_by)
+                direction = "ASC" if filters.sort_order == 'asc' else "DESC"
+                order_by = f" ORDER BY {sort_col} {direction} NULLS LAST, rowid"
+
+            offset = (filters.page - 1) * filters.page_size
+            select_list = ", ".join(quote_identifier(name) for name in selected)
+            page_data = pd.read_sql_query(
+                f"SELECT {select_list} FROM {table}{where}{order_by} LIMIT ? OFFSET ?",
+                conn,
+                params=params + [filters.page_size, offset],
+                parse_dates=[name for name in selected if declared[name] in DATETIME_DECLTYPES]
+            )
+        finally:
+            conn.close()
+
+        return page_data, {
+            "total_rows": total_rows,
+            "total_pages": (total_rows + filters.page_size - 1) // filters.page_size,
+            "current_page": filters.page,
+            "page_size": filters.page_size,
+            "columns": selected,
+            "filters_applied": filters
+        }
+
+    def get_data(self, file_id: str, filters: DataFilter) -> Dict[str, Any]:
+        """Pagina di dati come lista di record"""
+        page_data, meta = self.get_page(file_id, filters)
+        return {"data": page_data.to_dict('records'), **meta}
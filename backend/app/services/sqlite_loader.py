@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services.ingestion import is_description_column
+from app.services.metrics import StageTimer
+from app.services.sql_engine import index_name_for, quote_identifier
+
+# Pragma della connessione di caricamento: il database è temporaneo e si
+# ricostruisce dagli snapshot, quindi la durabilità del commit non serve
+BULK_LOAD_PRAGMAS = {"synchronous": "OFF", "temp_store": "MEMORY"}
+
+# Un solo scrittore per processo sul database temporaneo: i caricamenti
+# concorrenti si mettono in coda invece di fallire con "database is locked"
+WRITE_LOCK = threading.Lock()
+
+
+def connect_for_load(db_path: str, bulk_load: bool, cache_size_mb: int,
+                     busy_timeout: float) -> sqlite3.Connection:
+    """
+    Connessione per il caricamento, con i pragma di bulk load se abilitati;
+    busy_timeout (secondi) è l'attesa del lock di scrittura tenuto da un
+    altro processo sullo stesso database
+    """
+    conn = sqlite3.connect(db_path, timeout=busy_timeout)
+    if bulk_load:
+        for name, value in BULK_LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        # Valore negativo: dimensione in KiB invece che in pagine
+        conn.execute(f"PRAGMA cache_size = {-cache_size_mb * 1024}")
+    return conn
+
+
+def sql_type(series: pd.Series) -> str:
+    """Tipo dichiarato della colonna, lo stesso che userebbe pandas.to_sql"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def _column_values(series: pd.Series) -> List[Any]:
+    """
+    Valori della colonna come oggetti Python pronti per executemany,
+    convertiti in blocco: date come testo 'AAAA-MM-GG HH:MM:SS' (come
+    pandas.to_sql), NaN/NaT come NULL
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.to_numpy(dtype="datetime64[us]")
+        seconds = values.astype("datetime64[s]")
+        # Frazioni di secondo rare negli estratti: solo in quel caso la conversione valore per valore
+        if np.any(seconds[~np.isnat(values)] != values[~np.isnat(values)]):
+            text = np.array([str(v).replace("T", " ") for v in values], dtype=object)
+        else:
+            text = np.char.replace(np.datetime_as_string(seconds, unit="s"), "T", " ").astype(object)
+        text[np.isnat(values)] = None
+        return text.tolist()
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        result = values.astype(object)
+        result[np.isnan(values)] = None
+        return result.tolist()
+    return series.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def create_table(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame):
+    """Crea la tabella con le colonne e i tipi del primo blocco"""
+    columns = ", ".join(f"{quote_identifier(col)} {sql_type(df[col])}" for col in df.columns)
+    conn.execute(f"CREATE TABLE {quote_identifier(table_name)} ({columns})")
+
+
+def insert_rows(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame,
+                timer: Optional[StageTimer] = None):
+    """
+    Inserisce un blocco con un unico executemany nella transazione corrente
+    (il commit è a carico del chiamante, una volta per caricamento)
+    """
+    timer = timer if timer is not None else StageTimer("sqlite_load")
+    with timer.stage("sqlite_prepare"):
+        columns = [_column_values(df[col]) for col in df.columns]
+    placeholders = ", ".join("?" * len(df.columns))
+    names = ", ".join(quote_identifier(col) for col in df.columns)
+    with timer.stage("sqlite_insert"):
+        conn.executemany(
+            f"INSERT INTO {quote_identifier(table_name)} ({names}) VALUES ({placeholders})", zip(*columns)
+        )
+
+
+def create_indexes(conn: sqlite3.Connection, table_name: str, columns: List[str]):
+    """Indici delle colonne nella transazione corrente (il commit è a carico del chiamante)"""
+    for column in columns:
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name_for(table_name, column))} "
+            f"ON {quote_identifier(table_name)}({quote_identifier(column)})"
+        )
+
+
+def load_indexed_columns(df: pd.DataFrame, query_engine: str) -> List[str]:
+    """
+    Colonne indicizzate al caricamento: solo la colonna di date risolta di
+    default dai filtri per intervallo (la prima datetime), e nessuna se le
+    query non usano SQLite. Gli indici delle colonne ordinate si creano al
+    primo ordinamento (ensure_indexes).
+    """
+    if query_engine != "sqlite":
+        return []
+    date_columns = [col for col in df.columns if sql_type(df[col]) == "TIMESTAMP"]
+    return date_columns[:1]
+
+
+def ensure_indexes(conn: sqlite3.Connection, table_name: str, columns: List[str],
+                   default_date: bool = False) -> List[str]:
+    """
+    Crea gli indici mancanti delle colonne (quelle inesistenti sono ignorate)
+    e, con default_date, della prima colonna di date, quella dei filtri per
+    intervallo senza date_column; restituisce le colonne indicizzate
+    """
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()
+    columns = [col for col in columns if col in {row[1] for row in rows}]
+    if default_date:
+        columns += [row[1] for row in rows if (row[2] or "").upper() == "TIMESTAMP"][:1]
+    create_indexes(conn, table_name, columns)
+    return columns
+
+
+def load_stats(bulk_load: bool, cache_size_mb: int, indexed_columns: List[str]) -> Dict[str, Any]:
+    """Riepilogo del caricamento SQLite per le statistiche di ingest"""
+    return {
+        "bulk_load": bulk_load,
+        "pragmas": {**BULK_LOAD_PRAGMAS, "cache_size_mb": cache_size_mb} if bulk_load else {},
+        "indexed_columns": indexed_columns
+    }
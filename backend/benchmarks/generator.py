@@ -0,0 +1,139 @@
+"""
+Generatore deterministico di estratti conto italiani sintetici.
+
+Le righe riproducono il formato degli export bancari: date gg/mm/aaaa,
+importi con virgola decimale e punto per le migliaia ("-1.234,56"),
+descrizioni con controparti ricorrenti. A parità di seme e numero di righe
+il file generato è identico, così i risultati sono confrontabili tra commit.
+"""
+import argparse
+import os
+import re
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Excel non supporta più di 1.048.576 righe per foglio (intestazione inclusa)
+XLSX_MAX_ROWS = 1048575
+# Intervallo massimo di date generate (giorni)
+MAX_DAYS = 3650
+
+# Tipi di movimento: (modello di descrizione, importo medio in euro, segno, peso)
+MOVEMENTS = [
+    ("PAGAMENTO POS {merchant} {city}", 45.0, -1, 0.38),
+    ("ADDEBITO SDD {utility} RIF. {ref}", 85.0, -1, 0.12),
+    ("BONIFICO A FAVORE DI {person} CAUSALE {reason}", 350.0, -1, 0.10),
+    ("BONIFICO DA {person} CAUSALE {reason}", 400.0, 1, 0.08),
+    ("PRELIEVO BANCOMAT {city}", 120.0, -1, 0.12),
+    ("ACCREDITO STIPENDIO {company}", 1850.0, 1, 0.04),
+    ("COMMISSIONI TENUTA CONTO", 3.5, -1, 0.06),
+    ("PAGAMENTO F24 AGENZIA ENTRATE", 420.0, -1, 0.03),
+    ("RICARICA TELEFONICA {carrier}", 20.0, -1, 0.04),
+    ("GIROCONTO DA CONTO DEPOSITO", 900.0, 1, 0.03),
+]
+MERCHANTS = ["CONAD", "ESSELUNGA", "COOP", "CARREFOUR", "LIDL", "IPER", "AMAZON EU", "ZARA",
+             "FARMACIA COMUNALE", "TRENITALIA", "ENI STATION", "IKEA", "MEDIAWORLD", "AUTOGRILL"]
+CITIES = ["MILANO", "ROMA", "TORINO", "NAPOLI", "BOLOGNA", "FIRENZE", "BARI", "PALERMO", "VERONA", "PADOVA"]
+UTILITIES = ["ENEL ENERGIA", "A2A", "HERA", "IREN", "TIM", "FASTWEB", "VODAFONE", "ACEA ATO2"]
+PEOPLE = ["MARIO ROSSI", "GIULIA BIANCHI", "LUCA ESPOSITO", "ANNA ROMANO", "MARCO COLOMBO",
+          "FRANCESCA RICCI", "ALESSANDRO MARINO", "SARA GRECO", "CONDOMINIO VIA ROMA 12", "STUDIO LEGALE VERDI"]
+REASONS = ["AFFITTO", "RIMBORSO SPESE", "REGALO", "FATTURA", "QUOTA CONDOMINIALE", "SALDO"]
+COMPANIES = ["ACME SRL", "ROSSI SPA", "TECNOSERVIZI SRL", "COMUNE DI MILANO"]
+CARRIERS = ["TIM", "VODAFONE", "WINDTRE", "ILIAD"]
+
+
+def _format_amounts(cents: np.ndarray) -> np.ndarray:
+    """Importi in centesimi nel formato italiano: segno, punto per le migliaia, virgola decimale"""
+    euros = np.abs(cents) // 100
+    # Migliaia separate da punto: "1234567" -> "1.234.567"
+    text = pd.Series(euros.astype(str), dtype=object)
+    text = text.str.replace(r"(\d)(?=(\d{3})+$)", r"\1.", regex=True)
+    decimals = (np.abs(cents) % 100).astype(str)
+    decimals = np.where(np.char.str_len(decimals) == 1, np.char.add("0", decimals), decimals)
+    sign = np.where(cents < 0, "-", "")
+    return (sign.astype(object) + text.to_numpy(dtype=object) + "," + decimals.astype(object))
+
+
+def _format_days(days: np.ndarray, start_date: str) -> np.ndarray:
+    """Giorni dalla data iniziale come testo gg/mm/aaaa (formattati una volta per giorno distinto)"""
+    unique_days, codes = np.unique(days, return_inverse=True)
+    labels = (pd.Timestamp(start_date) + pd.to_timedelta(unique_days, unit="D")).strftime("%d/%m/%Y")
+    return np.asarray(labels, dtype=object)[codes]
+
+
+def _fill(template: str, rng: np.random.Generator, size: int) -> np.ndarray:
+    """Descrizioni di un tipo di movimento, con controparti e riferimenti casuali"""
+    pools = {
+        "merchant": MERCHANTS, "city": CITIES, "utility": UTILITIES, "person": PEOPLE,
+        "reason": REASONS, "company": COMPANIES, "carrier": CARRIERS,
+    }
+    result = np.full(size, "", dtype=object)
+    for part in re.split(r"(\{\w+\})", template):
+        name = part[1:-1] if part.startswith("{") else None
+        if name in pools:
+            result = result + np.asarray(pools[name], dtype=object)[rng.integers(0, len(pools[name]), size)]
+        elif name == "ref":
+            result = result + rng.integers(100000, 999999, size).astype(str).astype(object)
+        else:
+            result = result + part
+    return result
+
+
+def generate_statement(n_rows: int, seed: int = 42, start_date: str = "2020-01-01") -> pd.DataFrame:
+    """
+    Estratto conto sintetico di n_rows movimenti in ordine di data
+    (circa 40 movimenti al giorno), con colonne e formati degli export italiani
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.array([m[3] for m in MOVEMENTS])
+    kinds = rng.choice(len(MOVEMENTS), size=n_rows, p=weights / weights.sum())
+
+    # Circa 40 movimenti al giorno, su al massimo dieci anni
+    days = np.sort(rng.integers(0, min(max(n_rows // 40, 1), MAX_DAYS), n_rows))
+    value_days = days + rng.integers(0, 4, n_rows)
+
+    descriptions = np.empty(n_rows, dtype=object)
+    cents = np.empty(n_rows, dtype=np.int64)
+    for kind, (template, mean_amount, sign, _) in enumerate(MOVEMENTS):
+        rows = np.flatnonzero(kinds == kind)
+        if len(rows) == 0:
+            continue
+        descriptions[rows] = _fill(template, rng, len(rows))
+        amounts = rng.lognormal(np.log(mean_amount), 0.6, len(rows))
+        cents[rows] = sign * np.maximum(np.round(amounts * 100), 1).astype(np.int64)
+
+    return pd.DataFrame({
+        "Data Operazione": _format_days(days, start_date),
+        "Data Valuta": _format_days(value_days, start_date),
+        "Descrizione": descriptions,
+        "Importo": _format_amounts(cents),
+        "Divisa": "EUR",
+    })
+
+
+def write_statement(df: pd.DataFrame, path: str, file_format: Optional[str] = None) -> str:
+    """Scrive l'estratto in CSV o XLSX (dedotto dall'estensione se non indicato)"""
+    file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+    if file_format == "csv":
+        df.to_csv(path, index=False, encoding="utf-8")
+    elif file_format == "xlsx":
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"Il formato XLSX supporta al massimo {XLSX_MAX_ROWS} righe")
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError(f"Formato non supportato: {file_format}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un estratto conto italiano sintetico")
+    parser.add_argument("rows", type=int, help="Numero di movimenti")
+    parser.add_argument("output", help="File di destinazione (.csv o .xlsx)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_statement(generate_statement(args.rows, args.seed), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Benchmark dell'intero percorso delle richieste tramite il test client FastAPI.
+
+Per ogni formato e dimensione genera un estratto conto sintetico (vedi
+generator.py), lo carica con POST /upload e misura /data (ricerca, date,
+ordinamento, paginazione), /data/stats, /columns, /data/aggregate ed
+/export. I risultati, con il picco di memoria di ogni passo, vanno in un
+file JSON confrontabile tra commit con --compare.
+
+Esempio (dalla cartella backend):
+
+    python -m benchmarks.run --sizes 10000,100000 --formats csv,xlsx --output bench.json
+    python -m benchmarks.run --sizes 100000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.generator import XLSX_MAX_ROWS, generate_statement, write_statement  # noqa: E402
+
+API_PREFIX = "/api/v1"
+# Intervallo di campionamento della memoria residente (secondi)
+MEMORY_SAMPLE_INTERVAL = 0.005
+
+
+def _rss_bytes() -> int:
+    """Memoria residente corrente del processo (Linux), oppure il picco da getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss è in KB su Linux e in byte su macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """Campiona la memoria residente in un thread e ne registra il picco durante il blocco"""
+
+    def __init__(self):
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+            self._stop.wait(MEMORY_SAMPLE_INTERVAL)
+
+    def __enter__(self) -> "PeakMemory":
+        self.start_bytes = self.peak_bytes = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "rss_start_mb": round(self.start_bytes / 1024 / 1024, 1),
+            "rss_peak_mb": round(self.peak_bytes / 1024 / 1024, 1),
+            "rss_delta_mb": round((self.peak_bytes - self.start_bytes) / 1024 / 1024, 1),
+        }
+
+
+def _measure(name: str, request: Callable[[], Any], repeat: int,
+             before_cold: Optional[Callable[[], None]] = None) -> Tuple[Dict[str, Any], Any]:
+    """
+    Esegue la richiesta repeat volte: la prima a cache vuota (cold), le
+    successive con i risultati in cache (warm). Il picco di memoria è
+    quello della prima esecuzione. Restituisce (misure, ultima risposta).
+    """
+    runs: List[float] = []
+    status_codes: List[int] = []
+    response_bytes = 0
+    memory = PeakMemory()
+    for i in range(repeat):
+        if i == 0 and before_cold is not None:
+            before_cold()
+        if i == 0:
+            with memory:
+                started = time.perf_counter()
+                response = request()
+                runs.append(time.perf_counter() - started)
+        else:
+            started = time.perf_counter()
+            response = request()
+            runs.append(time.perf_counter() - started)
+        status_codes.append(response.status_code)
+        response_bytes = len(response.content)
+
+    result = {
+        "name": name,
+        "cold_seconds": round(runs[0], 5),
+        "warm_median_seconds": round(statistics.median(runs[1:]), 5) if len(runs) > 1 else None,
+        "median_seconds": round(statistics.median(runs), 5),
+        "runs": [round(r, 5) for r in runs],
+        "status_code": status_codes[0],
+        "response_bytes": response_bytes,
+        **memory.to_dict(),
+    }
+    if any(code >= 400 for code in status_codes):
+        result["error"] = response.text[:500]
+    return result, response
+
+
+def _find_column(columns: List[str], keywords: List[str]) -> Optional[str]:
+    return next((c for c in columns if any(k in c.lower() for k in keywords)), None)
+
+
+def benchmark_dataset(client, data_service, path: str, file_format: str, n_rows: int,
+                      repeat: int, xlsx_export_max_rows: int) -> Dict[str, Any]:
+    """Misura caricamento e interrogazioni di un singolo file"""
+    steps: List[Dict[str, Any]] = []
+    content_type = "text/csv" if file_format == "csv" else (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    def upload():
+        with open(path, "rb") as f:
+            return client.post(f"{API_PREFIX}/upload", files={"file": (os.path.basename(path), f, content_type)})
+
+    upload_step, response = _measure("upload", upload, repeat=1)
+    steps.append(upload_step)
+    if upload_step["status_code"] != 200:
+        return {"steps": steps}
+
+    upload_result = response.json()
+    file_id = upload_result["file_id"]
+    dataset = data_service.get_dataset(file_id)
+    upload_step["rows_per_second"] = round(n_rows / upload_step["cold_seconds"], 1)
+    upload_step["ingest_stats"] = upload_result.get("ingest_stats")
+
+    columns = dataset.columns
+    date_column = _find_column(columns, ["data_operazione", "data", "date"])
+    amount_column = _find_column(columns, ["importo", "amount"])
+    dates = dataset.data[date_column]
+    middle = dates.min() + (dates.max() - dates.min()) / 2
+    date_from = middle.strftime("%Y-%m-%d")
+    date_to = (middle + (dates.max() - dates.min()) / 10).strftime("%Y-%m-%d")
+    page_size = 100
+    last_page = max((n_rows + page_size - 1) // page_size, 1)
+
+    def clear_cache():
+        data_service.result_cache.invalidate()
+
+    def get(endpoint: str, **params):
+        return lambda: client.get(f"{API_PREFIX}{endpoint}", params={"file_id": file_id, **params})
+
+    scenarios = [
+        ("data_first_page", get("/data", page_size=page_size)),
+        ("data_search_token", get("/data", search="conad", page_size=page_size)),
+        ("data_search_phrase", get("/data", search="bonifico a favore di mario", page_size=page_size)),
+        ("data_search_short", get("/data", search="po", page_size=page_size)),
+        ("data_date_range", get("/data", date_from=date_from, date_to=date_to, page_size=page_size)),
+        ("data_sort_amount_desc", get("/data", sort_by=amount_column, sort_order="desc", page_size=page_size)),
+        ("data_last_page", get("/data", page=last_page, page_size=page_size)),
+        ("data_combined", get("/data", search="pos", date_from=date_from, date_to=date_to,
+                              sort_by=amount_column, page_size=page_size)),
+        ("data_columnar", get("/data", format="columnar", page_size=1000)),
+        ("data_stats", get("/data/stats")),
+        ("columns", get("/columns")),
+        ("column_detail", lambda: client.get(f"{API_PREFIX}/columns/{amount_column}", params={"file_id": file_id})),
+        ("aggregate_month", get("/data/aggregate", group_by=f"month:{date_column}",
+                                measures=f"sum:{amount_column},count", split_sign="true")),
+        ("export_csv_search", get("/export", format="csv", search="bonifico")),
+        ("export_csv_date_range", get("/export", format="csv", date_from=date_from, date_to=date_to)),
+    ]
+    if n_rows <= xlsx_export_max_rows:
+        scenarios.append(("export_xlsx_search", get("/export", format="xlsx", search="stipendio")))
+
+    for name, request in scenarios:
+        steps.append(_measure(name, request, repeat, before_cold=clear_cache)[0])
+
+    # Libera memoria prima del dataset successivo
+    client.delete(f"{API_PREFIX}/datasets/{file_id}")
+    return {"date_range": [date_from, date_to], "steps": steps}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _data_file(data_dir: str, n_rows: int, file_format: str, seed: int) -> Dict[str, Any]:
+    """File di input, generato solo se non già presente nella cartella dei dati"""
+    path = os.path.join(data_dir, f"estratto_{n_rows}_{seed}.{file_format}")
+    generate_seconds = None
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        write_statement(generate_statement(n_rows, seed), path, file_format)
+        generate_seconds = round(time.perf_counter() - started, 3)
+    return {
+        "path": path,
+        "file_size_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+        "generate_seconds": generate_seconds,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Righe di confronto dei tempi mediani tra due esecuzioni; segnala i peggioramenti oltre threshold"""
+    def index(results):
+        return {
+            (r["format"], r["rows"], s["name"]): s
+            for r in results["results"] for s in r.get("steps", [])
+        }
+
+    old, new = index(baseline), index(current)
+    lines = [f"{'formato':<6} {'righe':>9} {'passo':<24} {'prima':>10} {'dopo':>10} {'rapporto':>9}"]
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key]["median_seconds"], new[key]["median_seconds"]
+        ratio = after / before if before else float("inf")
+        flag = "  << regressione" if ratio > threshold else ""
+        lines.append(f"{key[0]:<6} {key[1]:>9} {key[2]:<24} {before:>10.4f} {after:>10.4f} {ratio:>9.2f}{flag}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del percorso completo delle richieste")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="Numeri di righe separati da virgola (es. 10000,100000,1000000,5000000)")
+    parser.add_argument("--formats", default="csv", help="Formati separati da virgola: csv, xlsx")
+    parser.add_argument("--repeat", type=int, default=3, help="Esecuzioni per passo (la prima a cache vuota)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--engine", choices=["pandas", "sqlite"], default=None,
+                        help="Motore di query di /data (default: QUERY_ENGINE o pandas)")
+    parser.add_argument("--data-dir", default=None, help="Cartella dei file generati, riusati tra esecuzioni")
+    parser.add_argument("--xlsx-export-max-rows", type=int, default=100000,
+                        help="Dimensione massima per cui misurare l'export XLSX")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Rapporto dei tempi oltre il quale un passo è segnalato come regressione")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    output = os.path.abspath(args.output)
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix="bench_data_")
+    os.makedirs(data_dir, exist_ok=True)
+
+    # Cartella di lavoro isolata: upload, snapshot e database SQLite non toccano quelli dell'app
+    work_dir = tempfile.mkdtemp(prefix="bench_work_")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    if args.engine:
+        os.environ["QUERY_ENGINE"] = args.engine
+
+    from fastapi.testclient import TestClient
+
+    import pandas as pd
+    import numpy as np
+    from main import app
+    from app.core.config import settings
+    from app.services.data_service import data_service
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "query_engine": settings.query_engine,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+
+    try:
+        with TestClient(app) as client:
+            for file_format in formats:
+                for n_rows in sizes:
+                    if file_format == "xlsx" and n_rows > XLSX_MAX_ROWS:
+                        report["results"].append({
+                            "format": file_format, "rows": n_rows,
+                            "skipped": f"XLSX supporta al massimo {XLSX_MAX_ROWS} righe"
+                        })
+                        continue
+                    print(f"[{file_format} {n_rows}] generazione...", flush=True)
+                    input_file = _data_file(data_dir, n_rows, file_format, args.seed)
+                    print(f"[{file_format} {n_rows}] misura...", flush=True)
+                    result = benchmark_dataset(
+                        client, data_service, input_file["path"], file_format, n_rows,
+                        args.repeat, args.xlsx_export_max_rows
+                    )
+                    report["results"].append({
+                        "format": file_format,
+                        "rows": n_rows,
+                        "file_size_mb": input_file["file_size_mb"],
+                        "generate_seconds": input_file["generate_seconds"],
+                        **result,
+                    })
+                    for step in result["steps"]:
+                        print(f"    {step['name']:<24} {step['median_seconds']:>9.4f}s"
+                              f"  picco {step['rss_peak_mb']:>8.1f} MB", flush=True)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Risultati salvati in {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(baseline, report, args.threshold)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
-from app.api import upload, data, columns, export
+from app.api import upload, data, columns, export, datasets, metrics, profiling
+from app.api.metrics import RequestMetricsMiddleware
+from app.api.profiling import RequestProfilerMiddleware
 from app.core.config import settings
+from app.services.ingestion_jobs import job_manager
+from app.services.executor import work_executor
 
 app = FastAPI(
     title="Analisi Estratti Bancari API",
@@ -22,11 +26,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Durata di ogni richiesta per metodo, route e stato, esposta da /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
+# Profilazione CPU/allocazioni su richiesta (header X-Profile o POST /debug/profile)
+app.add_middleware(RequestProfilerMiddleware)
+
 # Inclusione dei router API
 app.include_router(upload.router, prefix="/api/v1", tags=["upload"])
 app.include_router(data.router, prefix="/api/v1", tags=["data"])
 app.include_router(columns.router, prefix="/api/v1", tags=["columns"])
 app.include_router(export.router, prefix="/api/v1", tags=["export"])
+app.include_router(datasets.router, prefix="/api/v1", tags=["datasets"])
+app.include_router(metrics.router, tags=["metrics"])
+app.include_router(profiling.router, tags=["debug"])
+
+@app.on_event("shutdown")
+async def shutdown_ingestion_jobs():
+    """Arresta i processi di ingestione in background e il pool di lavoro"""
+    job_manager.shutdown()
+    work_executor.shutdown()
 
 @app.get("/")
 async def root():
@@ -36,6 +55,11 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "analisi-estratti-bancari"}
 
+@app.get("/health/executor")
+async def executor_stats():
+    """Occupazione del pool di lavoro e percentili di latenza per endpoint"""
+    return work_executor.stats()
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
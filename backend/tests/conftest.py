@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# I test importano il pacchetto app dalla cartella backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """DataService isolato: database, upload e snapshot in una cartella temporanea"""
+    monkeypatch.chdir(tmp_path)
+    from app.services.data_service import DataService
+    return DataService()
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Blocchi di poche righe, per esercitare la lettura a blocchi su file piccoli"""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "ingest_chunk_rows", 100)
+    return 100
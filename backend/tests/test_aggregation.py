@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.aggregation import aggregate, parse_group_keys, parse_measures
+
+
+@pytest.fixture
+def movements() -> pd.DataFrame:
+    rng = np.random.default_rng(5)
+    n = 300
+    amounts = np.round(rng.normal(0, 50, n), 2)
+    amounts[rng.choice(n, 20, replace=False)] = np.nan
+    return pd.DataFrame({
+        "data": pd.Timestamp("2023-12-20") + pd.to_timedelta(rng.integers(0, 90, n), unit="D"),
+        "categoria": pd.Categorical(rng.choice(["casa", "spesa", "svago"], n)),
+        "importo": amounts,
+    })
+
+@pytest.mark.parametrize("period, freq", [("day", "D"), ("week", "W-SUN"), ("month", "M"), ("year", "Y")])
+def test_period_totals_match_pandas(movements, period, freq):
+    rows = np.flatnonzero(movements.index % 3 != 0)
+    keys = parse_group_keys([f"{period}:data", "categoria"], movements)
+    measures = parse_measures(["count", "sum:importo", "mean:importo"], movements)
+
+    result = aggregate(movements, rows, keys, measures)
+
+    subset = movements.iloc[rows]
+    expected = subset.groupby(
+        [subset["data"].dt.to_period(freq).dt.start_time.rename(f"{period}_data"), "categoria"], observed=True
+    ).agg(count_rows=("importo", "size"), sum_importo=("importo", "sum"), mean_importo=("importo", "mean"))
+    expected = expected.reset_index()
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_categorical=False)
+    if period == "week":
+        # Settimane da lunedì
+        assert (result["week_data"].dt.dayofweek == 0).all()
+
+def test_split_sign_measures(movements):
+    rows = np.arange(len(movements))
+    keys = parse_group_keys(["categoria"], movements)
+    measures = parse_measures(["sum:importo", "count:importo"], movements)
+
+    result = aggregate(movements, rows, keys, measures, split_sign=True).set_index("categoria")
+
+    for name, group in movements.groupby("categoria", observed=True)["importo"]:
+        assert result.loc[name, "sum_importo_entrate"] == pytest.approx(group[group > 0].sum())
+        assert result.loc[name, "sum_importo_uscite"] == pytest.approx(group[group < 0].sum())
+        assert result.loc[name, "count_importo_uscite"] == (group < 0).sum()
+    assert result["count_importo_entrate"].dtype == np.int64
+
+@pytest.mark.parametrize("group_by, measures", [
+    ([], ["count"]),
+    (["inesistente"], ["count"]),
+    (["quarter:data"], ["count"]),
+    (["month:importo"], ["count"]),
+    (["categoria"], ["median:importo"]),
+    (["categoria"], ["sum"]),
+    (["categoria"], ["sum:categoria"]),
+])
+def test_invalid_keys_and_measures(movements, group_by, measures):
+    with pytest.raises(ValueError):
+        parse_group_keys(group_by, movements)
+        parse_measures(measures, movements)
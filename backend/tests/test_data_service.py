@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from app.models.data_models import DataFilter
+
+
+@pytest.fixture
+def loaded(service, tmp_path):
+    path = tmp_path / "marzo.csv"
+    pd.DataFrame({
+        "Data": ["01/03/2024", "05/03/2024"],
+        "Descrizione": ["Bonifico", "Pagamento POS"],
+        "Importo": ["1,50", "-2,50"],
+    }).to_csv(path, index=False)
+    assert service.upload_file(str(path), "csv")["success"]
+    return service
+
+
+def test_get_data_reports_filter_errors(loaded):
+    result = loaded.get_data(DataFilter(date_column="inesistente", date_from=pd.Timestamp("2024-03-02")))
+
+    assert "error" in result
+
+
+def test_get_data_propagates_internal_errors(loaded, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("guasto")
+
+    monkeypatch.setattr(loaded, "get_data_page", broken)
+
+    with pytest.raises(RuntimeError):
+        loaded.get_data(DataFilter())
+
+
+def test_stale_rows_cached_after_append_are_not_served(loaded, tmp_path):
+    file_id = loaded.registry.resolve_id()
+    before = loaded.registry.get(file_id)
+    path = tmp_path / "aprile.csv"
+    pd.DataFrame({"Data": ["02/04/2024"], "Descrizione": ["Bonifico"], "Importo": ["3,00"]}).to_csv(path, index=False)
+    assert loaded.upload_file(str(path), "csv", append_to=file_id)["success"]
+
+    # Una richiesta iniziata prima dell'aggiunta termina e mette in cache le righe della versione precedente
+    assert len(loaded._get_row_ids(before, DataFilter(search="bonifico"))) == 1
+
+    result = loaded.get_data(DataFilter(search="bonifico"))
+    assert result["total_rows"] == 2
+    assert loaded.registry.get(file_id).version == before.version + 1
+
+
+def test_sort_by_mixed_type_excel_column(service, tmp_path):
+    path = tmp_path / "misto.xlsx"
+    pd.DataFrame({
+        "Data": ["01/03/2024", "02/03/2024", "03/03/2024", "04/03/2024"],
+        "Riferimento": [12, "AB-1", 3.5, "X"],
+        "Importo": [1, 2, 3, 4],
+    }).to_excel(path, index=False)
+    assert service.upload_file(str(path), "xlsx")["success"]
+
+    result = service.get_data(DataFilter(sort_by="riferimento", sort_order="desc"))
+
+    assert [row["riferimento"] for row in result["data"]] == ["X", "AB-1", 12, 3.5]
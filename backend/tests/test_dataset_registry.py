@@ -0,0 +1,65 @@
+import pandas as pd
+
+from app.services.dataset_registry import Dataset, DatasetRegistry
+from app.services.snapshot_store import SnapshotStore
+
+
+def _registry(folder) -> DatasetRegistry:
+    return DatasetRegistry(memory_budget_bytes=512 * 1024 * 1024, store=SnapshotStore(str(folder)))
+
+
+def _dataset(file_id: str, rows: int = 3) -> Dataset:
+    data = pd.DataFrame({"importo": [float(i) for i in range(rows)]})
+    return Dataset(file_id, data, ["Importo"])
+
+
+def test_latest_dataset_survives_restart(tmp_path):
+    registry = _registry(tmp_path)
+    registry.add(_dataset("primo"))
+    registry.add(_dataset("secondo"))
+    # Un'aggiunta di righe rende "primo" il dataset più recente
+    extended = _dataset("primo", rows=5)
+    registry.append(extended, extended.data.iloc[3:])
+
+    restarted = _registry(tmp_path)
+
+    assert restarted.latest_file_id == "primo"
+    assert restarted.get().total_rows == 5
+    assert restarted.get().data["importo"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_empty_catalog_has_no_latest(tmp_path):
+    assert _registry(tmp_path).latest_file_id is None
+
+
+def test_reload_does_not_block_other_datasets(tmp_path, monkeypatch):
+    import threading
+
+    registry = _registry(tmp_path)
+    registry.add(_dataset("lento"))
+    registry.add(_dataset("pronto"))
+    registry.unload("lento")
+
+    started, release = threading.Event(), threading.Event()
+    load = registry.store.load
+
+    def slow_load(file_id):
+        started.set()
+        release.wait(5)
+        return load(file_id)
+
+    monkeypatch.setattr(registry.store, "load", slow_load)
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(registry.get("lento"))) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    assert started.wait(5)
+
+    # Mentre "lento" viene riaperto, gli altri dataset restano disponibili
+    assert registry.get("pronto").file_id == "pronto"
+
+    release.set()
+    for worker in workers:
+        worker.join(5)
+    assert [dataset.total_rows for dataset in results] == [3, 3, 3]
+    assert registry.reloads == 1
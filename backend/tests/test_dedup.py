@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from app.services.dataset_registry import DatasetNotFoundError
+from app.services.dedup import DUPLICATE_COLUMN
+
+
+def _write_statement(path, first: int, last: int):
+    """Estratto conto con un movimento al giorno, numerati da first a last (incluso)"""
+    numbers = range(first, last + 1)
+    pd.DataFrame({
+        "Data": [f"{1 + n % 28:02d}/03/2024" for n in numbers],
+        "Descrizione": [f"Bonifico n. {n}" for n in numbers],
+        "Importo": [f"{n},50" for n in numbers],
+    }).to_csv(path, index=False)
+
+
+def test_append_with_dedup_drops_overlapping_rows(service, small_chunks, tmp_path):
+    first, second = tmp_path / "marzo.csv", tmp_path / "marzo_bis.csv"
+    _write_statement(first, 0, 149)
+    _write_statement(second, 100, 249)
+    file_id = service.upload_file(str(first), "csv")["file_id"]
+
+    result = service.upload_file(str(second), "csv", dedup_against=file_id, append_to=file_id)
+
+    assert result["success"], result.get("error")
+    assert result["file_id"] == file_id
+    assert result["ingest_stats"]["deduplication"]["duplicate_rows"] == 50
+    data = service.get_dataset(file_id).data
+    assert len(data) == 250
+    assert not data.duplicated(subset=["descrizione"]).any()
+    assert service.get_dataset(file_id).get_profile()["total_rows"] == 250
+
+
+def test_flag_mode_without_target_column_is_rejected(service, tmp_path):
+    first, second = tmp_path / "marzo.csv", tmp_path / "marzo_bis.csv"
+    _write_statement(first, 0, 9)
+    _write_statement(second, 5, 14)
+    file_id = service.upload_file(str(first), "csv")["file_id"]
+
+    result = service.upload_file(str(second), "csv", dedup_against=file_id,
+                                 dedup_mode="flag", append_to=file_id)
+
+    assert not result["success"]
+    assert DUPLICATE_COLUMN in result["error"]
+    assert service.get_dataset(file_id).total_rows == 10
+
+
+def test_flag_mode_appends_to_flagged_dataset(service, tmp_path):
+    base, flagged, extra = tmp_path / "base.csv", tmp_path / "flag.csv", tmp_path / "extra.csv"
+    _write_statement(base, 0, 9)
+    _write_statement(flagged, 5, 14)
+    _write_statement(extra, 10, 19)
+    base_id = service.upload_file(str(base), "csv")["file_id"]
+    flagged_id = service.upload_file(str(flagged), "csv", dedup_against=base_id, dedup_mode="flag")["file_id"]
+
+    result = service.upload_file(str(extra), "csv", dedup_against=base_id,
+                                 dedup_mode="flag", append_to=flagged_id)
+
+    assert result["success"], result.get("error")
+    flags = service.get_dataset(flagged_id).data[DUPLICATE_COLUMN]
+    assert flags.tolist() == [True] * 5 + [False] * 15
+
+
+def test_unknown_target_raises_not_found(service, tmp_path):
+    path = tmp_path / "marzo.csv"
+    _write_statement(path, 0, 9)
+
+    with pytest.raises(DatasetNotFoundError):
+        service.upload_file(str(path), "csv", append_to="inesistente")
+    with pytest.raises(DatasetNotFoundError):
+        service.upload_file(str(path), "csv", dedup_against="inesistente")
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app.services import excel_reader
+from app.services.excel_reader import _xlsx_dimensions, read_excel_file
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "estratto.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({"Intestatario": ["Mario Rossi"]}).to_excel(writer, sheet_name="Info", index=False)
+        pd.DataFrame({
+            "Data": ["01/01/2024"] * 300,
+            "Importo": ["-1,00"] * 300,
+            "Progressivo": range(300),
+        }).to_excel(writer, sheet_name="Movimenti", index=False)
+    return str(path)
+
+
+def test_xlsx_dimensions_from_metadata(workbook):
+    assert _xlsx_dimensions(workbook) == {"Info": 2, "Movimenti": 301 * 3}
+
+
+@pytest.mark.skipif(excel_reader.CalamineWorkbook is None, reason="python-calamine non installato")
+def test_picks_largest_sheet_without_parsing_it_twice(workbook, monkeypatch):
+    parsed = []
+    original = excel_reader.CalamineWorkbook.get_sheet_by_name
+
+    def counting_get_sheet(self, name):
+        parsed.append(name)
+        return original(self, name)
+
+    monkeypatch.setattr(excel_reader.CalamineWorkbook, "get_sheet_by_name", counting_get_sheet, raising=False)
+    df, read_info = read_excel_file(workbook, "xlsx")
+
+    assert read_info["sheet"] == "Movimenti"
+    assert len(df) == 300
+    # La scelta del foglio usa le dimensioni dichiarate: nessun foglio letto per intero in più
+    assert "Info" not in parsed
+
+
+@pytest.mark.skipif(excel_reader.CalamineWorkbook is None, reason="python-calamine non installato")
+def test_typed_columns_match_read_excel(tmp_path):
+    import openpyxl
+
+    path = tmp_path / "tipi.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Data", "Descrizione", "Importo", "Codice", "Riferimento", "", "Importo", "Contabilizzato", "Pezzi"])
+    rows = [
+        [datetime(2024, 3, 1), "Bonifico", 1.5, "00123", 12, "x", 3, True, 4],
+        [datetime(2024, 3, 2, 10, 30), "POS", None, "00456", "AB-1", None, 4.5, False, None],
+        [],
+        [datetime(2024, 3, 3), "N/A", -2.0, "789", 3.5, "y", 5, True, 6],
+        [datetime(2024, 3, 4), "", 7.0, "12", "X", "z", 6, False, 8],
+    ]
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+    expected = pd.read_excel(path, engine="calamine")
+    df, _ = read_excel_file(str(path), "xlsx")
+
+    pd.testing.assert_frame_equal(df, expected)
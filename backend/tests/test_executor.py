@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+from app.services.executor import WorkExecutor
+
+
+def test_cancelled_request_keeps_slot_until_thread_finishes():
+    executor = WorkExecutor(max_workers=2, endpoint_limits={"data": 1}, max_queue=4, latency_window=10)
+    started, finish = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        finish.wait(5)
+        return "fatto"
+
+    async def scenario():
+        task = asyncio.create_task(executor.run("data", work))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        # Il thread è ancora in esecuzione: il posto resta occupato
+        running_after_cancel = executor.stats()["endpoints"]["data"]["running"]
+        second = asyncio.create_task(executor.run("data", lambda: "secondo"))
+        await asyncio.sleep(0.05)
+        second_waited = not second.done()
+
+        finish.set()
+        return running_after_cancel, second_waited, await asyncio.wait_for(second, 5)
+
+    try:
+        running_after_cancel, second_waited, result = asyncio.run(scenario())
+    finally:
+        finish.set()
+        executor.shutdown()
+
+    assert running_after_cancel == 1
+    assert second_waited
+    assert result == "secondo"
+    stats = executor.stats()["endpoints"]["data"]
+    assert stats["running"] == 0
+    assert stats["completed"] == 2
+
+
+def test_iterate_runs_items_on_the_pool_and_holds_the_slot():
+    executor = WorkExecutor(max_workers=2, endpoint_limits={"export": 1}, max_queue=4, latency_window=10)
+    threads = []
+
+    def batches():
+        for i in range(3):
+            threads.append(threading.current_thread().name)
+            yield i
+
+    async def scenario():
+        items = await executor.iterate("export", batches())
+        first = await items.__anext__()
+        # Stream in corso: il posto dell'endpoint resta occupato tra un blocco e l'altro
+        running = executor.stats()["endpoints"]["export"]["running"]
+        rest = [item async for item in items]
+        return [first] + rest, running
+
+    try:
+        items, running = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert items == [0, 1, 2]
+    assert running == 1
+    assert all(name.startswith("dataservice") for name in threads)
+    stats = executor.stats()["endpoints"]["export"]
+    assert stats["running"] == 0
+    assert stats["completed"] == 1
+
+
+def test_closed_stream_releases_the_slot():
+    executor = WorkExecutor(max_workers=2, endpoint_limits={"export": 1}, max_queue=4, latency_window=10)
+
+    async def scenario():
+        items = await executor.iterate("export", iter(range(100)))
+        await items.__anext__()
+        # Client disconnesso a metà: la risposta chiude il generatore
+        await items.aclose()
+        await asyncio.sleep(0)
+        return await asyncio.wait_for(executor.run("export", lambda: "dopo"), 5)
+
+    try:
+        result = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert result == "dopo"
+    assert executor.stats()["endpoints"]["export"]["running"] == 0
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from app.services.ingestion import clean_chunks, infer_numeric_columns, read_chunks
+
+
+def _write_codes_csv(path, rows: int, numeric_rows: int):
+    """CSV con una colonna codice numerica nelle prime righe e alfanumerica nelle successive"""
+    codes = [str(1000 + i) if i < numeric_rows else f"A{i}" for i in range(rows)]
+    pd.DataFrame({
+        "Data": ["01/02/2024"] * rows,
+        "Descrizione": [f"Pagamento {i}" for i in range(rows)],
+        "Importo": ["-12,50"] * rows,
+        "Codice": codes,
+        "Progressivo": list(range(rows)),
+    }).to_csv(path, index=False)
+
+
+def test_csv_chunks_are_read_as_text(tmp_path):
+    path = tmp_path / "estratto.csv"
+    _write_codes_csv(path, rows=250, numeric_rows=150)
+
+    chunks, _ = read_chunks(str(path), "csv", 100)
+    types = {str(chunk["Codice"].dtype) for chunk in chunks}
+
+    assert len(types) == 1
+    assert pd.api.types.is_string_dtype(next(iter(types)))
+
+
+def test_infer_numeric_columns_uses_whole_column(tmp_path):
+    path = tmp_path / "estratto.csv"
+    _write_codes_csv(path, rows=250, numeric_rows=150)
+
+    chunks, _ = read_chunks(str(path), "csv", 100)
+    df = infer_numeric_columns(pd.concat([chunk for _, chunk in clean_chunks(chunks)], ignore_index=True))
+
+    # Colonna mista: testo per tutte le righe, non int nel primo blocco e str nei successivi
+    assert pd.api.types.infer_dtype(df["codice"]) == "string"
+    assert df["codice"].iloc[0] == "1000"
+    assert pd.api.types.is_integer_dtype(df["progressivo"])
+    assert pd.api.types.is_datetime64_any_dtype(df["data"])
+    assert df["importo"].eq(-12.5).all()
+
+
+def test_chunked_upload_sorts_mixed_column(service, small_chunks, tmp_path):
+    path = tmp_path / "estratto.csv"
+    _write_codes_csv(path, rows=250, numeric_rows=150)
+
+    result = service.upload_file(str(path), "csv")
+    assert result["success"], result.get("error")
+
+    from app.models.data_models import DataFilter
+    page = service.get_data(DataFilter(sort_by="codice", sort_order="desc", page_size=5))
+    assert "error" not in page
+    assert page["data"][0]["codice"] == "A249"
+    assert service.get_dataset().data["progressivo"].max() == 249
+
+
+def test_append_aligns_numeric_columns(service, small_chunks, tmp_path):
+    first, second = tmp_path / "primo.csv", tmp_path / "secondo.csv"
+    _write_codes_csv(first, rows=120, numeric_rows=120)
+    _write_codes_csv(second, rows=30, numeric_rows=30)
+    file_id = service.upload_file(str(first), "csv")["file_id"]
+
+    result = service.upload_file(str(second), "csv", append_to=file_id)
+
+    assert result["success"], result.get("error")
+    data = service.get_dataset(file_id).data
+    assert len(data) == 150
+    assert pd.api.types.is_numeric_dtype(data["codice"])
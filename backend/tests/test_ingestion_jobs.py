@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+from app.services import ingestion_jobs
+from app.services.ingestion import IngestionCancelled
+from app.services.ingestion_jobs import IngestionJob, IngestionJobManager
+
+
+@pytest.fixture
+def manager(service, small_chunks, monkeypatch):
+    """Gestore dei job che salva nel DataService isolato del test"""
+    monkeypatch.setattr(ingestion_jobs, "data_service", service)
+    manager = IngestionJobManager(max_jobs=1, worker_processes=1, retention_seconds=3600)
+    yield manager
+    manager.shutdown()
+
+def _csv(folder, rows: int) -> str:
+    path = os.path.join(str(folder), "estratto.csv")
+    pd.DataFrame({
+        "Data": [f"{1 + i % 28:02d}/03/2024" for i in range(rows)],
+        "Descrizione": [f"Bonifico {i}" for i in range(rows)],
+        "Importo": [f"{i},50" for i in range(rows)],
+    }).to_csv(path, index=False)
+    return path
+
+def _wait(job: IngestionJob, timeout: float = 60) -> IngestionJob:
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, f"job ancora in corso: {job.to_dict()}"
+        time.sleep(0.05)
+    return job
+
+def test_progress_is_weighted_by_stage():
+    job = IngestionJob("estratto.csv", "csv", "estratto.csv")
+    assert job.progress() == 0.0
+
+    job.total_rows = 200
+    job.update("clean", 100)
+    assert job.progress() == 0.25
+    job.update("store", 200)
+    assert job.progress() == 0.85
+    job.update("index", 0)
+    assert job.progress() == 0.85
+    job.status = "completed"
+    assert job.progress() == 1.0
+
+def test_eta_extrapolates_elapsed_time():
+    job = IngestionJob("estratto.csv", "csv", "estratto.csv")
+    job.status = "running"
+    job.started_at = time.time() - 10
+    job.total_rows = 200
+    job.update("clean", 100)
+
+    assert job.to_dict()["eta_seconds"] == pytest.approx(30, abs=1)
+
+def test_update_after_cancel_raises():
+    job = IngestionJob("estratto.csv", "csv", "estratto.csv")
+    job.cancel_requested.set()
+
+    with pytest.raises(IngestionCancelled):
+        job.update("store", 10)
+
+def test_cancel_queued_job_never_starts(manager, tmp_path):
+    job = IngestionJob(_csv(tmp_path, 10), "csv", "estratto.csv")
+    manager._jobs[job.job_id] = job
+
+    assert manager.cancel(job.job_id).status == "cancelled"
+    manager._run(job)
+
+    assert job.status == "cancelled" and job.started_at is None
+    assert not os.path.exists(job.file_path)
+    # Nessun processo avviato per un job già annullato
+    assert manager._processes is None
+    with pytest.raises(ValueError):
+        manager.cancel(job.job_id)
+
+def test_job_completes_with_progress(manager, service, tmp_path):
+    path = _csv(tmp_path, 250)
+
+    job = _wait(manager.submit(path, "csv", "estratto.csv"))
+
+    assert job.status == "completed", job.error
+    assert job.total_rows == 250 and job.progress() == 1.0
+    assert job.result["total_rows"] == 250
+    assert service.registry.get(job.result["file_id"]).total_rows == 250
+    # Il file caricato appartiene al job e viene rimosso alla fine
+    assert not os.path.exists(path)
+
+def test_cancel_while_storing_discards_the_dataset(manager, service, tmp_path, monkeypatch):
+    ingest = service.ingest
+
+    def cancel_then_ingest(*args, progress, **kwargs):
+        # Annullamento arrivato dopo la pulizia: ha effetto al primo blocco salvato
+        manager.cancel(progress.__self__.job_id)
+        return ingest(*args, progress=progress, **kwargs)
+
+    monkeypatch.setattr(service, "ingest", cancel_then_ingest)
+
+    job = _wait(manager.submit(_csv(tmp_path, 250), "csv", "estratto.csv"))
+
+    assert job.status == "cancelled" and job.result is None
+    assert job.stage == "clean" and job.rows_processed == 250
+    assert service.registry.latest_file_id is None
+    with sqlite3.connect(service.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] == 0
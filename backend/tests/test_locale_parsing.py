@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.ingestion import clean_chunks
+from app.services.locale_parsing import (
+    DATE_FORMATS, infer_date_format, infer_number_format, parse_amounts, parse_dates
+)
+
+
+def test_infers_italian_day_first_dates():
+    dates = pd.Series(["01/02/2024", "15/02/2024", "28/02/2024"])
+    assert infer_date_format(dates) == "%d/%m/%Y"
+    parsed = parse_dates(dates, "%d/%m/%Y")
+    assert parsed.tolist() == [pd.Timestamp(2024, 2, 1), pd.Timestamp(2024, 2, 15), pd.Timestamp(2024, 2, 28)]
+
+
+@pytest.mark.parametrize("date_format", DATE_FORMATS)
+def test_inferred_format_parses_the_sample(date_format):
+    # Formato scelto e conversione usano lo stesso strptime: il campione va interpretato per intero
+    dates = pd.Series(pd.date_range("2024-01-13 08:30:15", periods=20, freq="37h").strftime(date_format))
+    inferred = infer_date_format(dates)
+    assert inferred is not None
+    assert parse_dates(dates, inferred).notna().all()
+
+
+def test_unknown_date_format_is_none():
+    assert infer_date_format(pd.Series(["ieri", "oggi", "domani"])) is None
+
+
+@pytest.mark.parametrize("values, expected_format, expected", [
+    (["1.234,56 €", "-12,50", "12,50-", "+3,00"], (".", ","), [1234.56, -12.5, -12.5, 3.0]),
+    (["1,234.56", "-12.50", "0.99"], (",", "."), [1234.56, -12.5, 0.99]),
+    (["1.234", "12.345.678"], (".", ","), [1234.0, 12345678.0]),
+])
+def test_infers_and_parses_amounts(values, expected_format, expected):
+    series = pd.Series(values)
+    number_format = infer_number_format(series)
+    assert number_format == expected_format
+    np.testing.assert_allclose(parse_amounts(series, number_format), expected)
+
+
+def test_numeric_cells_in_mixed_amount_column_pass_through():
+    # Colonna Excel mista: le celle numeriche non passano dal testo (12.5 non diventa 125)
+    amounts = pd.Series(["1.234,56 €", 12.5, 7, "12,50-", None, np.nan], dtype=object)
+
+    parsed = parse_amounts(amounts, (".", ","))
+
+    np.testing.assert_array_equal(parsed.to_numpy(), [1234.56, 12.5, 7.0, -12.5, np.nan, np.nan])
+
+
+def test_dates_outside_the_inferred_format_use_the_generic_parser():
+    dates = pd.Series(
+        ["05/03/2024", "2024-03-07", pd.Timestamp("2024-03-08 10:00").to_pydatetime(),
+         "2024-03-09T10:00:00+02:00", "6.3.2024", "non è una data", None],
+        dtype=object
+    )
+
+    parsed = parse_dates(dates, "%d/%m/%Y")
+
+    assert parsed.tolist()[:5] == [
+        pd.Timestamp(2024, 3, 5), pd.Timestamp(2024, 3, 7), pd.Timestamp(2024, 3, 8, 10),
+        pd.Timestamp(2024, 3, 9, 10), pd.Timestamp(2024, 3, 6)
+    ]
+    assert parsed.iloc[5:].isna().all()
+
+
+def _chunk(dates, amounts):
+    return pd.DataFrame({"Data": pd.Series(dates, dtype=object), "Importo": pd.Series(amounts, dtype=object)})
+
+
+@pytest.mark.filterwarnings("ignore:Parsing dates:UserWarning")
+def test_format_inferred_once_per_file(monkeypatch):
+    # Anche un formato non riconosciuto (None) vale per tutto il file: i blocchi successivi non lo ridecidono
+    import app.services.ingestion as ingestion
+    calls = []
+    monkeypatch.setattr(ingestion, "infer_date_format", lambda series: calls.append(len(series)))
+    chunks = [
+        _chunk(["13/01/2024", "31/01/2024"], ["1.234,56", "2,00"]),
+        _chunk(["03/04/2024", "05/06/2024"], ["1.000", "3,5"]),
+    ]
+    cleaned = [chunk for _, chunk in clean_chunks(iter(chunks))]
+
+    assert calls == [2]
+    assert cleaned[1]["importo"].tolist() == [1000.0, 3.5]
+
+
+def test_empty_first_chunk_does_not_fix_format():
+    chunks = [
+        _chunk([None, None], [None, None]),
+        _chunk(["13/01/2024", "03/04/2024"], ["1.234,56", "1.000"]),
+    ]
+    cleaned = [chunk for _, chunk in clean_chunks(iter(chunks))]
+
+    assert cleaned[1]["data"].tolist() == [pd.Timestamp(2024, 1, 13), pd.Timestamp(2024, 4, 3)]
+    assert cleaned[1]["importo"].tolist() == [1234.56, 1000.0]
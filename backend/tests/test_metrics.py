@@ -0,0 +1,66 @@
+import pytest
+
+from app.services.metrics import MetricsRegistry, StageTimer
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("app_requests_total", "Richieste", ["route"])
+    durations = registry.histogram("app_duration_seconds", "Durata", ["route"], buckets=(0.1, 1.0))
+    registry.gauge("app_memory_bytes", "Memoria", lambda: [({"dataset": 'a"b'}, 1536.0)])
+
+    requests.inc(route="/data")
+    requests.inc(2, route="/data")
+    requests.inc(route="/export")
+    for value in (0.05, 0.1, 0.5, 3.0):
+        durations.observe(value, route="/data")
+
+    assert registry.render() == "\n".join([
+        "# HELP app_requests_total Richieste",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{route="/data"} 3',
+        'app_requests_total{route="/export"} 1',
+        "# HELP app_duration_seconds Durata",
+        "# TYPE app_duration_seconds histogram",
+        # Bucket cumulativi con estremo superiore incluso (le = "minore o uguale")
+        'app_duration_seconds_bucket{route="/data",le="0.1"} 2',
+        'app_duration_seconds_bucket{route="/data",le="1"} 3',
+        'app_duration_seconds_bucket{route="/data",le="+Inf"} 4',
+        'app_duration_seconds_sum{route="/data"} 3.65',
+        'app_duration_seconds_count{route="/data"} 4',
+        "# HELP app_memory_bytes Memoria",
+        "# TYPE app_memory_bytes gauge",
+        'app_memory_bytes{dataset="a\\"b"} 1536',
+    ]) + "\n"
+
+def test_labels_and_names_are_validated():
+    registry = MetricsRegistry()
+    requests = registry.counter("app_requests_total", "Richieste", ["route"])
+
+    with pytest.raises(ValueError):
+        requests.inc(path="/data")
+    with pytest.raises(ValueError):
+        registry.counter("app_requests_total", "Di nuovo")
+
+def test_nested_stages_record_exclusive_time(monkeypatch):
+    clock = iter([0.0, 1.0, 3.0, 4.0])
+    monkeypatch.setattr("app.services.metrics.time.perf_counter", lambda: next(clock))
+    timer = StageTimer("test")
+
+    # La lettura (1s -> 3s) avviene dentro la pulizia (0s -> 4s): la pulizia conta solo 2s
+    with timer.stage("clean"):
+        with timer.stage("read"):
+            pass
+
+    assert timer.seconds == {"read": 2.0, "clean": 2.0}
+
+def test_iterate_attributes_production_time_to_the_stage(monkeypatch):
+    ticks = iter(range(100))
+    monkeypatch.setattr("app.services.metrics.time.perf_counter", lambda: float(next(ticks)))
+    timer = StageTimer("test")
+
+    items = list(timer.iterate(iter("ab"), "read"))
+
+    # Tre chiamate a next (due elementi e la fine), un secondo ciascuna
+    assert items == ["a", "b"]
+    assert timer.seconds == {"read": 3.0}
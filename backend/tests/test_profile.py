@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.ingestion import compact_dataframe, concat_rows
+from app.services.profile import build_profile, hll_registers, merge_profiles
+
+
+def _statement(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "divisa": ["EUR"] * rows,
+        "importo": rng.normal(0, 100, rows).round(2),
+        "conto": rng.integers(0, 50, rows).astype(np.int64),
+    })
+
+
+def _append_all(parts):
+    """Profilo unito parte per parte, come nelle aggiunte successive a un dataset"""
+    data, _ = compact_dataframe(parts[0].copy(), 0.5)
+    profile = build_profile(data, 1000000)
+    registers = {col: hll_registers(data[col]) for col in data.columns}
+    for part in parts[1:]:
+        n_old = len(data)
+        data = concat_rows([data, part])
+        new_rows = data.iloc[n_old:]
+        registers = {col: np.maximum(regs, hll_registers(new_rows[col])) for col, regs in registers.items()}
+        profile = merge_profiles(profile, build_profile(new_rows, 1000000), data, registers)
+    return data, profile
+
+
+def test_merged_distinct_count_does_not_sum_parts():
+    parts = [_statement(200, seed) for seed in range(12)]
+    data, profile = _append_all(parts)
+
+    assert profile["columns"]["divisa"]["unique_count"] == 1
+    assert profile["columns"]["divisa"]["unique_percentage"] == round(100 / len(data), 2)
+    assert profile["columns"]["conto"]["unique_count"] == data["conto"].nunique()
+
+
+def test_merged_median_and_quantiles_match_full_column():
+    # Seconda parte spostata verso l'alto: la mediana unita non è la media delle due mediane
+    shifted = _statement(500, 2)
+    shifted["importo"] += 1000
+    parts = [_statement(500, 1), shifted]
+    data, profile = _append_all(parts)
+
+    importo = profile["columns"]["importo"]
+    values = data["importo"].to_numpy(dtype=np.float64)
+    assert importo["median"] == pytest.approx(np.median(values))
+    assert importo["quantiles"]["p95"] == pytest.approx(np.quantile(values, 0.95))
+    assert importo["quantiles_approximate"] is False
+    assert importo["mean"] == pytest.approx(values.mean())
+    assert importo["std"] == pytest.approx(data["importo"].std())
+
+
+def test_registers_ignore_compact_representation():
+    values = pd.Series(["EUR", "USD", "EUR"])
+    assert (hll_registers(values) == hll_registers(values.astype("category"))).all()
+    numbers = pd.Series([1, 2, 3], dtype=np.int8)
+    assert (hll_registers(numbers) == hll_registers(numbers.astype(np.int64))).all()
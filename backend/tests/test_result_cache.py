@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from app.services.result_cache import ResultCache
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.services.result_cache.time.monotonic", lambda: now[0])
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=1024)
+    cache.put(("a", 0, "q"), np.arange(4))
+
+    now[0] += 59
+    np.testing.assert_array_equal(cache.get(("a", 0, "q")), np.arange(4))
+    now[0] += 2
+    assert cache.get(("a", 0, "q")) is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entries_are_evicted_by_bytes():
+    # Tre vettori da 400 byte in un limite di 1000: il meno usato di recente esce
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=1000)
+    cache.put(("a", 0, 1), np.zeros(50))
+    cache.put(("a", 0, 2), np.zeros(50))
+    cache.get(("a", 0, 1))
+    cache.put(("a", 0, 3), np.zeros(50))
+
+    assert cache.get(("a", 0, 2)) is None
+    assert cache.get(("a", 0, 1)) is not None
+    assert cache.get(("a", 0, 3)) is not None
+    assert cache.evictions == 1
+    assert cache._bytes == 800
+
+def test_values_larger_than_the_cap_are_not_cached():
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=1000)
+    cache.put(("a", 0, 1), np.zeros(10))
+    cache.put(("a", 0, 2), pd.DataFrame({"x": np.zeros(200)}))
+
+    assert cache.get(("a", 0, 2)) is None
+    assert cache.get(("a", 0, 1)) is not None
+    assert cache.evictions == 0
+
+def test_entry_limit_evicts_oldest():
+    cache = ResultCache(ttl=60, max_entries=2, max_bytes=10_000)
+    for i in range(3):
+        cache.put(("a", 0, i), np.zeros(1))
+
+    assert cache.get(("a", 0, 0)) is None
+    assert cache.stats()["entries"] == 2
+
+def test_invalidate_one_dataset_or_all():
+    cache = ResultCache(ttl=60, max_entries=10, max_bytes=10_000)
+    cache.put(("a", 0, 1), np.zeros(10))
+    cache.put(("a", 1, 1), np.zeros(10))
+    cache.put(("b", 0, 1), np.zeros(10))
+
+    cache.invalidate("a")
+    assert cache.get(("a", 0, 1)) is None and cache.get(("a", 1, 1)) is None
+    assert cache.get(("b", 0, 1)) is not None
+    assert cache._bytes == 80
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
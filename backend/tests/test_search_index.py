@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.ingestion import concat_rows
+from app.services.search_index import MAX_TOKEN_SEGMENTS, SearchIndex
+
+QUERIES = ["po", "-", "1.2", "bonifico", "rif. 63", "e", "città", "2024-01", "nan", "zzzz", "ACEA ATO2"]
+
+
+def _reference(df: pd.DataFrame, query: str, columns=None) -> np.ndarray:
+    """Sottostringa letterale, case-insensitive, riga per riga; i nulli non corrispondono"""
+    mask = np.zeros(len(df), dtype=bool)
+    for col in (columns if columns is not None else df.columns):
+        text = df[col].astype(str).str.lower()
+        mask |= (text.str.contains(query.lower(), regex=False) & df[col].notna()).to_numpy(dtype=bool)
+    return np.flatnonzero(mask)
+
+def _statement(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    descriptions = np.array([
+        "Bonifico a favore di ACEA ATO2 rif. 633486", "Pagamento POS città di Roma",
+        "Prelievo ATM - sportello 12", "Addebito SDD rif. 6310", "Commissioni e spese", None,
+    ], dtype=object)
+    df = pd.DataFrame({
+        "data": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 60, n), unit="D"),
+        "descrizione": descriptions[rng.integers(0, len(descriptions), n)],
+        "importo": np.round(rng.normal(0, 100, n), 2),
+        "divisa": pd.Categorical(rng.choice(["EUR", "USD"], n)),
+    })
+    df.loc[rng.choice(n, n // 10, replace=False), "importo"] = np.nan
+    return df
+
+@pytest.fixture
+def statement() -> pd.DataFrame:
+    return _statement(400, 3)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_substring_reference(statement, query):
+    np.testing.assert_array_equal(SearchIndex(statement).search(query), _reference(statement, query))
+
+def test_search_restricted_to_columns(statement):
+    index = SearchIndex(statement)
+
+    np.testing.assert_array_equal(
+        index.search("eur", ["descrizione"]), _reference(statement, "eur", ["descrizione"])
+    )
+    np.testing.assert_array_equal(index.search("eur", ["divisa"]), _reference(statement, "eur", ["divisa"]))
+
+def test_empty_query_returns_all_rows(statement):
+    np.testing.assert_array_equal(SearchIndex(statement).search(""), np.arange(len(statement)))
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_extended_index_matches_rebuild(query):
+    # Le categorie unite cambiano i codici delle categorical: il segmento va ricostruito
+    frames = [_statement(150, 5)]
+    index = SearchIndex(frames[0])
+    for seed in range(MAX_TOKEN_SEGMENTS + 1):
+        appended = _statement(30, 100 + seed)
+        appended["divisa"] = pd.Categorical(np.where(appended["divisa"] == "EUR", "CHF", "GBP"))
+        data = concat_rows(frames + [appended])
+        frames = [data]
+        index = index.extended(data)
+
+    np.testing.assert_array_equal(index.search(query), SearchIndex(data).search(query))
+    np.testing.assert_array_equal(index.search(query), _reference(data, query))
+
+def test_memory_usage_counts_distinct_values_not_rows():
+    small, large = _statement(1_000, 1), _statement(20_000, 1)
+
+    # Il testo e i token dipendono dai valori distinti; per riga restano i soli codici interi
+    assert SearchIndex(large).memory_usage() < 20 * SearchIndex(small).memory_usage()
+    assert SearchIndex(large).memory_usage() < large.memory_usage(deep=True).sum()
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.models.data_models import DataFilter
+from app.services.serializers import ARROW_METADATA_KEY, to_arrow_ipc, to_columnar_json
+
+
+@pytest.fixture
+def page():
+    page_data = pd.DataFrame({
+        "data": pd.to_datetime(["2024-03-01 00:00", "2024-03-02 10:30", None]).as_unit("us"),
+        "descrizione": pd.Categorical(["Bonifico \"città\"", None, "POS"]),
+        "importo": [1.5, np.nan, -2.25],
+        "codice": np.array([1, 2, 3], dtype=np.int16),
+    })
+    meta = {
+        "total_rows": 3, "total_pages": 1, "current_page": 1, "page_size": 100,
+        "columns": page_data.columns.tolist(),
+        "filters_applied": DataFilter(search="città", date_from=pd.Timestamp("2024-03-01").to_pydatetime()),
+    }
+    return page_data, meta
+
+def test_columnar_json_round_trip(page):
+    page_data, meta = page
+
+    payload = json.loads(to_columnar_json(page_data, meta))
+
+    assert payload["layout"] == "columnar"
+    assert payload["total_rows"] == 3
+    assert payload["filters_applied"]["search"] == "città"
+    assert payload["filters_applied"]["date_from"].startswith("2024-03-01")
+    assert payload["data"] == {
+        "data": ["2024-03-01T00:00:00.000", "2024-03-02T10:30:00.000", None],
+        "descrizione": ["Bonifico \"città\"", None, "POS"],
+        "importo": [1.5, None, -2.25],
+        "codice": [1, 2, 3],
+    }
+
+def test_arrow_stream_round_trip(page):
+    page_data, meta = page
+
+    table = pa.ipc.open_stream(to_arrow_ipc(page_data, meta)).read_all()
+
+    assert table.column_names == page_data.columns.tolist()
+    assert table.column("codice").type == pa.int16()
+    assert table.column("importo").to_pylist() == [1.5, None, -2.25]
+    assert table.column("descrizione").to_pylist() == ["Bonifico \"città\"", None, "POS"]
+    pagination = json.loads(table.schema.metadata[ARROW_METADATA_KEY])
+    assert pagination["columns"] == page_data.columns.tolist()
+    assert pagination["filters_applied"]["search"] == "città"
+    pd.testing.assert_series_equal(
+        table.to_pandas()["data"], page_data["data"], check_dtype=False
+    )
@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+
+from app.services.ingestion import concat_rows
+from app.services.snapshot_store import SnapshotStore
+
+
+def _rows(start: int, count: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "data": pd.date_range("2024-01-01", periods=count, freq="D") + pd.Timedelta(days=start),
+        "descrizione": [f"movimento {i}" for i in range(start, start + count)],
+        "importo": [float(i) for i in range(start, start + count)],
+    })
+
+def _files(folder) -> set:
+    return {name for name in os.listdir(folder) if name.endswith((".arrow", ".pkl"))}
+
+def test_append_writes_only_a_new_segment(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.save("estratto", _rows(0, 5))
+    full = _rows(0, 5)
+    for start in (5, 8):
+        new_rows = _rows(start, 3)
+        full = concat_rows([full, new_rows])
+        entry = store.append("estratto", new_rows, full)
+
+    assert entry["segments"] == ["estratto.1.arrow", "estratto.2.arrow"]
+    assert entry["total_rows"] == 11
+    assert _files(tmp_path) == {"estratto.arrow", "estratto.1.arrow", "estratto.2.arrow"}
+    assert entry["size_bytes"] == sum(os.path.getsize(tmp_path / name) for name in _files(tmp_path))
+    pd.testing.assert_frame_equal(store.load("estratto"), full)
+
+def test_segments_survive_restart(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.save("estratto", _rows(0, 4))
+    store.append("estratto", _rows(4, 2), _rows(0, 6))
+
+    restarted = SnapshotStore(str(tmp_path))
+
+    assert restarted.get_entry("estratto")["segments"] == ["estratto.1.arrow"]
+    pd.testing.assert_frame_equal(restarted.load("estratto"), _rows(0, 6))
+
+def test_save_replaces_base_and_segments(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.save("estratto", _rows(0, 4))
+    store.append("estratto", _rows(4, 2), _rows(0, 6))
+
+    entry = store.save("estratto", _rows(100, 3))
+
+    assert "segments" not in entry
+    assert _files(tmp_path) == {"estratto.arrow"}
+    pd.testing.assert_frame_equal(store.load("estratto"), _rows(100, 3))
+
+def test_append_to_pickle_snapshot_rewrites_it(tmp_path):
+    # Colonna object con tipi misti: non rappresentabile in Arrow
+    mixed = pd.DataFrame({"riferimento": pd.Series([1, "a", 2.5], dtype=object)})
+    full = concat_rows([mixed, mixed])
+    store = SnapshotStore(str(tmp_path))
+    assert store.save("misto", mixed)["format"] == "pickle"
+
+    entry = store.append("misto", mixed, full)
+
+    assert entry["format"] == "pickle" and "segments" not in entry
+    assert entry["total_rows"] == 6
+    pd.testing.assert_frame_equal(store.load("misto"), full)
+
+def test_remove_deletes_segments(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.save("estratto", _rows(0, 4))
+    store.append("estratto", _rows(4, 2), _rows(0, 6))
+
+    store.remove("estratto")
+
+    assert _files(tmp_path) == set()
+    assert SnapshotStore(str(tmp_path)).entries() == []
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.sort_index import DateIndex, PrefixSumIndex, SortPermutation
+
+
+def _reference(series: pd.Series, ascending: bool) -> np.ndarray:
+    """ORDER BY col IS NULL, col [DESC], rowid"""
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    keys = np.where(np.isnan(values), 0.0, values if ascending else -values)
+    return np.lexsort((np.arange(len(values)), keys, np.isnan(values)))
+
+@pytest.fixture
+def amounts() -> pd.Series:
+    rng = np.random.default_rng(7)
+    values = rng.integers(-20, 20, size=500).astype(float)
+    values[rng.choice(500, 40, replace=False)] = np.nan
+    return pd.Series(values)
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_permutation_is_stable_with_nulls_last(amounts, ascending):
+    permutation = SortPermutation(amounts)
+
+    np.testing.assert_array_equal(permutation.permutation(ascending), _reference(amounts, ascending))
+
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("k", [10, 300])
+def test_sort_rows_matches_full_permutation(amounts, ascending, k):
+    # k piccolo: ordinamento dei soli id riga per gruppo; k grande: filtro della permutazione
+    permutation = SortPermutation(amounts)
+    rows = np.sort(np.random.default_rng(k).choice(len(amounts), k, replace=False))
+
+    reference = _reference(amounts, ascending)
+    expected = reference[np.isin(reference, rows)]
+    np.testing.assert_array_equal(permutation.sort_rows(rows, ascending), expected)
+
+@pytest.fixture
+def dates() -> pd.Series:
+    rng = np.random.default_rng(11)
+    days = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 60, size=400), unit="D")
+    series = pd.Series(days)
+    series.iloc[rng.choice(400, 25, replace=False)] = pd.NaT
+    return series
+
+def test_date_index_range_matches_mask(dates):
+    index = DateIndex(dates, SortPermutation(dates))
+    date_from, date_to = pd.Timestamp("2024-01-10"), pd.Timestamp("2024-02-05")
+
+    expected = np.flatnonzero(((dates >= date_from) & (dates <= date_to)).to_numpy())
+    np.testing.assert_array_equal(index.range_rows(date_from, date_to), expected)
+    np.testing.assert_array_equal(index.range_rows(date_to=date_to), np.flatnonzero((dates <= date_to).to_numpy()))
+
+    rows = np.arange(0, len(dates), 3)
+    np.testing.assert_array_equal(index.filter_rows(rows, date_from, date_to), np.intersect1d(rows, expected))
+
+def test_prefix_sums_match_pandas(dates):
+    amounts = pd.Series(np.random.default_rng(5).normal(0, 100, len(dates)).round(2))
+    amounts.iloc[::17] = np.nan
+    sums = PrefixSumIndex(DateIndex(dates, SortPermutation(dates)), amounts)
+    date_from, date_to = pd.Timestamp("2024-01-15"), pd.Timestamp("2024-02-10")
+
+    in_range = amounts[(dates >= date_from) & (dates <= date_to)]
+    totals = sums.range_totals(date_from, date_to)
+    assert totals["total"] == pytest.approx(in_range.sum())
+    assert totals["credits"] == pytest.approx(in_range[in_range > 0].sum())
+    assert totals["debits"] == pytest.approx(in_range[in_range < 0].sum())
+    assert totals["count"] == in_range.notna().sum()
+    assert sums.balance_at(date_to) == pytest.approx(amounts[dates <= date_to].sum())
+
+    # Saldo progressivo: somma fino alla riga nell'ordine stabile per data; NaN senza data
+    order = SortPermutation(dates).ascending
+    expected = np.full(len(dates), np.nan)
+    expected[order] = np.cumsum(amounts.fillna(0).to_numpy()[order])
+    np.testing.assert_allclose(sums.running_balance(np.arange(len(dates))), expected)
+
+def test_extended_permutation_matches_rebuild():
+    old = pd.Series([3.0, 1.0, np.nan, 3.0, 2.0])
+    full = pd.concat([old, pd.Series([3.0, np.nan, 5.0, 4.0, 3.0])], ignore_index=True)
+
+    extended = SortPermutation(old).extended(full)
+    rebuilt = SortPermutation(full)
+
+    assert extended is not None
+    for ascending in (True, False):
+        np.testing.assert_array_equal(extended.permutation(ascending), rebuilt.permutation(ascending))
+    np.testing.assert_array_equal(extended.sort_rows(np.array([0, 5, 7, 9]), False),
+                                  rebuilt.sort_rows(np.array([0, 5, 7, 9]), False))
+
+def test_extended_permutation_rejects_earlier_values():
+    old = pd.Series([3.0, 1.0, 2.0])
+    full = pd.concat([old, pd.Series([4.0, 2.5])], ignore_index=True)
+
+    assert SortPermutation(old).extended(full) is None
+
+def test_date_index_and_prefix_sums_extend_like_rebuild(dates):
+    rng = np.random.default_rng(3)
+    old_dates, old_amounts = dates, pd.Series(rng.normal(0, 100, len(dates)).round(2))
+    new_dates = pd.Series(pd.Timestamp("2024-03-01") + pd.to_timedelta(rng.integers(0, 30, 100), unit="D"))
+    full_dates = pd.concat([old_dates, new_dates], ignore_index=True)
+    full_amounts = pd.concat([old_amounts, pd.Series(rng.normal(0, 100, 100).round(2))], ignore_index=True)
+
+    old_permutation = SortPermutation(old_dates)
+    old_index = DateIndex(old_dates, old_permutation)
+    permutation = old_permutation.extended(full_dates)
+    index = old_index.extended(full_dates, permutation)
+    sums = PrefixSumIndex(old_index, old_amounts).extended(index, full_amounts)
+
+    rebuilt_index = DateIndex(full_dates, SortPermutation(full_dates))
+    rebuilt_sums = PrefixSumIndex(rebuilt_index, full_amounts)
+    np.testing.assert_array_equal(index.row_ids, rebuilt_index.row_ids)
+    np.testing.assert_array_equal(index.sorted_values, rebuilt_index.sorted_values)
+    np.testing.assert_allclose(sums.totals, rebuilt_sums.totals)
+    np.testing.assert_array_equal(sums.ranks, rebuilt_sums.ranks)
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_mixed_type_column_sorts_numbers_before_text(ascending):
+    # Colonna Excel con numeri e testo: sort_values solleverebbe TypeError
+    series = pd.Series([12, "AB-1", 3.5, None, "X", 3.5, "AB-1", True], dtype=object)
+    permutation = SortPermutation(series)
+
+    # Numeri, testo, altri valori come testo; gruppi invertiti in ordine decrescente, nulli in fondo
+    groups = [[2, 5], [0], [1, 6], [4], [7]]
+    expected = [row for group in (groups if ascending else groups[::-1]) for row in group] + [3]
+    np.testing.assert_array_equal(permutation.permutation(ascending), expected)
+    np.testing.assert_array_equal(
+        permutation.sort_rows(np.array([0, 1, 4]), ascending), [0, 1, 4] if ascending else [4, 1, 0]
+    )
+
+def test_extending_mixed_type_column_recomputes():
+    series = pd.Series([12, "AB-1", 3.5], dtype=object)
+    permutation = SortPermutation(series)
+
+    assert permutation.extended(pd.concat([series, pd.Series([20])], ignore_index=True)) is None
@@ -62,8 +62,8 @@ function App() {
 
   // Query per i dati
   const { data: dataResponse, isLoading: dataLoading, error: dataError, refetch: refetchData } = useQuery(
-    ['data', filters],
-    () => apiService.getData(filters),
+    ['data', currentData?.file_id, filters],
+    () => apiService.getData({ ...filters, fileId: currentData?.file_id }),
     {
       enabled: !!currentData,
       keepPreviousData: true,
@@ -73,8 +73,8 @@ function App() {
 
   // Query per le statistiche
   const { data: stats, isLoading: statsLoading } = useQuery(
-    ['stats'],
-    apiService.getDataStats,
+    ['stats', currentData?.file_id],
+    () => apiService.getDataStats(currentData?.file_id),
     {
       enabled: !!currentData,
       refetchInterval: 60000, // Aggiorna ogni minuto
@@ -122,7 +122,7 @@ function App() {
   // Gestione export
   const handleExport = async (format) => {
     try {
-      await apiService.exportData(filters, format);
+      await apiService.exportData({ ...filters, fileId: currentData?.file_id }, format);
       toast.success(`Export completato in formato ${format.toUpperCase()}`);
     } catch (error) {
       toast.error(`Errore nell'export: ${error.message}`);
@@ -132,7 +132,7 @@ function App() {
   // Gestione pulizia dati
   const handleClearData = async () => {
     try {
-      await apiService.clearData();
+      await apiService.clearData(currentData?.file_id);
       setCurrentData(null);
       setFilters(prev => ({ ...prev, page: 1 }));
       toast.success('Dati puliti con successo');
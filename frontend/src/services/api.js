@@ -34,19 +34,52 @@ api.interceptors.response.use(
 
 // Servizi API
 export const apiService = {
-  // Upload file
-  uploadFile: async (file, fileType = null) => {
+  // Upload file: ingestione in background con polling dello stato del job
+  // options.dedupAgainst: file_id con cui confrontare le righe, options.dedupMode: 'drop' | 'flag',
+  // options.appendTo: file_id del dataset a cui accodare le righe
+  uploadFile: async (file, fileType = null, onProgress = null, options = {}) => {
     const formData = new FormData();
     formData.append('file', file);
     if (fileType) {
       formData.append('file_type', fileType);
     }
+    if (options.dedupAgainst) {
+      formData.append('dedup_against', options.dedupAgainst);
+      if (options.dedupMode) formData.append('dedup_mode', options.dedupMode);
+    }
+    if (options.appendTo) {
+      formData.append('append_to', options.appendTo);
+    }
     
-    const response = await api.post('/upload', formData, {
+    const response = await api.post('/upload/jobs', formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
     });
+    
+    let job = response.data;
+    while (['queued', 'running'].includes(job.status)) {
+      if (onProgress) onProgress(job);
+      await new Promise((resolve) => setTimeout(resolve, 500));
+      job = (await api.get(`/upload/jobs/${job.job_id}`)).data;
+    }
+    if (onProgress) onProgress(job);
+    
+    if (job.status !== 'completed') {
+      throw new Error(job.error || 'Caricamento annullato');
+    }
+    return job.result;
+  },
+
+  // Stato di un job di caricamento
+  getUploadJob: async (jobId) => {
+    const response = await api.get(`/upload/jobs/${jobId}`);
+    return response.data;
+  },
+
+  // Annullamento di un job di caricamento
+  cancelUploadJob: async (jobId) => {
+    const response = await api.delete(`/upload/jobs/${jobId}`);
     return response.data;
   },
 
@@ -57,31 +90,79 @@ export const apiService = {
     if (filters.search) params.append('search', filters.search);
     if (filters.dateFrom) params.append('date_from', filters.dateFrom);
     if (filters.dateTo) params.append('date_to', filters.dateTo);
+    if (filters.dateColumn) params.append('date_column', filters.dateColumn);
     if (filters.columns) params.append('columns', filters.columns.join(','));
+    if (filters.searchColumnsOnly) params.append('search_columns_only', 'true');
+    if (filters.runningBalance) params.append('running_balance', 'true');
+    if (filters.balanceColumn) params.append('balance_column', filters.balanceColumn);
     if (filters.page) params.append('page', filters.page);
     if (filters.pageSize) params.append('page_size', filters.pageSize);
     if (filters.sortBy) params.append('sort_by', filters.sortBy);
     if (filters.sortOrder) params.append('sort_order', filters.sortOrder);
+    if (filters.fileId) params.append('file_id', filters.fileId);
     
     const response = await api.get(`/data?${params.toString()}`);
     return response.data;
   },
 
+  // Totali raggruppati (es. groupBy: ['month:data_operazione'], measures: ['sum:importo'])
+  getAggregate: async (groupBy, measures = [], filters = {}) => {
+    const params = new URLSearchParams();
+    
+    params.append('group_by', groupBy.join(','));
+    if (measures.length) params.append('measures', measures.join(','));
+    if (filters.splitSign) params.append('split_sign', 'true');
+    if (filters.search) params.append('search', filters.search);
+    if (filters.dateFrom) params.append('date_from', filters.dateFrom);
+    if (filters.dateTo) params.append('date_to', filters.dateTo);
+    if (filters.dateColumn) params.append('date_column', filters.dateColumn);
+    if (filters.columns) params.append('columns', filters.columns.join(','));
+    if (filters.searchColumnsOnly) params.append('search_columns_only', 'true');
+    if (filters.sortBy) params.append('sort_by', filters.sortBy);
+    if (filters.sortOrder) params.append('sort_order', filters.sortOrder);
+    if (filters.limit) params.append('limit', filters.limit);
+    if (filters.fileId) params.append('file_id', filters.fileId);
+    
+    const response = await api.get(`/data/aggregate?${params.toString()}`);
+    return response.data;
+  },
+
+  // Saldo alla data e totali per intervallo (es. { dateTo: '2024-03-31' })
+  getBalance: async (options = {}) => {
+    const params = {};
+    
+    if (options.dateFrom) params.date_from = options.dateFrom;
+    if (options.dateTo) params.date_to = options.dateTo;
+    if (options.dateColumn) params.date_column = options.dateColumn;
+    if (options.amountColumn) params.amount_column = options.amountColumn;
+    if (options.openingBalance) params.opening_balance = options.openingBalance;
+    if (options.fileId) params.file_id = options.fileId;
+    
+    const response = await api.get('/data/balance', { params });
+    return response.data;
+  },
+
   // Statistiche dati
-  getDataStats: async () => {
-    const response = await api.get('/data/stats');
+  getDataStats: async (fileId = null) => {
+    const response = await api.get('/data/stats', {
+      params: fileId ? { file_id: fileId } : {},
+    });
     return response.data;
   },
 
   // Informazioni colonne
-  getColumns: async () => {
-    const response = await api.get('/columns');
+  getColumns: async (fileId = null) => {
+    const response = await api.get('/columns', {
+      params: fileId ? { file_id: fileId } : {},
+    });
     return response.data;
   },
 
   // Dettagli colonna specifica
-  getColumnDetails: async (columnName) => {
-    const response = await api.get(`/columns/${columnName}`);
+  getColumnDetails: async (columnName, fileId = null) => {
+    const response = await api.get(`/columns/${columnName}`, {
+      params: fileId ? { file_id: fileId } : {},
+    });
     return response.data;
   },
 
@@ -92,7 +173,10 @@ export const apiService = {
     if (filters.search) params.append('search', filters.search);
     if (filters.dateFrom) params.append('date_from', filters.dateFrom);
     if (filters.dateTo) params.append('date_to', filters.dateTo);
+    if (filters.dateColumn) params.append('date_column', filters.dateColumn);
     if (filters.columns) params.append('columns', filters.columns.join(','));
+    if (filters.searchColumnsOnly) params.append('search_columns_only', 'true');
+    if (filters.fileId) params.append('file_id', filters.fileId);
     params.append('format', format);
     
     const response = await api.get(`/export?${params.toString()}`, {
@@ -119,15 +203,26 @@ export const apiService = {
     if (filters.search) params.append('search', filters.search);
     if (filters.dateFrom) params.append('date_from', filters.dateFrom);
     if (filters.dateTo) params.append('date_to', filters.dateTo);
+    if (filters.dateColumn) params.append('date_column', filters.dateColumn);
     if (filters.columns) params.append('columns', filters.columns.join(','));
+    if (filters.searchColumnsOnly) params.append('search_columns_only', 'true');
+    if (filters.fileId) params.append('file_id', filters.fileId);
     
     const response = await api.get(`/export/preview?${params.toString()}`);
     return response.data;
   },
 
   // Pulizia dati
-  clearData: async () => {
-    const response = await api.delete('/upload');
+  clearData: async (fileId = null) => {
+    const response = await api.delete('/upload', {
+      params: fileId ? { file_id: fileId } : {},
+    });
+    return response.data;
+  },
+
+  // Elenco dataset caricati
+  getDatasets: async () => {
+    const response = await api.get('/datasets');
     return response.data;
   },
 